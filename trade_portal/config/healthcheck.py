@@ -3,14 +3,18 @@ from django.core.cache import cache
 from django.http import JsonResponse
 from django.views import View
 
+from trade_portal.oa_verify import health
+
 
 class HealthcheckView(View):
     def get(self, request):
+        oa_verify_health = health.get_health()
         data = {
             "status": "ok",
             "BUILD_REFERENCE": settings.BUILD_REFERENCE,
             "CONFIGURATION_REFERENCE": settings.CONFIGURATION_REFERENCE,
             "APP_REFERENCE": settings.APP_REFERENCE,
             "canary_task": cache.get("canary-task-last-run"),
+            "oa_verify_api": dict(oa_verify_health, state=health.get_breaker_state(oa_verify_health)),
         }
         return JsonResponse(data)
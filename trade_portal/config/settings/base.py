@@ -210,6 +210,14 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'trade_portal.documents.tasks.canary_task',
         'schedule': datetime.timedelta(minutes=4),
     },
+    'keep_verify_api_warm': {
+        'task': 'trade_portal.oa_verify.tasks.keep_verify_api_warm',
+        'schedule': datetime.timedelta(minutes=1),
+    },
+    'store_incoming_messages_batch': {
+        'task': 'trade_portal.websub_receiver.tasks.store_incoming_messages_batch',
+        'schedule': datetime.timedelta(minutes=1),
+    },
 }
 
 
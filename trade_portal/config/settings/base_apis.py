@@ -46,6 +46,19 @@ else:
     )
 
 
+# Connection to the IGL APIs: seconds to connect and to wait for the response,
+# and retries of the failed requests (with the increasing delays)
+IGL_CONNECT_TIMEOUT = env.float("IGL_CONNECT_TIMEOUT", default=5)
+IGL_READ_TIMEOUT = env.float("IGL_READ_TIMEOUT", default=30)
+IGL_RETRIES = env.int("IGL_RETRIES", default=3)
+# requests in flight for the async client (many independent calls)
+IGL_ASYNC_CONCURRENCY = env.int("IGL_ASYNC_CONCURRENCY", default=10)
+# the incoming messages notifications are collected for this many seconds (0 to disable)
+# and stored by batches of up to INCOMING_MESSAGES_BATCH_SIZE
+INCOMING_MESSAGES_BATCH_WINDOW = env.int("INCOMING_MESSAGES_BATCH_WINDOW", default=2)
+INCOMING_MESSAGES_BATCH_SIZE = env.int("INCOMING_MESSAGES_BATCH_SIZE", default=200)
+
+
 ABR_UUID = env("ABR_UUID", default=None) or None
 
 
@@ -58,6 +71,8 @@ OA_NOTARY_DOMAIN = env("OA_NOTARY_DOMAIN")
 # Either local or remote setup which is able to wrap documents
 # (the API providing /wrap and /unwrap endpoints)
 OA_WRAP_API_URL = env("OA_WRAP_API_URL")
+# "native" to wrap OA documents in-process, "api" to use the OA_WRAP_API_URL instead
+OA_WRAP_MODE = env("OA_WRAP_MODE", default="native")
 
 # ## Variables needed for notarisastion step, which relies on buckets/queues
 # ## may be replaced by other mechanisms once they are defined
@@ -80,6 +95,28 @@ if OA_VERIFY_API_URL:
     ) or None
 else:
     OA_VERIFY_API_HEALTHCHECK_URL = None
+# The verify API is pinged in background (keep_verify_api_warm task); after this many failed
+# calls in a row the verification fails fast for the reset timeout (seconds)
+OA_VERIFY_BREAKER_FAILURES = env.int("OA_VERIFY_BREAKER_FAILURES", default=3)
+OA_VERIFY_BREAKER_RESET_TIMEOUT = env.int("OA_VERIFY_BREAKER_RESET_TIMEOUT", default=30)
+# "native" to verify OA v2 documents in-process (the hash, document store status using OA_VERIFY_RPC_URL
+# and DNS-TXT identity), "api" to use the OA_VERIFY_API_URL instead; the API is still used
+# for the documents not supported natively (token registries, DIDs) if configured
+OA_VERIFY_MODE = env("OA_VERIFY_MODE", default="api")
+# Ethereum JSON-RPC endpoint of the network the document stores are deployed to
+OA_VERIFY_RPC_URL = env("OA_VERIFY_RPC_URL", default="") or None
+# DNS-over-HTTPS resolver (JSON API) for the DNS-TXT identity proofs
+OA_VERIFY_DNS_RESOLVER_URL = env("OA_VERIFY_DNS_RESOLVER_URL", default="https://dns.google/resolve")
+# Valid verification results are reused for the same wrapped document (merkleRoot and targetHash)
+# for OA_VERIFY_STATUS_CACHE_TIMEOUT seconds; in the native mode they are kept OA_VERIFY_CACHE_TIMEOUT
+# seconds and only the document store status is re-checked after the shorter one. 0 to verify every time
+OA_VERIFY_CACHE_TIMEOUT = env.int("OA_VERIFY_CACHE_TIMEOUT", default=3600 * 24)
+OA_VERIFY_STATUS_CACHE_TIMEOUT = env.int("OA_VERIFY_STATUS_CACHE_TIMEOUT", default=60 * 10)
+# Resolved (redirects followed) renderer template URLs
+OA_TEMPLATE_URL_CACHE_TIMEOUT = env.int("OA_TEMPLATE_URL_CACHE_TIMEOUT", default=3600 * 24)
+# Processes decoding QR codes of the PDF files uploaded for verification, shared by the web worker
+# threads; 0 to decode in the request thread
+PDF_QR_EXTRACTION_PROCESSES = env.int("PDF_QR_EXTRACTION_PROCESSES", default=2)
 
 # ## Universal actions QR code parameters
 
@@ -88,6 +125,8 @@ else:
 UA_BASE_HOST = env("UA_BASE_HOST")
 # Renderer we use by default; The host with protocol without trailing slash
 OA_RENDERER_HOST = env("OA_RENDERER_HOST")
+# Size of the single QR code module (box): pixels for PNG and tenths of mm for SVG QR codes
+QR_CODE_BOX_SIZE = env.int("QR_CODE_BOX_SIZE", default=10)
 
 
 IPINFO_KEY = env("IPINFO_KEY", default=None) or None
@@ -13,7 +13,8 @@ AWS_S3_ENDPOINT_URL = env(
     default=None
 ) or None
 
-AWS_QUERYSTRING_AUTH = False
+# the files are private, so their URLs are presigned
+AWS_QUERYSTRING_AUTH = True
 _AWS_EXPIRY = 60 * 60 * 24 * 7
 AWS_S3_OBJECT_PARAMETERS = {
     "CacheControl": f"max-age={_AWS_EXPIRY}, s-maxage={_AWS_EXPIRY}, must-revalidate"
@@ -23,3 +24,11 @@ AWS_DEFAULT_ACL = None
 AWS_S3_REGION_NAME = env("DJANGO_AWS_S3_REGION_NAME", default=None)
 
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+# opened files are downloaded whole into a SpooledTemporaryFile, moved to disk past this size
+# (bytes) instead of being kept in memory
+AWS_S3_MAX_MEMORY_SIZE = env.int("DJANGO_AWS_S3_MAX_MEMORY_SIZE", default=5 * 1024 * 1024)
+
+# Document API returns the certificate attachment as a link by default;
+# if set (seconds) then the link redirects to a presigned S3 URL valid for that time,
+# otherwise the file is streamed through the portal
+DOCUMENT_API_ATTACHMENT_URL_EXPIRY = env.int("DOCUMENT_API_ATTACHMENT_URL_EXPIRY", default=0)
@@ -26,3 +26,6 @@ CELERY_TASK_ALWAYS_EAGER = True
 IS_UNITTEST = True
 
 DUMB_ABR_REQUESTS = True
+
+# the cache is shared by the test runs, the tests of the verification cache enable it explicitly
+OA_VERIFY_CACHE_TIMEOUT = 0
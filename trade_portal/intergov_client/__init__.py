@@ -1,13 +1,13 @@
 import logging
 from http import HTTPStatus
 
-import requests
-
 from .auth import BaseAuthClass
+from .transport import MultipartStream, Transport, get_default_transport
 
 logger = logging.getLogger(__name__)
 VERSION = "0.0.3"
 VERSION_API = "20200501"
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
 
 class IntergovClient(object):
@@ -15,7 +15,7 @@ class IntergovClient(object):
     Helper class to perform the intergov API calls easily
     """
 
-    def __init__(self, country: str, endpoints: dict, auth_class: BaseAuthClass):
+    def __init__(self, country: str, endpoints: dict, auth_class: BaseAuthClass, transport: Transport = None):
         """
         Country: 2-letter country code, example: AU, SG, CN
 
@@ -30,6 +30,8 @@ class IntergovClient(object):
 
         auth_class: instance of class implementing the auth.py::BaseAuthClass
         interface
+
+        transport: transport.py::Transport instance, the process-wide default one if not given
         """
         country = str(country)
         if len(country) != 2 or country.upper() != country:
@@ -41,6 +43,7 @@ class IntergovClient(object):
 
         self.auth_class = auth_class
         self.ENDPOINTS = endpoints
+        self.transport = transport or get_default_transport()
 
     def retrieve_message(self, sender_ref: str) -> dict:
         """
@@ -50,8 +53,10 @@ class IntergovClient(object):
             raise Exception("Message API must be configured first")
 
         auth_h_name, auth_h_value, exp = self.auth_class.get_message_auth_header()
-        resp = requests.get(
+        resp = self.transport.request(
+            "GET",
             self.ENDPOINTS["message"] + f"/message/{sender_ref}",
+            "retrieve_message",
             headers={
                 auth_h_name: auth_h_value,
             },
@@ -71,8 +76,10 @@ class IntergovClient(object):
             raise Exception("Message API must be configured first")
 
         auth_h_name, auth_h_value, exp = self.auth_class.get_message_auth_header()
-        resp = requests.post(
+        resp = self.transport.request(
+            "POST",
             self.ENDPOINTS["message"] + "/message",
+            "post_message",
             json=message_json,
             headers={
                 auth_h_name: auth_h_value,
@@ -99,39 +106,37 @@ class IntergovClient(object):
         Accepts str with the document content,
         returns JSON with some document info (at least `multihash` str field)
         """
-        if not isinstance(self.ENDPOINTS.get("document"), str):
-            raise Exception("Document API must be configured first")
-
-        auth_h_name, auth_h_value, exp = self.auth_class.get_document_auth_header()
-        files = {
-            'document': ('document.json', document_body)
-        }
-        resp = requests.post(
-            self.ENDPOINTS["document"] + f"/jurisdictions/{receiver}",
-            files=files,
-            headers={
-                auth_h_name: auth_h_value,
-            },
-        )
-        if resp.status_code != HTTPStatus.OK:
-            # unexpected but we still need to react somehow
-            raise Exception("Unable to post document: %s" % resp.text[:2000])
-        return resp.json()
+        return self._post_document(receiver, document_body)
 
     def post_binary_document(self, receiver: str, document_stream) -> dict:
+        """
+        Accepts bytes or the seekable file-like object, which is streamed to the API
+        (never read to the memory entirely)
+        """
+        return self._post_document(receiver, document_stream)
+
+    def _post_document(self, receiver: str, document) -> dict:
         if not isinstance(self.ENDPOINTS.get("document"), str):
             raise Exception("Document API must be configured first")
 
         auth_h_name, auth_h_value, exp = self.auth_class.get_document_auth_header()
-        files = {
-            'document': ('document.json', document_stream)
+        headers = {
+            auth_h_name: auth_h_value,
         }
-        resp = requests.post(
+        if hasattr(document, "read"):
+            body = MultipartStream({"document": ("document.json", document)})
+            headers["Content-Type"] = body.content_type
+            kwargs = {"data": body}
+        else:
+            kwargs = {"files": {"document": ("document.json", document)}}
+        resp = self.transport.request(
+            "POST",
             self.ENDPOINTS["document"] + f"/jurisdictions/{receiver}",
-            files=files,
-            headers={
-                auth_h_name: auth_h_value,
-            },
+            "post_document",
+            # the documents are content-addressed, posting the same one again is harmless
+            idempotent=True,
+            headers=headers,
+            **kwargs
         )
         if resp.status_code != HTTPStatus.OK:
             # unexpected but we still need to react somehow
@@ -142,28 +147,43 @@ class IntergovClient(object):
         return self.retrieve_document(*args, **kwargs)
 
     def retrieve_document(self, document_multihash: str):
+        return b"".join(self.retrieve_document_stream(document_multihash))
+
+    def retrieve_document_stream(self, document_multihash: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+        """
+        Returns the iterator over the document content chunks, so the big document
+        could be saved somewhere without reading it to the memory.
+        The request is sent (and the errors are raised) before the iterator is returned
+        """
         if not isinstance(self.ENDPOINTS.get("document"), str):
             raise Exception("Document API must be configured first")
 
         auth_h_name, auth_h_value, exp = self.auth_class.get_document_auth_header()
         endpoint = f'{self.ENDPOINTS["document"]}/{document_multihash}'
-        resp = requests.get(
+        resp = self.transport.request(
+            "GET",
             endpoint,
-            {
+            "retrieve_document",
+            params={
                 "as_jurisdiction": str(self.COUNTRY)
             },
             headers={
                 auth_h_name: auth_h_value,
             },
+            stream=True,
         )
-        if resp.status_code == 200:
-            return resp.content
-        else:
+        if resp.status_code != 200:
             try:
                 error = resp.json()
             except Exception:
                 error = resp.content.decode("utf-8")
             raise Exception(f"Unable to retrieve document: {resp.status_code}, {error}")
+        return self._iter_content(resp, chunk_size)
+
+    @staticmethod
+    def _iter_content(resp, chunk_size):
+        with resp:
+            yield from resp.iter_content(chunk_size)
 
     def subscribe(self, predicate=None, topic=None, callback=None) -> bool:
         if not callback:
@@ -172,8 +192,12 @@ class IntergovClient(object):
             raise Exception("Subscription API must be configured first")
 
         auth_h_name, auth_h_value, exp = self.auth_class.get_subscr_auth_header()
-        resp = requests.post(
+        resp = self.transport.request(
+            "POST",
             self.ENDPOINTS["subscription"] + "/subscriptions",
+            "subscribe",
+            # subscribing again just renews the subscription
+            idempotent=True,
             data={
                 'hub.callback': callback,
                 'hub.topic': predicate or topic,
@@ -0,0 +1,288 @@
+"""
+asyncio variant of the IntergovClient for the callers making many independent calls
+(renewing subscriptions, polling the messages statuses, re-processing incoming messages).
+
+Requires httpx, so it's not imported by the package itself. Usage from the sync code:
+
+    async def main():
+        async with AsyncIntergovClient(country, endpoints, auth_class) as client:
+            return await client.retrieve_messages(sender_refs)
+
+    messages = asyncio.run(main())
+"""
+import asyncio
+import logging
+from http import HTTPStatus
+
+import httpx
+
+from . import DOWNLOAD_CHUNK_SIZE
+from .auth import BaseAuthClass
+from .transport import IDEMPOTENT_METHODS, RETRY_STATUSES, get_backoff
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncIntergovClient:
+    """
+    The same methods as IntergovClient has, but coroutines, plus the helpers
+    running many calls with at most `concurrency` requests in flight.
+
+    The auth class is the same (and so is the token shared with the sync clients);
+    it's called in the executor because it may block to retrieve the token.
+    """
+
+    def __init__(
+        self,
+        country: str,
+        endpoints: dict,
+        auth_class: BaseAuthClass,
+        concurrency: int = 10,
+        connect_timeout: float = 5,
+        read_timeout: float = 30,
+        retries: int = 3,
+        backoff_factor: float = 0.3,
+        backoff_max: float = 10,
+    ):
+        country = str(country)
+        if len(country) != 2 or country.upper() != country:
+            raise Exception("Country parameter is invalid")
+        self.COUNTRY = country
+        self.ENDPOINTS = endpoints
+        self.auth_class = auth_class
+        self.concurrency = concurrency
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self._http = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def _get_http(self) -> httpx.AsyncClient:
+        # created on the first call, so it's bound to the running loop
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.concurrency),
+            )
+        return self._http
+
+    async def _get_auth_header(self, get_header) -> dict:
+        loop = asyncio.get_event_loop()
+        auth_h_name, auth_h_value, exp = await loop.run_in_executor(None, get_header)
+        return {auth_h_name: auth_h_value}
+
+    async def _request(
+        self, method: str, url: str, idempotent: bool = None, stream: bool = False, **kwargs
+    ) -> httpx.Response:
+        """
+        The same retries policy as transport.py::Transport has
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            http = self._get_http()
+            try:
+                # the uploaded files are rewinded by httpx
+                resp = await http.send(http.build_request(method, url, **kwargs), stream=stream)
+            except httpx.TransportError as e:
+                # the connection wasn't established, so the request hasn't reached the server
+                is_not_sent = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if attempt >= self.retries or not (idempotent or is_not_sent):
+                    raise
+                logger.warning("%s %s failed (%s), retrying", method, url, e.__class__.__name__)
+            else:
+                if resp.status_code not in RETRY_STATUSES or not idempotent or attempt >= self.retries:
+                    return resp
+                await resp.aclose()
+                logger.warning("%s %s responded %s, retrying", method, url, resp.status_code)
+            await asyncio.sleep(get_backoff(attempt, self.backoff_factor, self.backoff_max))
+            attempt += 1
+
+    async def retrieve_message(self, sender_ref: str) -> dict:
+        if not isinstance(self.ENDPOINTS.get("message"), str):
+            raise Exception("Message API must be configured first")
+
+        resp = await self._request(
+            "GET",
+            self.ENDPOINTS["message"] + f"/message/{sender_ref}",
+            headers=await self._get_auth_header(self.auth_class.get_message_auth_header),
+        )
+        if not str(resp.status_code).startswith("2"):
+            logger.warning("Non-2xx response for message retrieval; %s", resp.content)
+            return None
+        return resp.json()
+
+    async def post_message(self, message_json: dict) -> dict:
+        if not isinstance(self.ENDPOINTS.get("message"), str):
+            raise Exception("Message API must be configured first")
+
+        resp = await self._request(
+            "POST",
+            self.ENDPOINTS["message"] + "/message",
+            json=message_json,
+            headers=await self._get_auth_header(self.auth_class.get_message_auth_header),
+        )
+        if resp.status_code != HTTPStatus.CREATED:
+            short_text = resp.text[:2000]
+            logger.error("Unable to publish message: %s %s", resp.status_code, short_text)
+            raise Exception("url: {}, resp: {}".format(self.ENDPOINTS["message"], short_text))
+        return resp.json()
+
+    async def post_text_document(self, receiver: str, document_body) -> dict:
+        return await self._post_document(receiver, document_body)
+
+    async def post_binary_document(self, receiver: str, document_stream) -> dict:
+        return await self._post_document(receiver, document_stream)
+
+    async def _post_document(self, receiver: str, document) -> dict:
+        if not isinstance(self.ENDPOINTS.get("document"), str):
+            raise Exception("Document API must be configured first")
+
+        resp = await self._request(
+            "POST",
+            self.ENDPOINTS["document"] + f"/jurisdictions/{receiver}",
+            # the documents are content-addressed, posting the same one again is harmless
+            idempotent=not hasattr(document, "read") or hasattr(document, "seek"),
+            files={"document": ("document.json", document)},
+            headers=await self._get_auth_header(self.auth_class.get_document_auth_header),
+        )
+        if resp.status_code != HTTPStatus.OK:
+            raise Exception("Unable to post document: %s" % resp.text[:2000])
+        return resp.json()
+
+    async def retrieve_text_document(self, *args, **kwargs):
+        return await self.retrieve_document(*args, **kwargs)
+
+    async def retrieve_document(self, document_multihash: str) -> bytes:
+        if not isinstance(self.ENDPOINTS.get("document"), str):
+            raise Exception("Document API must be configured first")
+
+        resp = await self._request(
+            "GET",
+            f'{self.ENDPOINTS["document"]}/{document_multihash}',
+            params={
+                "as_jurisdiction": str(self.COUNTRY)
+            },
+            headers=await self._get_auth_header(self.auth_class.get_document_auth_header),
+        )
+        if resp.status_code == 200:
+            return resp.content
+        try:
+            error = resp.json()
+        except Exception:
+            error = resp.content.decode("utf-8")
+        raise Exception(f"Unable to retrieve document: {resp.status_code}, {error}")
+
+    async def retrieve_document_stream(self, document_multihash: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+        """
+        Returns the async iterator over the document content chunks.
+        The request is sent (and the errors are raised) before the iterator is returned
+        """
+        if not isinstance(self.ENDPOINTS.get("document"), str):
+            raise Exception("Document API must be configured first")
+
+        resp = await self._request(
+            "GET",
+            f'{self.ENDPOINTS["document"]}/{document_multihash}',
+            params={
+                "as_jurisdiction": str(self.COUNTRY)
+            },
+            headers=await self._get_auth_header(self.auth_class.get_document_auth_header),
+            stream=True,
+        )
+        if resp.status_code != 200:
+            await resp.aread()
+            await resp.aclose()
+            try:
+                error = resp.json()
+            except Exception:
+                error = resp.content.decode("utf-8")
+            raise Exception(f"Unable to retrieve document: {resp.status_code}, {error}")
+        return self._iter_content(resp, chunk_size)
+
+    @staticmethod
+    async def _iter_content(resp, chunk_size):
+        try:
+            async for chunk in resp.aiter_bytes(chunk_size):
+                yield chunk
+        finally:
+            await resp.aclose()
+
+    async def subscribe(self, predicate=None, topic=None, callback=None) -> bool:
+        if not callback:
+            raise Exception("The callback parameter is required")
+        if not isinstance(self.ENDPOINTS.get("subscription"), str):
+            raise Exception("Subscription API must be configured first")
+
+        resp = await self._request(
+            "POST",
+            self.ENDPOINTS["subscription"] + "/subscriptions",
+            # subscribing again just renews the subscription
+            idempotent=True,
+            data={
+                'hub.callback': callback,
+                'hub.topic': predicate or topic,
+                'hub.mode': 'subscribe'
+            },
+            headers=await self._get_auth_header(self.auth_class.get_subscr_auth_header),
+        )
+        if resp.status_code != 202:
+            raise Exception(
+                "Unable to subscribe to {}: {}, {}".format(predicate, resp, resp.text[:2000])
+            )
+        return True
+
+    async def gather(self, coroutines) -> list:
+        """
+        Run the coroutines with at most `concurrency` of them at once;
+        return their results (or the exceptions raised) in the same order
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*(run(c) for c in coroutines), return_exceptions=True)
+
+    async def retrieve_messages(self, sender_refs) -> dict:
+        """
+        Returns {sender_ref: message body or None if it can't be retrieved}
+        """
+        sender_refs = list(sender_refs)
+        results = await self.gather(self.retrieve_message(sender_ref) for sender_ref in sender_refs)
+        messages = {}
+        for sender_ref, result in zip(sender_refs, results):
+            if isinstance(result, Exception):
+                logger.warning("Unable to retrieve message %s: %s", sender_ref, result)
+                result = None
+            messages[sender_ref] = result
+        return messages
+
+    async def subscribe_many(self, predicates, callback=None) -> dict:
+        """
+        predicates is either the list of predicates to subscribe with the same callback
+        or {predicate: callback}; returns {predicate: True or the exception raised}
+        """
+        if not isinstance(predicates, dict):
+            predicates = {predicate: callback for predicate in predicates}
+        results = await self.gather(
+            self.subscribe(predicate=predicate, callback=predicate_callback)
+            for predicate, predicate_callback in predicates.items()
+        )
+        for predicate, result in zip(predicates, results):
+            if isinstance(result, Exception):
+                logger.warning("Unable to subscribe to %s: %s", predicate, result)
+        return dict(zip(predicates, results))
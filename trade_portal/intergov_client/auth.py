@@ -1,5 +1,7 @@
 import base64
 import logging
+import threading
+import time
 
 import requests
 
@@ -88,36 +90,140 @@ class DjangoCachedCognitoOIDCAuth(CognitoOIDCAuth):
     """
     Just in case there is some Django cache in place around...
     With local imports it shoudln't break things for users without it
+
+    The token is shared by all the processes through the cache and kept in the process
+    memory, so the hot path doesn't touch the cache. Only one process requests the token
+    (the cache lock, SET NX for Redis), others wait for it to appear in the cache.
+    The token is refreshed in the background thread some time before it expires, so
+    the requests don't wait for the token endpoint at all while the things are fine.
     """
+    # the token endpoint is unlikely to move
+    WELLKNOWN_CACHE_TIMEOUT = 6 * 3600
+    # start refreshing the token this long before it expires
+    REFRESH_BEFORE = 5 * 60
+    # don't use the token which is about to expire
+    EXPIRY_MARGIN = 30
+    # the token request never takes longer, the lock is released anyway
+    LOCK_TIMEOUT = 30
+    # waiting for another process to retrieve the token
+    LOCK_WAIT = 10
+    LOCK_POLL_INTERVAL = 0.1
+
+    # process-wide copies: {cache_key: {"header": (name, value), "expires_at": ts, "refresh_at": ts}}
+    _local_tokens = {}
+    _local_token_urls = {}
+    _refreshing = set()
+    _local_lock = threading.Lock()
 
     @classmethod
     def resolve_wellknown_to_token_url(cls, wellknown_url):
         import hashlib
         from django.core.cache import cache
 
+        existing_value = cls._local_token_urls.get(wellknown_url)
+        if existing_value:
+            return existing_value
+
         wk_hash = hashlib.md5(wellknown_url.encode("utf-8")).hexdigest()
         cache_key = f"TOKEN_URL_FOR_{wk_hash}"
 
         existing_value = cache.get(cache_key)
+        if not existing_value:
+            existing_value = super().resolve_wellknown_to_token_url(wellknown_url)
+            cache.set(cache_key, existing_value, cls.WELLKNOWN_CACHE_TIMEOUT)
+        cls._local_token_urls[wellknown_url] = existing_value
+        return existing_value
 
-        if existing_value:
-            return existing_value
+    def _get_cache_key(self):
+        import hashlib
+        # v2: the token dict, the previous versions cached the (name, value, expires_in) tuple
+        return "auth_header_cache_v2_" + hashlib.md5(
+            f"{self.CLIENT_ID}:{self.CLIENT_SECRET}:{self.SCOPE}".encode("utf-8")
+        ).hexdigest()
 
-        token_endpoint = super().resolve_wellknown_to_token_url(wellknown_url)
+    @classmethod
+    def _expires_in(cls, token) -> float:
+        return token["expires_at"] - time.time() if token else 0
 
-        cache.set(cache_key, token_endpoint, 30)
-        return token_endpoint
+    @classmethod
+    def _is_fresh(cls, token) -> bool:
+        return bool(token) and token["refresh_at"] > time.time()
 
     def get_auth_header(self, *args, **kwargs):
-        import hashlib
         from django.core.cache import cache
-        cache_key = "auth_header_cache" + hashlib.md5(
-            f"{self.CLIENT_ID}:{self.CLIENT_SECRET}:{self.SCOPE}".encode("utf-8")
-        ).hexdigest()
 
-        cached_value = cache.get(cache_key)
-        if cached_value:
-            return cached_value
-        a, b, exp = super().get_auth_header(*args, **kwargs)
-        cache.set(cache_key, (a, b, 0), exp - 60 if exp > 60 else exp / 2)
-        return a, b, exp
+        cache_key = self._get_cache_key()
+        token = self._local_tokens.get(cache_key)
+        if self._expires_in(token) <= self.EXPIRY_MARGIN:
+            token = cache.get(cache_key)
+            if self._expires_in(token) <= self.EXPIRY_MARGIN:
+                token = self._retrieve_shared_token(cache_key)
+            self._local_tokens[cache_key] = token
+        if not self._is_fresh(token):
+            self._refresh_in_background(cache_key)
+        return token["header"][0], token["header"][1], int(self._expires_in(token))
+
+    def _retrieve_shared_token(self, cache_key, wait=True):
+        """
+        Retrieve the new token if nobody else does it now and return it;
+        otherwise wait for the token another process retrieves (if wait)
+        """
+        from django.core.cache import cache
+
+        lock_key = f"{cache_key}_lock"
+        deadline = time.time() + self.LOCK_WAIT
+        while True:
+            if cache.add(lock_key, 1, self.LOCK_TIMEOUT):
+                try:
+                    # could be refreshed while we were acquiring the lock
+                    token = cache.get(cache_key)
+                    if self._is_fresh(token):
+                        return token
+                    return self._retrieve_token(cache_key)
+                finally:
+                    cache.delete(lock_key)
+            token = cache.get(cache_key)
+            if not wait:
+                # another process is refreshing it
+                return token if self._is_fresh(token) else None
+            if self._expires_in(token) > self.EXPIRY_MARGIN:
+                return token
+            if time.time() > deadline:
+                # the lock holder is stuck or the cache is down, can't wait any longer
+                logger.warning("Unable to wait for the auth token, retrieving it")
+                return self._retrieve_token(cache_key)
+            time.sleep(self.LOCK_POLL_INTERVAL)
+
+    def _retrieve_token(self, cache_key):
+        from django.core.cache import cache
+
+        a, b, exp = super().get_auth_header()
+        now = time.time()
+        token = {
+            "header": (a, b),
+            "expires_at": now + exp,
+            # short-living tokens are refreshed in the middle of their life
+            "refresh_at": now + exp - min(self.REFRESH_BEFORE, exp / 2),
+        }
+        cache.set(cache_key, token, exp)
+        return token
+
+    def _refresh_in_background(self, cache_key):
+        with self._local_lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+
+        def refresh():
+            try:
+                token = self._retrieve_shared_token(cache_key, wait=False)
+                if token:
+                    self._local_tokens[cache_key] = token
+            except Exception as e:
+                # the current token is still good, the next call tries again
+                logger.warning("Unable to refresh the auth token: %s", e)
+            finally:
+                with self._local_lock:
+                    self._refreshing.discard(cache_key)
+
+        threading.Thread(target=refresh, daemon=True).start()
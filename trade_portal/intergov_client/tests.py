@@ -1,8 +1,18 @@
+import asyncio
+import contextlib
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
+import requests
 from unittest import mock
 
 from . import IntergovClient
-from .auth import DumbAuth
+from .auth import DjangoCachedCognitoOIDCAuth, DumbAuth
+from .transport import MultipartStream, Transport
 
 
 class MockedResponse:
@@ -52,7 +62,7 @@ def test_init():
     assert e.value.args[0] == "Document API must be configured first"
 
 
-@mock.patch("requests.get")
+@mock.patch("requests.Session.request")
 def test_retrieve_message(get_mock):
     ac = DumbAuth()
     c = IntergovClient(
@@ -66,7 +76,7 @@ def test_retrieve_message(get_mock):
     assert ret == {"lala": "lala"}
 
 
-@mock.patch("requests.post")
+@mock.patch("requests.Session.request")
 def test_subscribe(get_mock):
     ac = DumbAuth()
     auth_h_name, auth_h_value, exp = ac.get_subscr_auth_header()
@@ -83,6 +93,7 @@ def test_subscribe(get_mock):
     )
 
     get_mock.assert_called_once_with(
+        "POST",
         "http://dumb-domain.tld/subscriptions",
         data={
             'hub.callback': "https://callbacky/",
@@ -92,6 +103,303 @@ def test_subscribe(get_mock):
         headers={
             auth_h_name: auth_h_value,
         },
+        timeout=(5, 30),
     )
 
     assert ret is True
+
+
+@mock.patch("time.sleep")
+@mock.patch("requests.Session.request")
+def test_transport_retries(request_mock, sleep_mock):
+    c = IntergovClient(
+        country="GB",
+        endpoints={"message": "http://dumb-domain.tld"},
+        auth_class=DumbAuth(),
+        transport=Transport(retries=2),
+    )
+    # the service is restarting
+    request_mock.side_effect = [
+        MockedResponse(503),
+        MockedResponse(200, json={"lala": "lala"}),
+    ]
+    assert c.retrieve_message("message-sender-ref") == {"lala": "lala"}
+    assert request_mock.call_count == 2
+
+    # the message could be accepted, not retried
+    request_mock.reset_mock()
+    request_mock.side_effect = [mock.Mock(status_code=503, text="Service Unavailable")]
+    with pytest.raises(Exception):
+        c.post_message({"a": "b"})
+    assert request_mock.call_count == 1
+
+    # the message hasn't reached the server
+    request_mock.reset_mock()
+    request_mock.side_effect = [
+        requests.exceptions.ConnectTimeout(),
+        MockedResponse(201, json={"a": "b"}),
+    ]
+    assert c.post_message({"a": "b"}) == {"a": "b"}
+    assert request_mock.call_count == 2
+
+    # gave up
+    request_mock.reset_mock()
+    request_mock.side_effect = requests.exceptions.ReadTimeout()
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        c.retrieve_message("message-sender-ref")
+    assert request_mock.call_count == 3
+
+
+class SyncThread:
+    def __init__(self, target, daemon=None):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+@pytest.fixture
+def oidc_auth(settings):
+    from django.core.cache import cache
+
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    # the locmem caches share the storage, so the tokens would leak between the tests
+    cache.clear()
+    DjangoCachedCognitoOIDCAuth._local_tokens.clear()
+    DjangoCachedCognitoOIDCAuth._local_token_urls.clear()
+    with mock.patch("intergov_client.auth.threading.Thread", SyncThread):
+        yield DjangoCachedCognitoOIDCAuth("http://auth.tld/token", "client", "secret", "scope")
+    cache.clear()
+
+
+@mock.patch("requests.post")
+def test_cached_oidc_auth(post_mock, oidc_auth):
+    post_mock.return_value = MockedResponse(200, json={"access_token": "token-1", "expires_in": 3600})
+    assert oidc_auth.get_auth_header()[:2] == ("Authorization", "token-1")
+    # the process copy and then the shared one
+    assert oidc_auth.get_auth_header()[1] == "token-1"
+    DjangoCachedCognitoOIDCAuth._local_tokens.clear()
+    assert oidc_auth.get_auth_header()[1] == "token-1"
+    assert post_mock.call_count == 1
+
+    # about to expire, the current one is used while the new one is being retrieved
+    post_mock.return_value = MockedResponse(200, json={"access_token": "token-2", "expires_in": 3600})
+    with mock.patch("time.time", return_value=time.time() + 3400):
+        assert oidc_auth.get_auth_header()[1] == "token-1"
+        assert post_mock.call_count == 2
+        assert oidc_auth.get_auth_header()[1] == "token-2"
+    assert post_mock.call_count == 2
+
+
+@mock.patch("requests.post")
+def test_cached_oidc_auth_single_flight(post_mock, oidc_auth):
+    from django.core.cache import cache
+
+    cache_key = oidc_auth._get_cache_key()
+    # another process retrieves the token
+    cache.add(f"{cache_key}_lock", 1)
+
+    def token_retrieved(seconds):
+        cache.set(cache_key, {
+            "header": ("Authorization", "token-1"),
+            "expires_at": time.time() + 3600,
+            "refresh_at": time.time() + 3300,
+        })
+
+    with mock.patch("time.sleep", side_effect=token_retrieved) as sleep_mock:
+        assert oidc_auth.get_auth_header()[1] == "token-1"
+    assert sleep_mock.call_count == 1
+    assert post_mock.call_count == 0
+
+
+@mock.patch("requests.post")
+def test_cached_oidc_auth_previous_version(post_mock, oidc_auth):
+    import hashlib
+    from django.core.cache import cache
+
+    # cached by the previous version, still there while the processes are being restarted
+    cache.set(
+        "auth_header_cache" + hashlib.md5(b"client:secret:scope").hexdigest(),
+        ("Authorization", "token-0", 0),
+    )
+    post_mock.return_value = MockedResponse(200, json={"access_token": "token-1", "expires_in": 3600})
+    assert oidc_auth.get_auth_header()[1] == "token-1"
+
+
+@mock.patch("requests.get")
+def test_cached_oidc_wellknown(get_mock, oidc_auth):
+    get_mock.return_value = MockedResponse(200, json={"token_endpoint": "http://auth.tld/token"})
+    for _ in range(2):
+        assert DjangoCachedCognitoOIDCAuth.resolve_wellknown_to_token_url(
+            "http://auth.tld/.well-known/openid-configuration"
+        ) == "http://auth.tld/token"
+    assert get_mock.call_count == 1
+
+
+@mock.patch("requests.Session.request")
+def test_document_stream(request_mock):
+    c = IntergovClient(
+        country="GB",
+        endpoints={"document": "http://dumb-domain.tld"},
+        auth_class=DumbAuth(),
+    )
+    resp = mock.MagicMock(status_code=200)
+    resp.iter_content.return_value = iter([b'{"a": ', b'"b"}'])
+    request_mock.return_value = resp
+    assert list(c.retrieve_document_stream("Qm123", chunk_size=6)) == [b'{"a": ', b'"b"}']
+    assert request_mock.call_args[1]["stream"] is True
+    resp.iter_content.assert_called_once_with(6)
+
+    request_mock.return_value = MockedResponse(200, json={"multihash": "Qm123"})
+    assert c.post_binary_document("AU", io.BytesIO(b'{"a": "b"}')) == {"multihash": "Qm123"}
+    body = request_mock.call_args[1]["data"]
+    assert isinstance(body, MultipartStream)
+    assert request_mock.call_args[1]["headers"]["Content-Type"] == body.content_type
+
+
+def test_multipart_stream():
+    document = io.BytesIO(b"x" * 100)
+    body = MultipartStream({"document": ("document.json", document)})
+    content = b"".join(iter(lambda: body.read(7), b""))
+    assert len(content) == len(body)
+    assert content == (
+        f'--{body.boundary}\r\n'
+        'Content-Disposition: form-data; name="document"; filename="document.json"\r\n\r\n'
+        + "x" * 100
+        + f'\r\n--{body.boundary}--\r\n'
+    ).encode("utf-8")
+    # rewinded for the retry
+    body.seek(0)
+    assert body.read() == content
+
+
+class StubIntergovHandler(BaseHTTPRequestHandler):
+    """
+    The message, document and subscription APIs, enough for the client
+    """
+
+    def do_GET(self):
+        with self.server.track_request():
+            if self.path.startswith("/message/"):
+                sender_ref = self.path.split("/")[-1]
+                if sender_ref in self.server.messages:
+                    return self.respond(200, self.server.messages[sender_ref])
+                return self.respond(404, {"error": "not found"})
+            return self.respond(200, {"multihash": self.path.strip("/").split("?")[0]})
+
+    def do_POST(self):
+        with self.server.track_request():
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            if self.path == "/subscriptions":
+                self.server.subscriptions.append(body.decode("utf-8"))
+                return self.respond(202, None)
+            if self.path == "/message":
+                return self.respond(201, dict(json.loads(body), sender_ref="new-ref"))
+            return self.respond(200, {"multihash": "Qm123"})
+
+    def respond(self, status, body):
+        # keep some requests in flight at once
+        time.sleep(0.05)
+        content = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubIntergovServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubIntergovHandler)
+        self.url = f"http://127.0.0.1:{self.server_port}"
+        self.messages = {}
+        self.subscriptions = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def track_request(self):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def stub_server():
+    server = StubIntergovServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_async_client(stub_server, **kwargs):
+    from .async_client import AsyncIntergovClient
+
+    return AsyncIntergovClient(
+        country="GB",
+        endpoints={
+            "message": stub_server.url,
+            "document": stub_server.url,
+            "subscription": stub_server.url,
+        },
+        auth_class=DumbAuth(),
+        **kwargs
+    )
+
+
+def test_async_client(stub_server):
+    stub_server.messages["AU:1"] = {"sender_ref": "1", "status": "accepted"}
+
+    async def run():
+        async with get_async_client(stub_server) as c:
+            return (
+                await c.retrieve_message("AU:1"),
+                await c.retrieve_message("AU:2"),
+                await c.post_message({"subject": "a.b.c"}),
+                await c.post_binary_document("AU", io.BytesIO(b'{"a": "b"}')),
+                await c.retrieve_document("Qm123"),
+                b"".join([chunk async for chunk in await c.retrieve_document_stream("Qm123")]),
+                await c.subscribe(predicate="a.b.c", callback="https://callbacky/"),
+            )
+
+    assert asyncio.run(run()) == (
+        {"sender_ref": "1", "status": "accepted"},
+        None,
+        {"subject": "a.b.c", "sender_ref": "new-ref"},
+        {"multihash": "Qm123"},
+        b'{"multihash": "Qm123"}',
+        b'{"multihash": "Qm123"}',
+        True,
+    )
+
+
+def test_async_client_concurrency(stub_server):
+    for i in range(20):
+        stub_server.messages[f"AU:{i}"] = {"sender_ref": str(i)}
+
+    async def run():
+        async with get_async_client(stub_server, concurrency=5) as c:
+            messages = await c.retrieve_messages(f"AU:{i}" for i in range(22))
+            subscriptions = await c.subscribe_many(["a.b.c", "d.e.f"], callback="https://callbacky/")
+            return messages, subscriptions
+
+    messages, subscriptions = asyncio.run(run())
+    assert messages["AU:7"] == {"sender_ref": "7"}
+    assert messages["AU:21"] is None
+    assert len(messages) == 22
+    assert subscriptions == {"a.b.c": True, "d.e.f": True}
+    assert len(stub_server.subscriptions) == 2
+    # bounded, but concurrent
+    assert 1 < stub_server.max_in_flight <= 5
@@ -0,0 +1,227 @@
+import io
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+# the gateway or the service itself is restarting, worth retrying
+RETRY_STATUSES = (502, 503, 504)
+
+
+def get_backoff(attempt: int, backoff_factor: float, backoff_max: float) -> float:
+    # "full jitter", so the clients failed at once don't retry at once
+    return random.uniform(0, min(backoff_max, backoff_factor * 2 ** attempt))
+
+
+class Transport:
+    """
+    HTTP transport shared by the IntergovClient instances of the process:
+    keep-alive connections pool per endpoint host, timeouts and retries
+    with jittered exponential backoff.
+
+    Not idempotent requests (POST, unless the caller tells otherwise) are retried
+    only if they haven't reached the server - the connection wasn't established.
+
+    timer and counter are optional metrics hooks: timer(name) returns a decorator
+    measuring the call (like statsd_timer), counter(name, value) counts the events
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 5,
+        read_timeout: float = 30,
+        retries: int = 3,
+        backoff_factor: float = 0.3,
+        backoff_max: float = 10,
+        pool_maxsize: int = 10,
+        timer=None,
+        counter=None,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.timer = timer
+        self.counter = counter
+        self._timed_send = {}
+        self.session = requests.Session()
+        # a pool per host, up to pool_maxsize connections each (a connection per thread)
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, url: str, name: str, idempotent: bool = None, **kwargs) -> requests.Response:
+        """
+        name is the operation name for the metrics and logs, like "retrieve_message"
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", self.timeout)
+        send = self._get_timed_send(name)
+        attempt = 0
+        while True:
+            try:
+                resp = send(method, url, **kwargs)
+            except requests.RequestException as e:
+                self._count(f"intergov.{name}.errors")
+                if not self._can_retry(attempt, kwargs) or not (idempotent or self._is_not_sent(e)):
+                    raise
+                logger.warning("%s %s failed (%s), retrying", method, url, e.__class__.__name__)
+            else:
+                if resp.status_code not in RETRY_STATUSES:
+                    return resp
+                self._count(f"intergov.{name}.errors")
+                if not idempotent or not self._can_retry(attempt, kwargs):
+                    return resp
+                logger.warning("%s %s responded %s, retrying", method, url, resp.status_code)
+            self._count(f"intergov.{name}.retries")
+            time.sleep(self._get_backoff(attempt))
+            attempt += 1
+
+    def _send(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def _get_timed_send(self, name):
+        if self.timer is None:
+            return self._send
+        if name not in self._timed_send:
+            self._timed_send[name] = self.timer(f"intergov.{name}")(self._send)
+        return self._timed_send[name]
+
+    def _count(self, name):
+        if self.counter is not None:
+            self.counter(name, 1)
+
+    def _can_retry(self, attempt, kwargs) -> bool:
+        if attempt >= self.retries:
+            return False
+        # the uploaded files and streamed bodies are read by the previous attempt
+        file_objects = [
+            value[1] if isinstance(value, tuple) else value
+            for value in (kwargs.get("files") or {}).values()
+        ] + [kwargs.get("data")]
+        for file_object in file_objects:
+            if hasattr(file_object, "read"):
+                if not hasattr(file_object, "seek"):
+                    return False
+                file_object.seek(0)
+        return True
+
+    def _get_backoff(self, attempt) -> float:
+        return get_backoff(attempt, self.backoff_factor, self.backoff_max)
+
+    @staticmethod
+    def _is_not_sent(exc) -> bool:
+        """
+        The request hasn't reached the server, so even not idempotent one is safe to retry
+        """
+        if isinstance(exc, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(exc, requests.exceptions.ConnectionError) and exc.args:
+            reason = getattr(exc.args[0], "reason", None)
+            return isinstance(reason, NewConnectionError)
+        return False
+
+
+class MultipartStream(io.RawIOBase):
+    """
+    multipart/form-data request body reading the files on the fly, so they are never
+    loaded to the memory entirely (requests builds the whole body for the files= argument).
+
+    fields is {name: (filename, file object)}; the files must be seekable to know their size
+    """
+
+    def __init__(self, fields: dict):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        # bytes or (file object, start position) in the order they are sent
+        self._parts = []
+        self.len = 0
+        for name, (filename, file_object) in fields.items():
+            start = file_object.tell()
+            file_object.seek(0, os.SEEK_END)
+            self.len += file_object.tell() - start
+            file_object.seek(start)
+            self._add_bytes(
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n\r\n'
+            )
+            self._parts.append((file_object, start))
+            self._add_bytes("\r\n")
+        self._add_bytes(f"--{self.boundary}--\r\n")
+        self.seek(0)
+
+    def _add_bytes(self, text):
+        value = text.encode("utf-8")
+        self._parts.append(value)
+        self.len += len(value)
+
+    def __len__(self):
+        return self.len
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if offset != 0 or whence != os.SEEK_SET:
+            raise io.UnsupportedOperation("Only rewinding is supported")
+        self._position = 0
+        self._part_index = 0
+        self._part_offset = 0
+        for part in self._parts:
+            if isinstance(part, tuple):
+                part[0].seek(part[1])
+        return 0
+
+    def read(self, size=-1):
+        chunks = []
+        while (size < 0 or size > 0) and self._part_index < len(self._parts):
+            part = self._parts[self._part_index]
+            if isinstance(part, tuple):
+                chunk = part[0].read(size)
+            else:
+                chunk = part[self._part_offset:self._part_offset + size if size >= 0 else None]
+                self._part_offset += len(chunk)
+            if not chunk:
+                self._part_index += 1
+                self._part_offset = 0
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        data = b"".join(chunks)
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport() -> Transport:
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = Transport()
+        return _default_transport
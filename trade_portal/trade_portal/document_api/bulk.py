@@ -0,0 +1,248 @@
+import base64
+import binascii
+import io
+import logging
+import tempfile
+from functools import partial
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from rest_framework import serializers
+
+from trade_portal.documents.models import (
+    Document, DocumentFile, FTA, OaDetails, Party,
+    generate_docfile_filename,
+)
+from trade_portal.document_api.schema import get_cert_schema_errors
+from trade_portal.document_api.serializers import (
+    consignment_fields_from_json,
+    document_fields_from_json,
+)
+from trade_portal.edi3.utils import party_lookup_from_json
+from trade_portal.utils.monitoring import statsd_timer
+from trade_portal.utils.pdf_inspect import inspect_pdf
+
+logger = logging.getLogger(__name__)
+
+
+# the decoded attachments of a request are kept in memory until this size, then on the disk
+SPOOL_MAX_SIZE = 1024 * 1024
+
+PARTY_LOOKUP_FIELDS = ("bid_prefix", "clear_business_id", "business_id", "dot_separated_id", "name")
+
+
+def _party_key(lookup):
+    return tuple(lookup[field] for field in PARTY_LOOKUP_FIELDS)
+
+
+class BulkCertificateCreator:
+    """
+    Creates many certificates from the API payloads at once.
+
+    Does the same as CertificateSerializer.create per item, but the number
+    of queries doesn't depend on the number of certificates: FTAs and parties
+    are resolved by set-based queries and objects are inserted using bulk_create.
+    Invalid items are reported and don't prevent the valid ones from being created.
+    Decoded attachments are spooled to a single temporary file until they are uploaded.
+    """
+
+    def __init__(self, user, org):
+        self.user = user
+        self.org = org
+        self.attachments = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+    @statsd_timer("document_api.BulkCertificateCreator.create")
+    def create(self, payloads):
+        """
+        Returns results list, one per payload and in the same order:
+            {"index": 0, "status": "created", "id": UUID}
+            {"index": 1, "status": "invalid", "errors": {...}}
+        """
+        results = []
+        valid_items = []
+        for index, payload in enumerate(payloads):
+            try:
+                valid_items.append((index, self._validate_item(payload)))
+            except serializers.ValidationError as e:
+                results.append({"index": index, "status": "invalid", "errors": e.detail})
+
+        ftas = self._get_ftas(item["cert_data"] for _, item in valid_items)
+        known_fta_items = []
+        for index, item in valid_items:
+            fta_name = item["cert_data"].get("freeTradeAgreement")
+            if fta_name is None or fta_name in ftas:
+                known_fta_items.append((index, item))
+                continue
+            results.append({
+                "index": index,
+                "status": "invalid",
+                "errors": {
+                    "freeTradeAgreement": f"Doesn't exist in the system, possible choices are {', '.join(ftas)}"
+                },
+            })
+        valid_items = known_fta_items
+
+        if valid_items:
+            with transaction.atomic():
+                documents = self._create_documents([item for _, item in valid_items], ftas)
+                # after the uploads, if rolled back it's closed when garbage collected
+                transaction.on_commit(self.attachments.close)
+            for (index, _), document in zip(valid_items, documents):
+                results.append({"index": index, "status": "created", "id": document.pk})
+        results.sort(key=lambda result: result["index"])
+        return results
+
+    def _validate_item(self, payload):
+        """
+        Database-free checks of a single payload, the same ones the single
+        certificate endpoint does
+        """
+        cert_data = payload.get("certificateOfOrigin") if isinstance(payload, dict) else None
+        if not cert_data:
+            raise serializers.ValidationError(
+                {"payload": "certificateOfOrigin must be provided"}
+            )
+        schema_errors = get_cert_schema_errors(cert_data)
+        if schema_errors:
+            raise serializers.ValidationError({"schema": schema_errors})
+        item = {
+            "payload": payload,
+            "cert_data": cert_data,
+            "fields": document_fields_from_json(cert_data),
+            "attached_file": None,
+        }
+        attachedfile = cert_data.get("attachedFile")
+        if attachedfile and attachedfile.get("encodingCode") == "base64":
+            try:
+                content = base64.b64decode(attachedfile.get("file"))
+            except (binascii.Error, TypeError, ValueError):
+                raise serializers.ValidationError(
+                    {"attachedFile": "file must be base64 encoded"}
+                )
+            # (offset, size) in the attachments file
+            self.attachments.seek(0, io.SEEK_END)
+            item["attached_file"] = (self.attachments.tell(), len(content))
+            self.attachments.write(content)
+        return item
+
+    def _read_attachment(self, attached_file):
+        offset, size = attached_file
+        self.attachments.seek(offset)
+        return self.attachments.read(size)
+
+    def _get_ftas(self, cert_data_list):
+        """
+        Single query for all the items; there are few FTAs so all of them are fetched,
+        which also gives the possible choices for the error message
+        """
+        if not any("freeTradeAgreement" in cert_data for cert_data in cert_data_list):
+            return {}
+        ftas = {}
+        for fta in FTA.objects.all():
+            ftas.setdefault(fta.name, fta)
+        return ftas
+
+    def _get_parties(self, party_json_list):
+        """
+        Returns dict of party lookup key to the Party object,
+        existing parties are fetched by a single query and missing ones are bulk-created
+        """
+        lookups = {}
+        for party_json in party_json_list:
+            lookup, defaults = party_lookup_from_json(party_json)
+            lookups.setdefault(_party_key(lookup), (lookup, defaults))
+
+        parties = {}
+        existing = Party.objects.filter(
+            business_id__in={lookup["business_id"] for lookup, _ in lookups.values()}
+        )
+        for party in existing:
+            key = _party_key({field: getattr(party, field) for field in PARTY_LOOKUP_FIELDS})
+            if key in lookups:
+                parties.setdefault(key, party)
+
+        missing = [key for key in lookups if key not in parties]
+        created = Party.objects.bulk_create([
+            Party(**lookups[key][0], **lookups[key][1])
+            for key in missing
+        ])
+        parties.update(zip(missing, created))
+        return parties
+
+    def _create_documents(self, items, ftas):
+        party_json_list = []
+        for item in items:
+            cert_data = item["cert_data"]
+            party_json_list.append(cert_data.get("issuer", {}))
+            consignor = cert_data.get("supplyChainConsignment", {}).get("consignor", {})
+            if consignor:
+                party_json_list.append(consignor)
+        parties = self._get_parties(party_json_list)
+
+        oa_details = OaDetails.objects.bulk_create([
+            OaDetails.build_new(for_org=self.org)
+            for _ in items
+        ])
+
+        documents = []
+        for item, oa in zip(items, oa_details):
+            cert_data = item["cert_data"]
+            supplyChainConsignment = cert_data.get("supplyChainConsignment", {})
+            consignor = supplyChainConsignment.get("consignor", {})
+            document = Document(
+                raw_certificate_data=item["payload"],
+                created_by_user=self.user,
+                created_by_org=self.org,
+                oa=oa,
+                fta=ftas.get(cert_data.get("freeTradeAgreement")),
+                issuer=parties[_party_key(party_lookup_from_json(cert_data.get("issuer", {}))[0])],
+                exporter=parties[_party_key(party_lookup_from_json(consignor)[0])] if consignor else None,
+                **item["fields"],
+                **consignment_fields_from_json(supplyChainConsignment),
+            )
+            # bulk_create doesn't call Document.save
+            document._fill_search_field()
+            documents.append(document)
+        Document.objects.bulk_create(documents)
+
+        document_files = []
+        for item, document in zip(items, documents):
+            if item["attached_file"] is None:
+                continue
+            file_path = generate_docfile_filename(document, "file.pdf")
+            # uploaded once the certificates are committed, so the rolled back ones leave no files behind
+            transaction.on_commit(partial(self._save_file, file_path, item["attached_file"]))
+            content = self._read_attachment(item["attached_file"])
+            document_files.append(
+                DocumentFile(
+                    doc=document,
+                    created_by=self.user,
+                    file=file_path,
+                    # DocumentFile.save does the same
+                    original_file=file_path,
+                    filename="file.pdf",
+                    size=len(content),
+                    is_watermarked=None,
+                    metadata={"pdf": inspect_pdf(io.BytesIO(content))},
+                )
+            )
+        DocumentFile.objects.bulk_create(document_files)
+        return documents
+
+    def _save_file(self, file_path, attached_file):
+        """
+        Runs after the commit, so the certificates are created already: a failed upload
+        is logged and flagged on the DocumentFile instead of failing the other uploads
+        """
+        try:
+            saved_path = default_storage.save(file_path, ContentFile(self._read_attachment(attached_file)))
+        except Exception as e:
+            logger.exception(e)
+            for document_file in DocumentFile.objects.filter(file=file_path):
+                document_file.metadata["upload_failed"] = True
+                document_file.save(update_fields=["metadata"])
+            return
+        if saved_path != file_path:
+            # the storage doesn't overwrite and the name is taken already
+            DocumentFile.objects.filter(file=file_path).update(file=saved_path, original_file=saved_path)
@@ -0,0 +1,79 @@
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from trade_portal.document_api.bulk import BulkCertificateCreator
+from trade_portal.document_api.management.commands.benchmark_cert_schema import representative_certificate
+from trade_portal.document_api.serializers import CertificateSerializer
+from trade_portal.documents.models import OaDetails
+from trade_portal.users.models import Organisation, OrgMembership
+
+
+def representative_payloads(count, items_count):
+    payloads = []
+    for i in range(count):
+        cert_data = representative_certificate(items_count)
+        cert_data["id"] = f"BENCHCERT{i}"
+        # FTAs are set up per installation
+        cert_data.pop("freeTradeAgreement")
+        payloads.append({"certificateOfOrigin": cert_data})
+    return payloads
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure certificates creation cost: the single certificate endpoint path per certificate "
+        "versus the bulk one. Everything is rolled back afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--items", type=int, default=10)
+        parser.add_argument("--org", type=int, help="Chambers organisation ID, the first one by default")
+
+    def handle(self, *args, **kwargs):
+        orgs = Organisation.objects.filter(is_chambers=True)
+        if kwargs["org"]:
+            orgs = orgs.filter(pk=kwargs["org"])
+        membership = OrgMembership.objects.filter(org__in=orgs).select_related("org", "user").first()
+        if not membership:
+            raise CommandError("No chambers organisation with users found")
+        user, org = membership.user, membership.org
+
+        def single(payloads):
+            for payload in payloads:
+                serializer = CertificateSerializer(data=payload, user=user, org=org)
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+
+        def bulk(payloads):
+            results = BulkCertificateCreator(user, org).create(payloads)
+            assert all(result["status"] == "created" for result in results), results
+
+        def measure(func, payloads):
+            with CaptureQueriesContext(connection) as context:
+                started_at = time.perf_counter()
+                func(payloads)
+                elapsed = time.perf_counter() - started_at
+            return elapsed, len(context.captured_queries)
+
+        self.stdout.write(
+            f"{'count':>6} {'single, s':>10} {'queries':>8} {'bulk, s':>10} {'queries':>8} {'speedup':>8}"
+        )
+        # the bulk path doesn't render the QR codes, and the rolled back
+        # certificates would leave the rendered ones in the storage
+        with mock.patch.object(OaDetails, "get_qr_image"), transaction.atomic():
+            # parties are created by the first call, like they exist for the real chambers
+            bulk(representative_payloads(1, kwargs["items"]))
+            for count in kwargs["count"]:
+                payloads = representative_payloads(count, kwargs["items"])
+                single_time, single_queries = measure(single, payloads)
+                bulk_time, bulk_queries = measure(bulk, payloads)
+                self.stdout.write(
+                    f"{count:>6} {single_time:>10.3f} {single_queries:>8} "
+                    f"{bulk_time:>10.3f} {bulk_queries:>8} {single_time / bulk_time:>7.1f}x"
+                )
+            transaction.set_rollback(True)
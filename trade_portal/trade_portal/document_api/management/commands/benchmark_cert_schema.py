@@ -0,0 +1,101 @@
+import timeit
+
+import jsonschema
+from django.core.management.base import BaseCommand
+
+from trade_portal.document_api.schema import CERT_SCHEMA, get_cert_schema_errors
+
+
+def _party(business_id, name):
+    return {
+        "id": business_id,
+        "name": name,
+        "postalAddress": {
+            "line1": "161 Collins Street",
+            "cityName": "Melbourne",
+            "postcode": "3000",
+            "countrySubDivisionName": "VIC",
+            "countryCode": "AU",
+        },
+    }
+
+
+def representative_certificate(items_count):
+    """
+    Certificate body like the ones chambers send, with items_count consignment items
+    """
+    return {
+        "id": "BENCHCERT1",
+        "issueDateTime": "2020-08-30T15:17:31.862Z",
+        "name": "Certificate of Origin",
+        "firstSignatoryAuthentication": {
+            "actualDateTime": "2020-08-30T15:17:31.862Z",
+            "statement": "I declare it",
+            "providingTradeParty": _party("abr.gov.au:abn:55004094599", "Exporter"),
+        },
+        "issueLocation": {"id": "unece.un.org:locode:AUADL", "name": "Adelaide"},
+        "issuer": _party("id:wfa.org.au", "Chamber"),
+        "status": "issued",
+        "isPreferential": True,
+        "freeTradeAgreement": "China-Australia Free Trade Agreement",
+        "supplyChainConsignment": {
+            "id": "dbschenker.com:hawb:DBS626578",
+            "consignor": _party("abr.gov.au:abn:55004094599", "Exporter"),
+            "consignee": _party("id:emw-wines.com", "Importer"),
+            "exportCountry": {"code": "AU", "name": "Australia"},
+            "importCountry": {"code": "CN", "name": "China"},
+            "includedConsignmentItems": [
+                {
+                    "id": f"penfolds.com:shipment:{i}",
+                    "crossBorderRegulatoryProcedure": {"originCriteriaText": "WP"},
+                    "manufacturer": _party("id:penfolds.com", "Manufacturer"),
+                    "tradeLineItems": [
+                        {
+                            "sequenceNumber": 1,
+                            "invoiceReference": {
+                                "id": "tweglobal.com:invoice:1122345",
+                                "formattedIssueDateTime": "2020-08-30T15:17:31.862Z",
+                            },
+                            "tradeProduct": {
+                                "id": "gs1.org:gtin:9325814006194",
+                                "description": "Bin 23 Pinot Noir 2018",
+                                "harmonisedTariffCode": {"classCode": "2204.21"},
+                                "originCountry": {"code": "AU", "name": "Australia"},
+                            },
+                            "transportPackages": [
+                                {
+                                    "id": "gs1.org:sscc:59312345670002345",
+                                    "grossVolume": {"uom": "m3", "value": "0.55"},
+                                    "grossWeight": {"uom": "Kg", "value": "450"},
+                                }
+                            ],
+                        }
+                    ],
+                }
+                for i in range(items_count)
+            ],
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-request certificate schema validation cost: "
+        "jsonschema.validate (validator built per call) versus the pre-compiled validator"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=200)
+        parser.add_argument("--items", type=int, nargs="+", default=[1, 10, 100])
+
+    def handle(self, *args, **kwargs):
+        number = kwargs["number"]
+        self.stdout.write(f"{'items':>6} {'validate, ms':>14} {'compiled, ms':>14} {'speedup':>8}")
+        for items_count in kwargs["items"]:
+            cert_data = representative_certificate(items_count)
+            assert not get_cert_schema_errors(cert_data)
+            before = timeit.timeit(lambda: jsonschema.validate(cert_data, CERT_SCHEMA), number=number) / number
+            after = timeit.timeit(lambda: get_cert_schema_errors(cert_data), number=number) / number
+            self.stdout.write(
+                f"{items_count:>6} {before * 1000:>14.3f} {after * 1000:>14.3f} {before / after:>7.1f}x"
+            )
@@ -1,3 +1,7 @@
+import threading
+
+import jsonschema
+
 CERT_SCHEMA = {
     "$schema": "http://json-schema.org/draft-07/schema#",
     "description": "Certificate of Origin schema",
@@ -454,3 +458,39 @@ CERT_SCHEMA = {
         }
     },
 }
+
+
+# checked once per process instead of per jsonschema.validate call
+jsonschema.Draft7Validator.check_schema(CERT_SCHEMA)
+
+_thread_local = threading.local()
+# documents of the remote $refs (ISO codes) are downloaded once per process
+# and shared by the validators of all threads
+_remote_refs_store = jsonschema.RefResolver.from_schema(CERT_SCHEMA).store
+
+
+def get_cert_schema_validator():
+    """
+    The validator is built once per thread and reused: its RefResolver keeps the
+    current resolution scope while validating, so it can't be shared between threads
+    """
+    validator = getattr(_thread_local, "validator", None)
+    if validator is None:
+        resolver = jsonschema.RefResolver.from_schema(CERT_SCHEMA)
+        resolver.store = _remote_refs_store
+        validator = jsonschema.Draft7Validator(CERT_SCHEMA, resolver=resolver)
+        _thread_local.validator = validator
+    return validator
+
+
+def get_cert_schema_errors(cert_data):
+    """
+    All the schema validation errors messages, the most relevant one
+    (which jsonschema.validate would raise) goes first
+    """
+    errors = sorted(
+        get_cert_schema_validator().iter_errors(cert_data),
+        key=jsonschema.exceptions.relevance,
+        reverse=True,
+    )
+    return [error.message for error in errors]
@@ -1,18 +1,22 @@
 import base64
 import collections.abc
+import hashlib
+import io
 import logging
 
-import jsonschema
+from django.core.cache import cache
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.urls import reverse
 from rest_framework import serializers
 
 from trade_portal.documents.models import (
     Document, DocumentFile, FTA, OaDetails,
     generate_docfile_filename,
 )
-from trade_portal.document_api.schema import CERT_SCHEMA
+from trade_portal.document_api.schema import get_cert_schema_errors
 from trade_portal.edi3.utils import party_from_json
+from trade_portal.utils.pdf_inspect import inspect_pdf
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +42,61 @@ def dict_merge(dct, merge_dct):
             dct[k] = merge_dct[k]
 
 
+def document_fields_from_json(cert_data):
+    """
+    Document model fields which are picked from the new certificate
+    JSON body, raises ValidationError if they are not there
+    """
+    supplyChainConsignment = cert_data.get("supplyChainConsignment", {})
+    ret = {
+        "type": (
+            Document.TYPE_PREF_COO
+            if cert_data.get("isPreferential")
+            else Document.TYPE_NONPREF_COO
+        ),
+        "document_number": cert_data.get("id"),
+        "sending_jurisdiction": supplyChainConsignment.get(
+            "exportCountry", {}
+        ).get("code"),
+        "importing_country": supplyChainConsignment.get(
+            "importCountry", {}
+        ).get("code"),
+    }
+    if (
+        not isinstance(ret["sending_jurisdiction"], str)
+        or len(ret["sending_jurisdiction"]) != 2
+    ):
+        raise serializers.ValidationError(
+            {"exportCountry": "must be a dict with code key"}
+        )
+    if (
+        not isinstance(ret["importing_country"], str)
+        or len(ret["importing_country"]) != 2
+    ):
+        raise serializers.ValidationError(
+            {"importCountry": "must be a dict with code key"}
+        )
+    return ret
+
+
+def consignment_fields_from_json(supplyChainConsignment):
+    """
+    Denormalized consignment values shown in the UI
+    (parties are resolved separately)
+    """
+    ret = {}
+    importer = supplyChainConsignment.get("consignee", {})
+    if importer:
+        importer_parts = [
+            importer.get("name"),
+            importer.get("id"),
+        ]
+        ret["importer_name"] = " ".join((x for x in importer_parts if x))
+
+    ret["consignment_ref_doc_number"] = supplyChainConsignment.get("id")
+    return ret
+
+
 class CountryField(serializers.Field):
     def to_representation(self, instance):
         return instance.code if instance else None
@@ -69,6 +128,8 @@ class ShortCertificateSerializer(serializers.ModelSerializer):
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop("user", None)
         self.org = kwargs.pop("org", None)
+        kwargs.pop("request", None)
+        kwargs.pop("include_attachment", None)
         super().__init__(*args, **kwargs)
 
     def get_exporter(self, obj):
@@ -93,11 +154,62 @@ class CertificateSerializer(serializers.Serializer):
         )
         read_only = ("id", "importingCountry", "verificationStatus", "messageStatus")
 
+    # the rendered parts depend only on immutable data, so are cached for long
+    REPRESENTATION_CACHE_TIMEOUT = 3600 * 24
+    # larger attachments are read from the storage every time, not to fill the cache
+    ATTACHMENT_CACHE_MAX_SIZE = 1024 * 1024
+
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop("user")
         self.org = kwargs.pop("org")
+        self.request = kwargs.pop("request", None)
+        # base64 representation of the PDF file instead of the link to it
+        self.include_attachment = kwargs.pop("include_attachment", False)
         super().__init__(*args, **kwargs)
 
+    def _get_attachment_url(self, instance):
+        url = reverse("document-api-v0:attachment", kwargs={"pk": instance.pk})
+        if self.request:
+            url = self.request.build_absolute_uri(url)
+        return url
+
+    def _get_attached_file_base64(self, instance, pdf_attach):
+        """
+        Keyed by the file version: the file object is replaced when the
+        document is watermarked or the new file is uploaded
+        """
+        file_version = hashlib.md5(f"{pdf_attach.pk}:{pdf_attach.file.name}".encode()).hexdigest()
+        cache_key = f"docapi_attachment_{instance.pk}_{file_version}"
+        attached_file = cache.get(cache_key)
+        if attached_file is None:
+            try:
+                content = pdf_attach.file.read()
+                attached_file = {
+                    "file": base64.b64encode(content).decode("utf-8"),
+                    "encodingCode": "base64",
+                    "mimeCode": pdf_attach.mimetype(),
+                }
+            except Exception as e:
+                logger.exception(e)
+                return None
+            if len(content) <= self.ATTACHMENT_CACHE_MAX_SIZE:
+                cache.set(cache_key, attached_file, self.REPRESENTATION_CACHE_TIMEOUT)
+        return attached_file
+
+    def _get_oa_details(self, oa):
+        # OA uri and key never change for the existing OaDetails object,
+        # but the url depends on settings as well, so it's a part of the key
+        url = oa.url_repr()
+        cache_key = f"docapi_oa_{oa.pk}_{hashlib.md5(url.encode('utf-8')).hexdigest()}"
+        oa_details = cache.get(cache_key)
+        if oa_details is None:
+            oa_details = {
+                "url": url,
+                "qrcode": oa.get_qr_image_base64(),
+            }
+            cache.set(cache_key, oa_details, self.REPRESENTATION_CACHE_TIMEOUT)
+        return oa_details
+
     def to_representation(self, instance):
         """
         We just proxy the model's raw_certificate_data, replacing some
@@ -133,22 +245,22 @@ class CertificateSerializer(serializers.Serializer):
 
         pdf_attach = instance.get_pdf_attachment()
         if pdf_attach:
-            try:
-                data["certificateOfOrigin"]["attachedFile"] = {
-                    "file": base64.b64encode(pdf_attach.file.read()).decode("utf-8"),
-                    "encodingCode": "base64",
+            # copy, so the attachment doesn't end up in the instance data
+            data["certificateOfOrigin"] = data["certificateOfOrigin"].copy()
+            if self.include_attachment:
+                attached_file = self._get_attached_file_base64(instance, pdf_attach)
+            else:
+                # just a link, so the detail response doesn't read the file from the storage
+                attached_file = {
+                    "uri": self._get_attachment_url(instance),
                     "mimeCode": pdf_attach.mimetype(),
                 }
-            except Exception as e:
-                logger.exception(e)
-                pass
+            if attached_file:
+                data["certificateOfOrigin"]["attachedFile"] = attached_file
 
         # OA details
         if instance.oa:
-            data["OA"] = {
-                "url": instance.oa.url_repr(),
-                "qrcode": instance.oa.get_qr_image_base64(),
-            }
+            data["OA"] = self._get_oa_details(instance.oa)
         return data
 
     def validate(self, data):
@@ -163,12 +275,11 @@ class CertificateSerializer(serializers.Serializer):
             full_cert_data = request_cert_data
 
         # first step: validate the schema itself
-        try:
-            # in case of existing object - merge it to the existing data
-            # so schema validation passes on full data, not partial (PATCH)
-            jsonschema.validate(full_cert_data, CERT_SCHEMA)
-        except jsonschema.exceptions.ValidationError as e:
-            raise serializers.ValidationError({"schema": str(e.args[0])})
+        # in case of existing object - merge it to the existing data
+        # so schema validation passes on full data, not partial (PATCH)
+        schema_errors = get_cert_schema_errors(full_cert_data)
+        if schema_errors:
+            raise serializers.ValidationError({"schema": schema_errors})
 
         # second: any custom validations
         if not FTA.objects.filter(name=full_cert_data["freeTradeAgreement"]).exists():
@@ -200,38 +311,7 @@ class CertificateSerializer(serializers.Serializer):
             # schema validation goes there
             # TODO
 
-            # other custom validations
-            supplyChainConsignment = cert_data.get("supplyChainConsignment", {})
-            ret.update(
-                {
-                    "type": (
-                        Document.TYPE_PREF_COO
-                        if cert_data.get("isPreferential")
-                        else Document.TYPE_NONPREF_COO
-                    ),
-                    "document_number": cert_data.get("id"),
-                    "sending_jurisdiction": supplyChainConsignment.get(
-                        "exportCountry", {}
-                    ).get("code"),
-                    "importing_country": supplyChainConsignment.get(
-                        "importCountry", {}
-                    ).get("code"),
-                }
-            )
-            if (
-                not isinstance(ret["sending_jurisdiction"], str)
-                or len(ret["sending_jurisdiction"]) != 2
-            ):
-                raise serializers.ValidationError(
-                    {"exportCountry": "must be a dict with code key"}
-                )
-            if (
-                not isinstance(ret["importing_country"], str)
-                or len(ret["importing_country"]) != 2
-            ):
-                raise serializers.ValidationError(
-                    {"importCountry": "must be a dict with code key"}
-                )
+            ret.update(document_fields_from_json(cert_data))
 
         return ret
 
@@ -271,6 +351,8 @@ class CertificateSerializer(serializers.Serializer):
                     filename="file.pdf",
                     size=len(binary_decoded_file),
                     is_watermarked=None,
+                    # the file is in memory already, so inspected right away
+                    metadata={"pdf": inspect_pdf(io.BytesIO(binary_decoded_file))},
                 )
 
         return obj
@@ -321,15 +403,8 @@ class CertificateSerializer(serializers.Serializer):
                     {"supplyChainConsignment": "Can't parse consignor or consignee"}
                 )
 
-        importer = supplyChainConsignment.get("consignee", {})
-        if importer:
-            importer_parts = [
-                importer.get("name"),
-                importer.get("id"),
-            ]
-            obj.importer_name = " ".join((x for x in importer_parts if x))
-
-        obj.consignment_ref_doc_number = supplyChainConsignment.get("id")
+        for field, value in consignment_fields_from_json(supplyChainConsignment).items():
+            setattr(obj, field, value)
 
         obj.save()
         return
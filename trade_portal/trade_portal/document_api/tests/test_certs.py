@@ -1,5 +1,9 @@
 import base64
+import copy
+import json
 import random
+import threading
+from unittest import mock
 
 import pytest
 from requests.auth import HTTPBasicAuth
@@ -9,9 +13,14 @@ from rest_framework.test import (
     RequestsClient,
     APIClient,
 )
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from trade_portal.documents.models import Document, DocumentFile
+from trade_portal.documents.models import Document, DocumentFile, Party
+from trade_portal.document_api.schema import get_cert_schema_validator
+from trade_portal.document_api.serializers import CertificateSerializer
 from trade_portal.document_api.views import CertificateViewSet
 from trade_portal.users.tests.factories import UserFactory
 
@@ -266,6 +275,71 @@ def test_document_create_with_file_attached(docapi_env):
     assert DocumentFile.objects.count() == 1
 
 
+def test_certificate_attachment(docapi_env, settings):
+    c = APIClient()
+    c.credentials(HTTP_AUTHORIZATION=f'Token {docapi_env["t1"].access_token}')
+
+    cert_payload = copy.deepcopy(CERT_EXAMPLE)
+    cert_payload["certificateOfOrigin"]["attachedFile"] = {
+        "file": base64.b64encode(b"the file content").decode(),
+        "encodingCode": "base64",
+        "mimeCode": "application/pdf",
+    }
+    resp = c.post(
+        "/api/documents/v0/CertificatesOfOrigin/", cert_payload, format="json"
+    )
+    assert resp.status_code == 201, resp.content
+    cert_id = resp.json()["id"]
+    attachment_url = f"http://testserver/api/documents/v0/CertificatesOfOrigin/{cert_id}/attachment/"
+
+    # the link by default, the file isn't read
+    with mock.patch("django.db.models.fields.files.FieldFile.read") as file_read:
+        resp = c.get(f"/api/documents/v0/CertificatesOfOrigin/{cert_id}/")
+        file_read.assert_not_called()
+    assert resp.status_code == 200
+    assert resp.json()["certificateOfOrigin"]["attachedFile"] == {
+        "uri": attachment_url,
+        "mimeCode": "application/pdf",
+    }
+    assert resp.json()["OA"]["qrcode"]
+
+    # the cached OA url follows the settings
+    settings.UA_BASE_HOST = "https://other-verifier.example"
+    resp = c.get(f"/api/documents/v0/CertificatesOfOrigin/{cert_id}/")
+    assert resp.json()["OA"]["url"].startswith("https://other-verifier.example?q=")
+
+    # base64 on request, rendered once per file version
+    for _ in range(2):
+        resp = c.get(f"/api/documents/v0/CertificatesOfOrigin/{cert_id}/?include=attachment")
+        assert resp.status_code == 200
+        assert resp.json()["certificateOfOrigin"]["attachedFile"] == {
+            "file": base64.b64encode(b"the file content").decode(),
+            "encodingCode": "base64",
+            "mimeCode": "application/pdf",
+        }
+        assert "attachedFile" not in Document.objects.get(pk=cert_id).raw_certificate_data["certificateOfOrigin"]
+
+    # large files aren't cached
+    with mock.patch.object(CertificateSerializer, "ATTACHMENT_CACHE_MAX_SIZE", 1), mock.patch(
+        "trade_portal.document_api.serializers.cache"
+    ) as cache_mock:
+        cache_mock.get.return_value = None
+        resp = c.get(f"/api/documents/v0/CertificatesOfOrigin/{cert_id}/?include=attachment")
+    assert resp.json()["certificateOfOrigin"]["attachedFile"]["file"] == base64.b64encode(b"the file content").decode()
+    assert not [call for call in cache_mock.set.call_args_list if call[0][0].startswith("docapi_attachment_")]
+
+    # streamed file
+    resp = c.get(attachment_url)
+    assert resp.status_code == 200
+    assert b"".join(resp.streaming_content) == b"the file content"
+
+    # or presigned storage url
+    with override_settings(DOCUMENT_API_ATTACHMENT_URL_EXPIRY=60):
+        resp = c.get(attachment_url)
+    assert resp.status_code == 302
+    assert "Signature" in resp["Location"]
+
+
 def test_org_permission_to_create(docapi_env):
     t1 = docapi_env["t1"]
     t2 = docapi_env["t2"]
@@ -312,3 +386,192 @@ def test_very_wrong_payloads(docapi_env):
     )
     assert resp.status_code == 400, resp.content
     assert resp.json() == {"exportCountry": "must be a dict with code key"}
+
+
+def test_schema_errors_reported_at_once(docapi_env):
+    c = APIClient()
+    c.credentials(HTTP_AUTHORIZATION=f'Token {docapi_env["t1"].access_token}')
+
+    payload = copy.deepcopy(CERT_EXAMPLE)
+    payload["certificateOfOrigin"].update({
+        "isPreferential": "yes",
+        "attachedFile": {"some": "field"},
+    })
+    resp = c.post(
+        "/api/documents/v0/CertificatesOfOrigin/", payload, format="json"
+    )
+    assert resp.status_code == 400
+    assert resp.json() == {
+        "schema": [
+            "'yes' is not of type 'boolean'",
+            "'file' is a required property",
+        ]
+    }
+    assert Document.objects.count() == 0
+
+
+def test_cert_schema_validator_reused():
+    validator = get_cert_schema_validator()
+    assert get_cert_schema_validator() is validator
+
+    # resolver keeps state while validating so every thread has own validator,
+    # but downloaded remote $refs are shared
+    other_thread_validators = []
+    thread = threading.Thread(target=lambda: other_thread_validators.append(get_cert_schema_validator()))
+    thread.start()
+    thread.join()
+    assert other_thread_validators[0] is not validator
+    assert other_thread_validators[0].resolver.store is validator.resolver.store
+
+
+def _bulk_payloads(count):
+    payloads = []
+    for i in range(count):
+        payload = copy.deepcopy(CERT_EXAMPLE)
+        payload["certificateOfOrigin"].pop("attachedFile", None)
+        payload["certificateOfOrigin"]["id"] = f"BULKCERT{i}"
+        payloads.append(payload)
+    return payloads
+
+
+def test_bulk_create(docapi_env):
+    c = APIClient()
+    c.credentials(HTTP_AUTHORIZATION=f'Token {docapi_env["t1"].access_token}')
+
+    payloads = _bulk_payloads(3)
+    payloads[1]["certificateOfOrigin"]["freeTradeAgreement"] = "Unknown FTA"
+    payloads[2]["certificateOfOrigin"]["attachedFile"] = {
+        "file": base64.b64encode(b"the file content").decode(),
+        "encodingCode": "base64",
+        "mimeCode": "application/pdf",
+    }
+    payloads.append({"certificateOfOrigin": {"attachedFile": ["a", "b"]}})
+    payloads.append({"not": "expected"})
+
+    with mock.patch("trade_portal.document_api.bulk.default_storage") as storage_mock:
+        storage_mock.save.side_effect = lambda name, content: name
+        resp = c.post("/api/documents/v0/CertificatesOfOrigin/bulk/", payloads, format="json")
+    assert resp.status_code == 207, resp.content
+    results = resp.json()["results"]
+    assert [r["status"] for r in results] == ["created", "invalid", "created", "invalid", "invalid"]
+    assert [r["index"] for r in results] == [0, 1, 2, 3, 4]
+    assert results[1]["errors"] == {
+        "freeTradeAgreement": (
+            "Doesn't exist in the system, possible choices are "
+            "AANZFTA First Protocol, China-Australia Free Trade Agreement"
+        )
+    }
+    assert results[3]["errors"] == {
+        "schema": [
+            "'isPreferential' is a required property",
+            "'supplyChainConsignment' is a required property",
+            "['a', 'b'] is not of type 'object'",
+        ]
+    }
+    assert results[4]["errors"] == {"payload": "certificateOfOrigin must be provided"}
+
+    assert Document.objects.count() == 2
+    assert DocumentFile.objects.count() == 1
+    # uploaded after the commit, under the name already stored
+    storage_mock.save.assert_called_once()
+    assert storage_mock.save.call_args[0][0] == DocumentFile.objects.get().file.name
+    cert = Document.objects.get(pk=results[0]["id"])
+    assert cert.document_number == "BULKCERT0"
+    assert cert.fta.name == "China-Australia Free Trade Agreement"
+    assert cert.oa and cert.oa.created_for == docapi_env["t1"].org
+    assert cert.issuer.name == "Australian Grape and Wine Incorporated"
+    assert cert.exporter.clear_business_id == "55004094599"
+    assert cert.importer_name == "East meets west fine wines id:emw-wines.com"
+    assert cert.search_field
+    # parties are shared, not created per certificate
+    assert Party.objects.count() == 2
+
+    # the same data as the single certificate endpoint returns
+    resp = c.get(f"/api/documents/v0/CertificatesOfOrigin/{cert.pk}/")
+    assert resp.status_code == 200
+    assert resp.json()["certificateOfOrigin"]["id"] == "BULKCERT0"
+
+
+def test_bulk_create_upload_failed(docapi_env):
+    c = APIClient()
+    c.credentials(HTTP_AUTHORIZATION=f'Token {docapi_env["t1"].access_token}')
+
+    payloads = _bulk_payloads(2)
+    for i, payload in enumerate(payloads):
+        payload["certificateOfOrigin"]["attachedFile"] = {
+            "file": base64.b64encode(f"the file content {i}".encode()).decode(),
+            "encodingCode": "base64",
+            "mimeCode": "application/pdf",
+        }
+
+    def save(name, content):
+        if content.read() == b"the file content 0":
+            raise ConnectionError()
+        return name
+
+    with mock.patch("trade_portal.document_api.bulk.default_storage") as storage_mock:
+        storage_mock.save.side_effect = save
+        resp = c.post("/api/documents/v0/CertificatesOfOrigin/bulk/", payloads, format="json")
+    # the certificates are created and the other uploads are done
+    assert resp.status_code == 201, resp.content
+    assert storage_mock.save.call_count == 2
+    results = resp.json()["results"]
+    failed = DocumentFile.objects.get(doc_id=results[0]["id"])
+    assert failed.metadata["upload_failed"] is True
+    assert "upload_failed" not in DocumentFile.objects.get(doc_id=results[1]["id"]).metadata
+
+
+def test_bulk_create_ndjson(docapi_env):
+    c = APIClient()
+    c.credentials(HTTP_AUTHORIZATION=f'Token {docapi_env["t1"].access_token}')
+
+    body = "\n".join(json.dumps(payload) for payload in _bulk_payloads(2)) + "\n"
+    resp = c.post(
+        "/api/documents/v0/CertificatesOfOrigin/bulk/", body, content_type="application/x-ndjson"
+    )
+    assert resp.status_code == 201, resp.content
+    assert [r["status"] for r in resp.json()["results"]] == ["created", "created"]
+    assert Document.objects.count() == 2
+
+    resp = c.post(
+        "/api/documents/v0/CertificatesOfOrigin/bulk/", '{"a": 1}\n{broken', content_type="application/x-ndjson"
+    )
+    assert resp.status_code == 400
+    assert "line 2" in resp.json()["detail"]
+
+    # regulator can't create certificates
+    c.credentials(HTTP_AUTHORIZATION=f'Token {docapi_env["t2"].access_token}')
+    resp = c.post("/api/documents/v0/CertificatesOfOrigin/bulk/", _bulk_payloads(1), format="json")
+    assert resp.status_code == 405
+
+
+def test_bulk_create_queries(docapi_env):
+    """
+    Bulk creation takes the same number of queries for any number of certificates,
+    while the single certificate endpoint takes a few queries per certificate
+    """
+    c = APIClient()
+    c.credentials(HTTP_AUTHORIZATION=f'Token {docapi_env["t1"].access_token}')
+
+    def count_queries(func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return len(context.captured_queries)
+
+    def single(count):
+        for payload in _bulk_payloads(count):
+            resp = c.post("/api/documents/v0/CertificatesOfOrigin/", payload, format="json")
+            assert resp.status_code == 201
+
+    def bulk(count):
+        resp = c.post("/api/documents/v0/CertificatesOfOrigin/bulk/", _bulk_payloads(count), format="json")
+        assert resp.status_code == 201
+
+    # parties are created by the first call
+    bulk(1)
+
+    single_queries = count_queries(lambda: single(10))
+    bulk_queries = count_queries(lambda: bulk(10))
+    assert count_queries(lambda: bulk(2)) == bulk_queries
+    assert bulk_queries * 5 < single_queries
+    assert Document.objects.count() == 1 + 10 + 10 + 2
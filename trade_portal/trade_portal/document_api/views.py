@@ -1,8 +1,10 @@
 import json
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
 from django.db import transaction
-from django.http import Http404
+from django.http import FileResponse, Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.utils.functional import cached_property
 from rest_framework import (
@@ -14,9 +16,13 @@ from rest_framework import (
     status,
     exceptions,
 )
+from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 
+from trade_portal.document_api.bulk import BulkCertificateCreator
+from trade_portal.document_api.parsers import NDJSONParser
 from trade_portal.document_api.serializers import (
     CertificateSerializer,
     ShortCertificateSerializer,
@@ -93,6 +99,7 @@ class CertificateViewSet(
 ):
     queryset = Document.objects.all()
     pagination_class = PaginationBy10
+    bulk_max_certificates = 5000
 
     def get_queryset(self):
         """
@@ -155,6 +162,9 @@ class CertificateViewSet(
         """
         kwargs["user"] = self.request.user
         kwargs["org"] = self.current_org
+        kwargs["request"] = self.request
+        # ?include=attachment to get the PDF file base64 in the certificate body
+        kwargs["include_attachment"] = "attachment" in self.request.GET.get("include", "").split(",")
         if self.request.method == "GET" and "pk" not in self.kwargs:
             ser_cls = ShortCertificateSerializer(*args, **kwargs)
         else:
@@ -171,10 +181,58 @@ class CertificateViewSet(
     def retrieve(self, request, pk=None):
         return Response(self.get_serializer(self.get_object()).data)
 
+    @action(
+        detail=False, methods=["post"], url_path="bulk",
+        parser_classes=[JSONParser, NDJSONParser],
+    )
+    def bulk(self, request):
+        """
+        Create many certificates by a single request: JSON list or
+        NDJSON (application/x-ndjson), one certificate body per item/line.
+        Returns result per item, 201 if all of them are created and
+        207 if some are invalid
+        """
+        if not self.current_org.can_issue_certificates:
+            raise exceptions.MethodNotAllowed(
+                "POST", detail="This organisation can't create certificates"
+            )
+        payloads = request.data
+        if not isinstance(payloads, list) or not payloads:
+            raise serializers.ValidationError(
+                {"payload": "non-empty list of certificates is expected"}
+            )
+        if len(payloads) > self.bulk_max_certificates:
+            raise serializers.ValidationError(
+                {"payload": f"at most {self.bulk_max_certificates} certificates are accepted per request"}
+            )
+        results = BulkCertificateCreator(request.user, self.current_org).create(payloads)
+        if all(result["status"] == "created" for result in results):
+            response_status = status.HTTP_201_CREATED
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response({"results": results}, status=response_status)
+
 
 class CertificateFileView(QsMixin, views.APIView):
     # a little too raw view, but given the complicated nature of the request
 
+    def get(self, request, *args, **kwargs):
+        """
+        The certificate PDF file - redirect to the presigned storage URL if enabled
+        (so the file doesn't go through the portal at all), otherwise streamed
+        """
+        doc = self.get_object()
+        pdf_attach = doc.get_pdf_attachment()
+        if not pdf_attach:
+            raise Http404()
+        if settings.DOCUMENT_API_ATTACHMENT_URL_EXPIRY:
+            return HttpResponseRedirect(
+                default_storage.url(pdf_attach.file.name, expire=settings.DOCUMENT_API_ATTACHMENT_URL_EXPIRY)
+            )
+        response = FileResponse(pdf_attach.file.open("rb"), content_type=pdf_attach.mimetype())
+        response["Content-Disposition"] = 'inline; filename="%s"' % pdf_attach.filename
+        return response
+
     def _validate_request(self):
         # do sanity check
         if not self.request.META["CONTENT_TYPE"].startswith("multipart/form-data"):
@@ -0,0 +1,78 @@
+import io
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from trade_portal.documents.services.watermark import DocumentWatermarkService
+from trade_portal.utils.qr import get_qrcode_image, get_qrcode_pdf_operators
+
+QRCODE_DATA = "https://trade.c1.devnet.trustbridge.io/v/?q=" + "x" * 300
+POSITION = (0.83, 0.96)
+
+
+def generate_pdf(pages_count, scanned):
+    """
+    A4 PDF, every page is either a text or a scanned page image (JPEG, like the scanners produce)
+    """
+    import PIL.Image
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    stream = io.BytesIO()
+    c = canvas.Canvas(stream, pagesize=A4)
+    rnd = random.Random(pages_count)
+    for page_number in range(pages_count):
+        if scanned:
+            # noise doesn't compress, so the size is close to the real scans
+            image = PIL.Image.frombytes("L", (620, 877), bytes(rnd.getrandbits(8) for _ in range(620 * 877)))
+            c.drawImage(ImageReader(image), 0, 0, width=A4[0], height=A4[1])
+        else:
+            for line in range(50):
+                c.drawString(40, A4[1] - 40 - line * 15, f"Page {page_number} line {line} " + "text " * 15)
+        c.showPage()
+    c.save()
+    return stream.getvalue()
+
+
+class Command(BaseCommand):
+    help = "Compare PDF watermarking by vector QR code incremental update with the rewriting of all pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **kwargs):
+        service = DocumentWatermarkService()
+        # both are cached per OaDetails object, so aren't measured
+        qrcode_image = get_qrcode_image(QRCODE_DATA)
+        qrcode_operators = get_qrcode_pdf_operators(QRCODE_DATA)
+        cases = (
+            ("small, 1 text page", 1, False),
+            ("medium, 10 scanned pages", 10, True),
+            ("large, 100 scanned pages", 100, True),
+        )
+        self.stdout.write(
+            f"{'PDF':<26} {'size, KB':>9} {'rewrite, s':>11} {'rewrite +KB':>12} "
+            f"{'incremental, s':>15} {'incremental +KB':>16}"
+        )
+        for name, pages_count, scanned in cases:
+            original = generate_pdf(pages_count, scanned)
+            results, outputs = [], []
+            for func in (
+                lambda: service.watermark_pdf_rewrite(io.BytesIO(original), qrcode_image, POSITION),
+                lambda: service.watermark_pdf(io.BytesIO(original), qrcode_operators, POSITION),
+            ):
+                started_at = time.perf_counter()
+                for _ in range(kwargs["repeat"]):
+                    output = func()
+                results.append((time.perf_counter() - started_at) / kwargs["repeat"])
+                outputs.append(output)
+            rewrite_time, incremental_time = results
+            # the rewrite returns the whole new file, the incremental update - only the appended bytes
+            rewrite_size, incremental_size = len(outputs[0]), len(original) + len(outputs[1])
+            self.stdout.write(
+                f"{name:<26} {len(original) // 1024:>9} {rewrite_time:>11.4f} "
+                f"{(rewrite_size - len(original)) / 1024:>12.1f} "
+                f"{incremental_time:>15.4f} {(incremental_size - len(original)) / 1024:>16.1f}"
+            )
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 import mimetypes
@@ -10,13 +11,17 @@ from urllib.parse import quote
 
 from django.conf import settings
 from django.contrib.postgres.fields import JSONField
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.db import models
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_countries.fields import CountryField
 
-from trade_portal.utils.qr import get_qrcode_image
+from trade_portal.utils.pdf_inspect import PDF_INSPECTION_VERSION, inspect_pdf
+from trade_portal.utils.qr import get_qrcode_image, get_qrcode_pdf_operators, get_qrcode_svg
 from trade_portal.utils.monitoring import statsd_timer
 
 logger = logging.getLogger(__name__)
@@ -224,17 +229,80 @@ class OaDetails(models.Model):
 
     @classmethod
     def retrieve_new(cls, for_org):
+        obj = cls.build_new(for_org)
+        obj.save(force_insert=True)
+        try:
+            # rendered once, all further usages read it from the cache
+            obj.get_qr_image()
+        except Exception as e:
+            logger.exception(e)
+        return obj
+
+    @classmethod
+    def build_new(cls, for_org):
+        # not saved yet, so many of them can be inserted by a single bulk_create
         new_uuid = uuid.uuid4()
-        obj = cls.objects.create(
+        return cls(
             id=new_uuid,
             created_for=for_org,
             uri=f"{settings.BASE_URL}/oa/{str(new_uuid)}/",
             key=cls._generate_aes_key(),
         )
-        return obj
 
-    def get_qr_image(self):
-        return get_qrcode_image(self.url_repr())
+    QR_RENDERERS = {
+        "png": get_qrcode_image,
+        "svg": get_qrcode_svg,
+        # content stream operators drawing the vector QR code in the 1x1 square
+        "pdfops": get_qrcode_pdf_operators,
+    }
+    # scaled by the caller, so rendered without the box size
+    QR_UNSIZED_FORMATS = {"pdfops"}
+    QR_CACHE_TIMEOUT = 3600 * 24 * 7
+
+    def get_qr_image(self, box_size=None):
+        return self.get_qr_artifact("png", box_size)
+
+    def get_qr_svg(self, box_size=None):
+        return self.get_qr_artifact("svg", box_size)
+
+    def get_qr_pdf_operators(self):
+        return self.get_qr_artifact("pdfops")
+
+    def get_qr_artifact(self, fmt, box_size=None):
+        """
+        QR code of url_repr rendered to PNG, SVG or PDF operators.
+        The uri and key never change once generated, so the result is saved
+        to the storage next to other OA files and memoised in the cache for hot reads
+        """
+        if fmt in self.QR_UNSIZED_FORMATS:
+            box_size = None
+        else:
+            box_size = box_size or settings.QR_CODE_BOX_SIZE
+        url = self.url_repr()
+        if not self.uri or not self.key:
+            # incoming document which values aren't known yet
+            return self._render_qr(fmt, url, box_size)
+
+        # url depends on settings as well, so it's a part of the name
+        url_digest = hashlib.md5(url.encode("utf-8")).hexdigest()
+        size_suffix = f"-{box_size}" if box_size else ""
+        filename = f"oa-qr/{self.pk}/{url_digest}{size_suffix}.{fmt}"
+        cache_key = f"oa_qr_{self.pk}_{url_digest}{size_suffix}_{fmt}"
+        content = cache.get(cache_key)
+        if content is None:
+            if default_storage.exists(filename):
+                with default_storage.open(filename) as f:
+                    content = f.read()
+            else:
+                content = self._render_qr(fmt, url, box_size)
+                default_storage.save(filename, ContentFile(content))
+            cache.set(cache_key, content, self.QR_CACHE_TIMEOUT)
+        return content
+
+    def _render_qr(self, fmt, url, box_size):
+        if box_size is None:
+            return self.QR_RENDERERS[fmt](url)
+        return self.QR_RENDERERS[fmt](url, box_size=box_size)
 
     def get_qr_image_base64(self):
         return b64encode(self.get_qr_image()).decode("utf-8")
@@ -613,6 +681,30 @@ class DocumentFile(models.Model):
             self.original_file = self.file
         super().save(*args, **kwargs)
 
+    def get_pdf_info(self) -> dict:
+        """
+        Facts about the original PDF (pages count and boxes, encryption, images)
+        collected by the single parse after the upload (fill_document_metadata task),
+        see trade_portal.utils.pdf_inspect for the format.
+        Files uploaded before that are inspected on the first access
+        """
+        info = self.metadata.get("pdf") or {}
+        if info.get("version") != PDF_INSPECTION_VERSION:
+            info = self.update_pdf_info()
+        return info
+
+    def update_pdf_info(self) -> dict:
+        source = self.original_file or self.file
+        source.open("rb")
+        try:
+            info = inspect_pdf(source)
+        finally:
+            source.close()
+        self.metadata["pdf"] = info
+        if not self._state.adding:
+            self.save(update_fields=["metadata"])
+        return info
+
     @property
     def short_filename(self):
         if len(self.filename) > 25:
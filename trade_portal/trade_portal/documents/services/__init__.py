@@ -1,7 +1,62 @@
+import threading
+
 from django.conf import settings
 
 from intergov_client import IntergovClient
 from intergov_client.auth import DjangoCachedCognitoOIDCAuth, DumbAuth
+from intergov_client.transport import Transport
+from trade_portal.utils.monitoring import statsd_counter, statsd_timer
+
+_ig_transport = None
+_ig_transport_lock = threading.Lock()
+
+
+def get_ig_transport() -> Transport:
+    """
+    The process-wide transport, so all the IGL calls reuse the keep-alive connections
+    """
+    global _ig_transport
+    with _ig_transport_lock:
+        if _ig_transport is None:
+            _ig_transport = Transport(
+                connect_timeout=settings.IGL_CONNECT_TIMEOUT,
+                read_timeout=settings.IGL_READ_TIMEOUT,
+                retries=settings.IGL_RETRIES,
+                timer=statsd_timer,
+                counter=statsd_counter,
+            )
+        return _ig_transport
+
+
+def get_ig_auth():
+    if settings.IGL_OAUTH_WELLKNOWN_URL:
+        ig_token_url = DjangoCachedCognitoOIDCAuth.resolve_wellknown_to_token_url(
+            settings.IGL_OAUTH_WELLKNOWN_URL
+        )
+        return DjangoCachedCognitoOIDCAuth(
+            token_url=ig_token_url,
+            client_id=settings.IGL_OAUTH_CLIENT_ID,
+            client_secret=settings.IGL_OAUTH_CLIENT_SECRET,
+            scope=settings.IGL_OAUTH_SCOPES,
+        )
+    return DumbAuth()
+
+
+def get_async_ig_client():
+    """
+    For the code making many independent IGL calls, see intergov_client/async_client.py
+    """
+    from intergov_client.async_client import AsyncIntergovClient
+
+    return AsyncIntergovClient(
+        country=settings.ICL_APP_COUNTRY,
+        endpoints=settings.IGL_APIS,
+        auth_class=get_ig_auth(),
+        concurrency=settings.IGL_ASYNC_CONCURRENCY,
+        connect_timeout=settings.IGL_CONNECT_TIMEOUT,
+        read_timeout=settings.IGL_READ_TIMEOUT,
+        retries=settings.IGL_RETRIES,
+    )
 
 
 class BaseIgService:
@@ -16,21 +71,10 @@ class BaseIgService:
         self.ig_client = ig_client
 
     def _get_ig_client(self) -> IntergovClient:
-        if settings.IGL_OAUTH_WELLKNOWN_URL:
-            ig_token_url = DjangoCachedCognitoOIDCAuth.resolve_wellknown_to_token_url(
-                settings.IGL_OAUTH_WELLKNOWN_URL
-            )
-            ig_auth_class = DjangoCachedCognitoOIDCAuth(
-                token_url=ig_token_url,
-                client_id=settings.IGL_OAUTH_CLIENT_ID,
-                client_secret=settings.IGL_OAUTH_CLIENT_SECRET,
-                scope=settings.IGL_OAUTH_SCOPES,
-            )
-        else:
-            ig_auth_class = DumbAuth()
         ig_client = IntergovClient(
             country=settings.ICL_APP_COUNTRY,
             endpoints=settings.IGL_APIS,
-            auth_class=ig_auth_class,
+            auth_class=get_ig_auth(),
+            transport=get_ig_transport(),
         )
         return ig_client
@@ -2,11 +2,13 @@
 Various services and helpers related to IGL communication
 Sending/receiving/processing messages and working with IGL API
 """
+import asyncio
 import json
 import logging
 
 from constance import config
 from django.conf import settings
+from django.db import transaction
 from django.urls import reverse
 from django.utils import timezone
 
@@ -18,7 +20,7 @@ from trade_portal.documents.models import (
     NodeMessage,
     OaDetails,
 )
-from trade_portal.documents.services import BaseIgService
+from trade_portal.documents.services import BaseIgService, get_async_ig_client
 
 logger = logging.getLogger(__name__)
 
@@ -254,6 +256,7 @@ class IGLService(BaseIgService):
                 ),
             )
             if created:
+                self._render_received_history_item(msg).save()
                 msg.trigger_processing()
             else:
                 logger.info(
@@ -261,7 +264,92 @@ class IGLService(BaseIgService):
                 )
         return True
 
-    def _start_new_conversation(self, message_body: dict) -> None:
+    def store_messages_by_ping_bodies(self, ping_bodies: list) -> int:
+        """
+        The batch version of store_message_by_ping_body for the notification bursts:
+        the messages are retrieved concurrently, the conversations are found
+        by a single query and the messages are inserted at once.
+        Returns the number of messages added to the existing conversations
+        """
+        sender_refs = list(dict.fromkeys(ping_body["sender_ref"] for ping_body in ping_bodies))
+        retrieved = self._retrieve_messages(sender_refs)
+        msg_bodies = []
+        for sender_ref in sender_refs:
+            if not retrieved.get(sender_ref):
+                logger.error(
+                    "Processing notification about message %s which can't "
+                    "be retrieved from the message API", sender_ref
+                )
+                continue
+            msg_bodies.append(retrieved[sender_ref])
+
+        known_sender_refs = set(
+            NodeMessage.objects.filter(
+                sender_ref__in=[msg_body["sender_ref"] for msg_body in msg_bodies]
+            ).values_list("sender_ref", flat=True)
+        )
+        # the document of the latest message with the same subject
+        conversations = dict(
+            NodeMessage.objects.exclude(document__isnull=True)
+            .filter(subject__in={msg_body["subject"] for msg_body in msg_bodies})
+            .order_by("created_at")
+            .values_list("subject", "document_id")
+        )
+
+        new_messages = []
+        for msg_body in msg_bodies:
+            if msg_body["sender_ref"] in known_sender_refs:
+                logger.info("Message %s is already in the system", msg_body["sender_ref"])
+                continue
+            known_sender_refs.add(msg_body["sender_ref"])
+            document_id = conversations.get(msg_body["subject"])
+            if document_id is None:
+                logger.info("Starting a new document/conversation for %s", msg_body)
+                new_doc = self._start_new_conversation(msg_body)
+                if new_doc:
+                    # the next messages of the batch join it
+                    conversations[msg_body["subject"]] = new_doc.pk
+                continue
+            new_messages.append(
+                NodeMessage(
+                    sender_ref=msg_body["sender_ref"],
+                    document_id=document_id,
+                    status=NodeMessage.STATUS_INBOUND,
+                    subject=msg_body["subject"],
+                    is_outbound=False,
+                    body=msg_body,
+                    history=[
+                        f"Received at {timezone.now()}",
+                    ],
+                )
+            )
+
+        with transaction.atomic():
+            NodeMessage.objects.bulk_create(new_messages)
+            DocumentHistoryItem.objects.bulk_create(
+                [self._render_received_history_item(msg) for msg in new_messages]
+            )
+        for msg in new_messages:
+            msg.trigger_processing()
+        return len(new_messages)
+
+    def _retrieve_messages(self, sender_refs: list) -> dict:
+        async def retrieve():
+            async with get_async_ig_client() as ig_client:
+                return await ig_client.retrieve_messages(sender_refs)
+
+        return asyncio.run(retrieve())
+
+    def _render_received_history_item(self, msg: NodeMessage) -> DocumentHistoryItem:
+        return DocumentHistoryItem(
+            type="nodemessage",
+            document_id=msg.document_id,
+            message="The message has been received",
+            object_body=json.dumps(msg.body),
+            linked_obj_id=msg.pk,
+        )
+
+    def _start_new_conversation(self, message_body: dict) -> Document:
         from trade_portal.documents.tasks import process_incoming_document_received
 
         NEW_DOC_PREDICATES = [
@@ -274,7 +362,7 @@ class IGLService(BaseIgService):
                 "Received conversation starting message with predicate %s which is not a document-starting",
                 message_body["predicate"],
             )
-            return
+            return None
 
         oad = OaDetails.objects.create(
             created_for=None,
@@ -317,4 +405,4 @@ class IGLService(BaseIgService):
             linked_obj_id=msg.pk,
         )
         process_incoming_document_received.apply_async([new_doc.pk], countdown=2)
-        return
+        return new_doc
@@ -2,14 +2,17 @@
 Services related to incoming messages - parsing them and saving to the DB
 """
 import base64
+import hashlib
 import json
 import logging
+import os
+import tempfile
 import uuid
 
 import dateutil.parser
 import requests
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.core.files.base import File
 from django.core.files.storage import default_storage
 
 from trade_portal.documents.models import (
@@ -24,6 +27,11 @@ from trade_portal.edi3.utils import party_from_json
 
 logger = logging.getLogger(__name__)
 
+# the incoming objects and attachments are kept in memory until this size, then on the disk
+SPOOL_MAX_SIZE = 1024 * 1024
+# streamed bodies chunk, multiple of 4 to decode the base64 attachments by chunks
+CHUNK_SIZE = 64 * 1024
+
 
 class IncomingDocumentProcessingError(Exception):
     def __init__(self, *args, **kwargs):
@@ -31,43 +39,74 @@ class IncomingDocumentProcessingError(Exception):
         super().__init__(*args, **kwargs)
 
 
+class KeepOpenFile(File):
+    """
+    The S3 upload (s3transfer) closes the uploaded file,
+    but the obj file is read again after it's saved
+    """
+
+    def close(self):
+        pass
+
+
 class IncomingDocumentService(BaseIgService):
     def process_new(self, doc: Document):
-        from trade_portal.documents.tasks import document_oa_verify
-
         DocumentHistoryItem.objects.create(
             type="text",
             document=doc,
             message="Started the incoming document retrieval...",
         )
         # 1. Download the obj from the document API
+        # the obj could be big (the attachments), so it's downloaded and uploaded
+        # without being read into memory; parsing it does that, see get_incoming_document_format
+        obj_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
         try:
-            binary_obj_content = self.ig_client.retrieve_document(
-                doc.intergov_details["obj"],
-            )
+            obj_hash = self._download_obj(doc.intergov_details["obj"], obj_file)
         except Exception as e:
+            obj_file.close()
             raise IncomingDocumentProcessingError(str(e), is_retryable=True)
+        with obj_file:
+            return self._process_obj(doc, obj_file, obj_hash)
+
+    def _download_obj(self, obj_multihash: str, obj_file) -> str:
+        """
+        Write the obj content to the obj_file, return its sha256
+        """
+        obj_hash = hashlib.sha256()
+        for chunk in self.ig_client.retrieve_document_stream(obj_multihash):
+            obj_hash.update(chunk)
+            obj_file.write(chunk)
+        obj_file.seek(0)
+        return obj_hash.hexdigest()
+
+    def _process_obj(self, doc: Document, obj_file, obj_hash: str):
+        from trade_portal.documents.tasks import document_oa_verify
+
         # 2. Save the object somewhere (it could be binary or text file)
         # do we have it already?
         try:
             the_file = DocumentFile.objects.filter(
                 doc=doc, filename=doc.intergov_details["obj"]
             ).first()
+            obj_size = obj_file.seek(0, os.SEEK_END)
+            obj_file.seek(0)
             if the_file:
                 logger.info("We already have that file, funny")
             else:
                 the_file = DocumentFile.objects.create(
                     doc=doc,
                     filename=doc.intergov_details["obj"],
-                    size=len(binary_obj_content),
+                    size=obj_size,
                 )
 
+            # streamed from the spooled file (the multipart upload for S3)
             path = default_storage.save(
                 f'incoming/{doc.id}/{doc.intergov_details["obj"]}.json',
-                ContentFile(binary_obj_content),
+                KeepOpenFile(obj_file),
             )
             # TODO: kill the old file before?
             the_file.file = path
+            the_file.metadata["sha256"] = obj_hash
             the_file.save()
         except Exception as e:
             DocumentHistoryItem.objects.create(
@@ -90,7 +129,8 @@ class IncomingDocumentService(BaseIgService):
         )
         # we have saved the obj file, now we are able to parse it
         try:
-            self.get_incoming_document_format(doc, binary_obj_content)
+            obj_file.seek(0)
+            self.get_incoming_document_format(doc, obj_file)
         except Exception as e:
             logger.exception(e)
             self._complain_and_die(
@@ -101,9 +141,18 @@ class IncomingDocumentService(BaseIgService):
         document_oa_verify.apply_async(args=[doc.pk], countdown=10)
         return True
 
-    def get_incoming_document_format(self, doc: Document, binary_obj_content):
+    def get_incoming_document_format(self, doc: Document, obj_file):
+        """
+        Parse the obj and process the unwrapped OA document.
+
+        Memory: the parsed obj (attachments included) is held only until its OA version
+        is known; the unwrap request body is streamed from the obj file. The unwrap response
+        is read entirely and parsed, and the unwrapped document is kept while processed,
+        because it's saved to intergov_details; so peak memory is about two copies of the
+        document. Attachments are decoded and saved by chunks without copying their content.
+        """
         try:
-            json_content = json.loads(binary_obj_content)
+            json_content = json.load(obj_file)
         except Exception:
             json_content = None
 
@@ -145,15 +194,13 @@ class IncomingDocumentService(BaseIgService):
             object_body=oa_version,
         )
 
+        # the request body is streamed from the obj file, no need to keep the parsed copy
+        del json_content
         try:
             unwrapped_oa = requests.post(
                 settings.OA_WRAP_API_URL + "/document/unwrap",
-                json={
-                    "document": json_content,
-                    "params": {
-                        "version": oa_version,
-                    },
-                },
+                data=self._iter_unwrap_request(obj_file, oa_version),
+                headers={"Content-Type": "application/json"},
             ).json()
         except Exception as e:
             logger.exception(e)
@@ -177,6 +224,34 @@ class IncomingDocumentService(BaseIgService):
             )
         return True
 
+    def _iter_unwrap_request(self, obj_file, oa_version):
+        """
+        {"document": <the obj>, "params": {"version": oa_version}} by chunks
+        """
+        yield b'{"document": '
+        obj_file.seek(0)
+        yield from iter(lambda: obj_file.read(CHUNK_SIZE), b"")
+        yield (', "params": ' + json.dumps({"version": oa_version}) + "}").encode("utf-8")
+
+    def _save_base64_file(self, path: str, base64_content: str):
+        """
+        Decode the base64 content and save it to the storage by chunks,
+        return the saved file path and size
+        """
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as bin_file:
+            # the line breaks are dropped per chunk, the rest of a chunk
+            # which isn't a multiple of 4 goes to the next one
+            tail = ""
+            for start in range(0, len(base64_content), CHUNK_SIZE):
+                chunk = tail + "".join(base64_content[start:start + CHUNK_SIZE].split())
+                decodable = len(chunk) - len(chunk) % 4
+                bin_file.write(base64.b64decode(chunk[:decodable]))
+                tail = chunk[decodable:]
+            bin_file.write(base64.b64decode(tail))
+            size = bin_file.tell()
+            bin_file.seek(0)
+            return default_storage.save(path, File(bin_file)), size
+
     def _process_oa2_document(self, doc: Document, data: dict):
         # format of each dict: type, filename, data
         if "certificateOfOrigin" in data:
@@ -203,18 +278,16 @@ class IncomingDocumentService(BaseIgService):
         if unCoOattachedFile:
             file_mimecode = unCoOattachedFile["mimeCode"]
             file_ext = file_mimecode.rsplit("/")[-1].lower()
-            bin_file = base64.b64decode(unCoOattachedFile["file"].encode("utf-8"))
-            af = DocumentFile.objects.create(
+            path, size = self._save_base64_file(
+                f"incoming/{doc.id}/attach-{str(uuid.uuid4())}", unCoOattachedFile["file"]
+            )
+            DocumentFile.objects.create(
                 doc=doc,
                 filename=f"file.{file_ext}" if file_ext else "unknown.bin",
-                size=len(bin_file),
+                size=size,
                 is_watermarked=None,
+                file=path,
             )
-            path = default_storage.save(
-                f"incoming/{doc.id}/attach-{str(uuid.uuid4())}", ContentFile(bin_file)
-            )
-            af.file = path
-            af.save()
 
         # parse FTA and other things
         try:
@@ -279,17 +352,15 @@ class IncomingDocumentService(BaseIgService):
 
         # parse attachments
         for attach in data.pop("attachments", []) or []:
-            bin_file = base64.b64decode(attach["data"].encode("utf-8"))
-            af = DocumentFile.objects.create(
+            path, size = self._save_base64_file(
+                f"incoming/{doc.id}/attach-{str(uuid.uuid4())}", attach["data"]
+            )
+            DocumentFile.objects.create(
                 doc=doc,
                 filename=attach.get("filename") or "unknown.bin",
-                size=len(bin_file),
-            )
-            path = default_storage.save(
-                f"incoming/{doc.id}/attach-{str(uuid.uuid4())}", ContentFile(bin_file)
+                size=size,
+                file=path,
             )
-            af.file = path
-            af.save()
 
         # parse metadata
         try:
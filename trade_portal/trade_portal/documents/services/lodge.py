@@ -15,7 +15,7 @@ from trade_portal.documents.models import (
 from trade_portal.documents.services.encryption import AESCipher
 from trade_portal.documents.services.igl import IGLService
 from trade_portal.documents.services.notarize import NotaryService
-from trade_portal.documents.services.oa import OaApiRestClient, OaV2Renderer
+from trade_portal.documents.services.oa import OaV2Renderer, get_oa_client
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +23,7 @@ logger = logging.getLogger(__name__)
 class DocumentService:
     def __init__(self, oa_client=None, *args, **kwargs):
         if not oa_client:
-            oa_client = OaApiRestClient()
+            oa_client = get_oa_client()
         self.oa_client = oa_client
         self.ig_client = kwargs.pop("ig_client", None)
         super().__init__(*args, **kwargs)
@@ -60,9 +60,7 @@ class DocumentService:
             ),
         )
 
-        # step 3, slow: wrap OA document using external api for wrapping documents
-        # TODO: think about replacing by native solution (won't give much performance increase)
-        # https://github.com/Open-Attestation/open-attestation/blob/master/src/2.0/wrap.ts#L25
+        # step 3: wrap OA document (natively or using external api, see OA_WRAP_MODE)
         try:
             oa_doc_wrapped_resp = self.oa_client.wrap_document(oa_doc)
             if oa_doc_wrapped_resp.status_code != 200:
@@ -4,12 +4,13 @@ import requests
 from django.conf import settings
 
 from trade_portal.documents.models import Document
+from trade_portal.utils import oa_v2
 
 
 class OaApiRestClient:
     """
-    Client working with our OA wrap API, moved out for easy mocking in tests,
-    code separation and possible replacement by native code
+    Client working with our OA wrap API, moved out for easy mocking in tests
+    and code separation; used when OA_WRAP_MODE is "api"
     """
 
     def wrap_document(self, oa_doc):
@@ -26,6 +27,42 @@ class OaApiRestClient:
         )
 
 
+class OaWrapResult:
+    """
+    The subset of requests.Response interface used by the wrap callers,
+    so the native client is a drop-in replacement for the REST one
+    """
+    status_code = 200
+
+    def __init__(self, wrapped_document: dict):
+        self._wrapped_document = wrapped_document
+        # JSON.stringify() output, exactly what the OA API responds with
+        self.content = oa_v2.to_json(wrapped_document).encode("utf-8")
+
+    def json(self):
+        return self._wrapped_document
+
+
+class OaNativeClient:
+    """
+    In-process OA v2 wrapping, producing the same result as the OA wrap API
+    but without sending (possibly big) documents over the network
+    """
+
+    def wrap_document(self, oa_doc):
+        return OaWrapResult(oa_v2.wrap_document(oa_doc))
+
+
+def get_oa_client():
+    """
+    Return the wrapping client according to the OA_WRAP_MODE setting;
+    the REST API is the fallback for setups which need the reference implementation
+    """
+    if getattr(settings, "OA_WRAP_MODE", "native") == "api":
+        return OaApiRestClient()
+    return OaNativeClient()
+
+
 class OaV2Renderer:
 
     def render_oa_v2_document(self, document: Document, subject: str) -> dict:
@@ -1,4 +1,3 @@
-import io
 import logging
 import os
 import subprocess
@@ -35,27 +34,27 @@ class MetadataExtractService:
 
     @classmethod
     def extract_docfile_tesseract(cls, docfile):
-        # pdf2image pypdf2
+        # pdf2image
         from pdf2image import convert_from_bytes
-        from PyPDF2 import PdfFileWriter, PdfFileReader
 
         # import time
 
-        # First we get only the first page of the document
-        incoming_pdf = PdfFileReader(docfile.file)
-        first_page_document = PdfFileWriter()
-        first_page_document_file = io.BytesIO()
-        first_page_document.addPage(incoming_pdf.getPage(0))
-        first_page_document.write(first_page_document_file)
-        first_page_document_file.seek(0)
+        pdf_info = docfile.get_pdf_info()
+        if pdf_info["unparseable"] or not pdf_info["pages"]:
+            logger.info("The %s can't be parsed, not extracting the text", docfile)
+            return {}
 
-        # convert to PNG
+        # convert to PNG only the first page of the document
+        # (pdftoppm renders only the requested pages, no need to cut it from the PDF)
+        docfile.file.open("rb")
         with tempfile.TemporaryDirectory(prefix="ocr_data_") as tmp_dir:
             images = convert_from_bytes(
-                first_page_document_file.read(),
+                docfile.file.read(),
                 dpi=300,
                 fmt="png",
                 transparent=False,
+                first_page=1,
+                last_page=1,
             )
             first_image = images[0]
             first_image.convert("RGB")
@@ -7,14 +7,21 @@ import logging
 import time
 
 from constance import config
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
 from django.core.files.storage import default_storage
+from PyPDF2.utils import PdfReadError
 
 from trade_portal.documents.models import (
     Document,
     DocumentFile,
     DocumentHistoryItem,
 )
+from trade_portal.utils.pdf_update import (
+    IncrementallyUpdatedFile,
+    PdfIncrementalUpdate,
+    PdfUpdateError,
+    append_page_content,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +34,6 @@ class DocumentWatermarkService:
     """
 
     def watermark_document(self, document: Document, force: bool = False):
-        qrcode_image = document.oa.get_qr_image()
-
         qset = document.files.all()
         if force is False:  # useful only for debug and development
             qset = qset.filter(is_watermarked=False)
@@ -36,7 +41,7 @@ class DocumentWatermarkService:
         for docfile in qset:
             if docfile.filename.lower().endswith(".pdf"):
                 t0 = time.time()
-                self._add_watermark(docfile, qrcode_image)
+                self._add_watermark(docfile, document.oa)
                 time_spent = round(time.time() - t0, 4)  # seconds
                 DocumentHistoryItem.objects.create(
                     is_error=False,
@@ -47,24 +52,118 @@ class DocumentWatermarkService:
                 )
         return
 
-    def _add_watermark(self, docfile: DocumentFile, qrcode_image) -> None:
+    def _add_watermark(self, docfile: DocumentFile, oa) -> None:
         """
         Draws given QR code over a PDF content in the top right cornder
         and re-saves the file in place with updated result
         """
+        logging.info("Adding a watermark for %s", docfile)
+        pdf_info = docfile.get_pdf_info()
+        # known from the upload inspection, no need to parse the file to fail
+        if pdf_info["encrypted"]:
+            raise PdfReadError("file has not been decrypted")
+        if pdf_info["unparseable"] or not pdf_info["pages"]:
+            raise PdfReadError("the PDF can't be parsed")
+        position = self.get_qr_position(docfile.doc)
+        mediabox = pdf_info["pages"][0]["mediabox"]
+        source = docfile.original_file or docfile.file
+        # the storage downloads the whole file (see AWS_S3_MAX_MEMORY_SIZE)
+        source.open("rb")
+        try:
+            try:
+                update = self.watermark_pdf(source, oa.get_qr_pdf_operators(), position, mediabox=mediabox)
+            except PdfUpdateError as e:
+                # the structure not allowing the incremental update, like broken xref
+                logger.warning("Can't watermark %s incrementally (%s), rewriting it", docfile, e)
+                source.seek(0)
+                content = ContentFile(self.watermark_pdf_rewrite(source, oa.get_qr_image(), position))
+            else:
+                # the original bytes followed by the update, streamed to the storage
+                content = File(IncrementallyUpdatedFile(source, update))
+
+            old_filename_parts = docfile.file.name.rsplit(".", maxsplit=1)
+            new_filename = ".".join(
+                [old_filename_parts[0].rstrip(".altered"), "altered", old_filename_parts[1]]
+            )
+            new_saved_filename = default_storage.save(new_filename, content)
+        finally:
+            source.close()
+        docfile.file = new_saved_filename
+        logger.info("Saved altered PDF file as %s", new_saved_filename)
+        docfile.is_watermarked = True
+        docfile.save()
+        return
+
+    def get_qr_position(self, document: Document):
+        """
+        Relative (0..1) position of the QR code top left corner on the page
+        """
+        x_loc = float(document.extra_data.get("qr_x_position") or 83) / 100.0
+        y_loc = 1 - float(document.extra_data.get("qr_y_position") or 4) / 100.0
+
+        if x_loc < 0:
+            x_loc = 0
+        if x_loc > 100:
+            x_loc = 100
+        if y_loc < 0:
+            y_loc = 0
+        if y_loc > 100:
+            y_loc = 100
+        return x_loc, y_loc
+
+    def _get_qr_placement(self, mediabox, position):
+        """
+        QR code bottom left corner and size, points
+        """
+        from reportlab.lib.units import mm
+
+        page_width = float(mediabox[2]) - float(mediabox[0])
+        page_height = float(mediabox[3]) - float(mediabox[1])
+        image_width = config.QR_CODE_SIZE_MM * mm
+        return (
+            page_width * position[0],
+            page_height * position[1] - image_width,
+            image_width,
+        )
+
+    def watermark_pdf(self, original, qrcode_operators: bytes, position, mediabox=None) -> bytes:
+        """
+        Draws the vector QR code (PDF path operators in the 1x1 square) in a content stream
+        appended to the first page, written as the incremental update.
+
+        Returns only the bytes to be appended to the original file (seekable file object,
+        read partially): the first page object, two small content streams and the new
+        xref section - so the update itself doesn't depend on the original file size
+        (the storage file object still holds the whole original, see _add_watermark).
+        The first page mediabox is taken from the file if not known from its inspection
+        """
+        from PyPDF2 import PdfFileReader
+
+        reader = PdfFileReader(original, strict=False)
+        update = PdfIncrementalUpdate(reader, original)
+        x, y, width = self._get_qr_placement(mediabox or reader.getPage(0).mediaBox, position)
+        append_page_content(
+            update, 0,
+            f"q {width:.3f} 0 0 {width:.3f} {x:.3f} {y:.3f} cm\n".encode() + qrcode_operators + b"Q\n"
+        )
+        return update.render()
+
+    def watermark_pdf_rewrite(self, source, qrcode_image: bytes, position) -> bytes:
+        """
+        Raster QR code merged into the first page and all pages written to the new
+        document; slow but works for PDFs which can't be updated incrementally
+        """
         # Local imports are used in case this functionality is disabled
         # for some setups/envs
         import PIL
         from reportlab.pdfgen import canvas
         from reportlab.lib.utils import ImageReader
-        from reportlab.lib.units import mm
         from PyPDF2 import PdfFileWriter, PdfFileReader
 
-        logging.info("Adding a watermark for %s", docfile)
         qrcode_image = PIL.Image.open(io.BytesIO(qrcode_image))
 
         # Read the original PDF first to detemine it's page size (the first page)
-        orig_doc = PdfFileReader(docfile.original_file or docfile.file)
+        orig_doc = PdfFileReader(source)
         orig_doc_first_page_size = orig_doc.getPage(0).mediaBox
 
         orig_doc_pagesize = (
@@ -76,21 +175,7 @@ class DocumentWatermarkService:
         qrcode_stream = io.BytesIO()
         c = canvas.Canvas(qrcode_stream, pagesize=orig_doc_pagesize)
 
-        x_loc = float(docfile.doc.extra_data.get("qr_x_position") or 83) / 100.0
-        y_loc = 1 - float(docfile.doc.extra_data.get("qr_y_position") or 4) / 100.0
-
-        if x_loc < 0:
-            x_loc = 0
-        if x_loc > 100:
-            x_loc = 100
-        if y_loc < 0:
-            y_loc = 0
-        if y_loc > 100:
-            y_loc = 100
-
-        image_width = config.QR_CODE_SIZE_MM * mm
-        image_x_loc = orig_doc_pagesize[0] * x_loc
-        image_y_loc = orig_doc_pagesize[1] * y_loc - image_width
+        image_x_loc, image_y_loc, image_width = self._get_qr_placement(orig_doc_first_page_size, position)
 
         c.drawImage(
             ImageReader(qrcode_image),
@@ -115,20 +200,7 @@ class DocumentWatermarkService:
 
         outputStream = io.BytesIO()
         output_file.write(outputStream)
-
-        old_filename_parts = docfile.file.name.rsplit(".", maxsplit=1)
-        new_filename = ".".join(
-            [old_filename_parts[0].rstrip(".altered"), "altered", old_filename_parts[1]]
-        )
-        outputStream.seek(0)
-        new_saved_filename = default_storage.save(
-            new_filename, ContentFile(outputStream.read())
-        )
-        docfile.file = new_saved_filename
-        logger.info("Saved altered PDF file as %s", new_saved_filename)
-        docfile.is_watermarked = True
-        docfile.save()
-        return
+        return outputStream.getvalue()
 
 
 class DocumentFileImageService:
@@ -143,28 +215,17 @@ class DocumentFileImageService:
         Or -1, -1 if the document is encrypted (which doesn't mean it can't be read, but can't be updated)
         Or 0, 0 if the document can't be parsed (not a PDF or some internal format issue)
         """
-        from PyPDF2 import PdfFileReader
         from reportlab.lib.units import mm
 
-        try:
-            # Read the original PDF first to detemine it's page size (the first page)
-            orig_doc = PdfFileReader(docfile.original_file or docfile.file)
-            orig_doc_first_page_size = orig_doc.getPage(0).mediaBox
-        except Exception as e:
-            if "file has not been decrypted" in str(e):
-                return -1, -1
-            else:
-                logger.exception(e)
-                return 0, 0
+        pdf_info = docfile.get_pdf_info()
+        if pdf_info["encrypted"]:
+            return -1, -1
+        if pdf_info["unparseable"] or not pdf_info["pages"]:
+            return 0, 0
+        mediabox = pdf_info["pages"][0]["mediabox"]
         return (
-            round(
-                float(orig_doc_first_page_size[2] - orig_doc_first_page_size[0]) / mm,
-                2
-            ),
-            round(
-                float(orig_doc_first_page_size[3] - orig_doc_first_page_size[1]) / mm,
-                2
-            )
+            round((mediabox[2] - mediabox[0]) / mm, 2),
+            round((mediabox[3] - mediabox[1]) / mm, 2),
         )
 
     def get_first_page_as_png(self, source, page_number=0):
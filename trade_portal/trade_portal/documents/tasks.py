@@ -214,7 +214,9 @@ def textract_document(document_id=None):
 def fill_document_metadata(document_id=None):
     """
     For document files uploaded
-    Tries to retrieve first PDF page width/height and save to "metadata" field
+    Parses the PDF once and saves the facts about it to the "metadata" field ("pdf" key),
+    used later by watermarking and other steps instead of parsing the file again.
+    Also saves first PDF page width/height
     So QR code watermark UI functionality works fine for all possible QR code and page sizes
     And also saves flag for encrypted PDFs which we can't update
     Or invalid PDFs which we can't parse at all
@@ -225,6 +227,7 @@ def fill_document_metadata(document_id=None):
         if docfile.filename.lower().endswith(".pdf"):
             # not determined yet and is PDF
             t0 = time.time()
+            docfile.update_pdf_info()
             x, y = DocumentFileImageService().get_first_page_size_mm(docfile)
             time_spent = round(time.time() - t0, 4)  # seconds
 
@@ -0,0 +1,74 @@
+import os
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+
+from trade_portal.documents.models import DocumentFile, OaDetails
+from trade_portal.documents.services.watermark import DocumentFileImageService
+from trade_portal.documents.tests.factories import DocumentFactory
+from trade_portal.utils import qr
+
+pytestmark = pytest.mark.django_db
+
+
+def test_oa_details_qr_rendered_once(user):
+    org = user.direct_orgs[0]
+    with mock.patch.dict(
+        OaDetails.QR_RENDERERS,
+        png=mock.Mock(wraps=qr.get_qrcode_image),
+        svg=mock.Mock(wraps=qr.get_qrcode_svg),
+        pdfops=mock.Mock(wraps=qr.get_qrcode_pdf_operators),
+    ):
+        # rendered on the key generation
+        oa = OaDetails.retrieve_new(for_org=org)
+        OaDetails.QR_RENDERERS["png"].assert_called_once_with(oa.url_repr(), box_size=10)
+
+        png = oa.get_qr_image()
+        assert png.startswith(b"\x89PNG")
+        assert oa.get_qr_image_base64()
+        # the cache is cleared - read from the storage
+        cache.clear()
+        assert OaDetails.objects.get(pk=oa.pk).get_qr_image() == png
+        assert OaDetails.QR_RENDERERS["png"].call_count == 1
+
+        svg = oa.get_qr_svg()
+        assert b"<svg" in svg
+        assert oa.get_qr_svg() == svg
+        assert OaDetails.QR_RENDERERS["svg"].call_count == 1
+
+        # another size is another artifact
+        assert oa.get_qr_image(box_size=4) != png
+        assert OaDetails.QR_RENDERERS["png"].call_count == 2
+
+        # the PDF operators are scaled by the caller, no box size
+        assert oa.get_qr_pdf_operators().startswith(b"q\n")
+        OaDetails.QR_RENDERERS["pdfops"].assert_called_once_with(oa.url_repr())
+
+
+def test_oa_details_qr_not_persisted_without_key():
+    # incoming document which uri and key are not known yet
+    oa = OaDetails.objects.create()
+    with mock.patch("trade_portal.documents.models.default_storage") as storage:
+        assert oa.get_qr_image().startswith(b"\x89PNG")
+        storage.save.assert_not_called()
+
+
+def test_docfile_pdf_info(user):
+    doc = DocumentFactory()
+    with open(os.path.join(os.path.dirname(__file__), "assets", "A5.pdf"), "rb") as f:
+        docfile = DocumentFile.objects.create(doc=doc, file=ContentFile(f.read(), name="A5.pdf"))
+
+    pdf_info = docfile.update_pdf_info()
+    assert pdf_info["pages_count"] == 1
+    assert pdf_info["encrypted"] is False
+    assert pdf_info["size"] == 7379
+    assert pdf_info["pages"][0]["mediabox"] == [0.0, 0.0, 419.52, 595.2]
+    assert DocumentFileImageService().get_first_page_size_mm(docfile) == (148.0, 209.97)
+
+    # the later steps read the stored facts instead of parsing the file again
+    docfile = DocumentFile.objects.get(pk=docfile.pk)
+    with mock.patch("trade_portal.documents.models.inspect_pdf") as inspect_pdf:
+        assert docfile.get_pdf_info() == pdf_info
+        inspect_pdf.assert_not_called()
@@ -0,0 +1,77 @@
+from unittest import mock
+
+import pytest
+
+from intergov_client.predicates import Predicates
+from trade_portal.documents.models import Document, DocumentHistoryItem, NodeMessage
+from trade_portal.documents.services.igl import IGLService
+from trade_portal.documents.tests.factories import DocumentFactory
+
+
+def message(sender_ref, subject, predicate=Predicates.CoO_ISSUED):
+    return {
+        "sender": "SG",
+        "receiver": "AU",
+        "sender_ref": sender_ref,
+        "subject": subject,
+        "predicate": predicate,
+        "obj": "QmQtYtUS7K1AdKjbuMsmPmPGDLaKL38M5HYwqxW9RKW49n",
+    }
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.documents.tasks.process_incoming_document_received.apply_async")
+@mock.patch("trade_portal.documents.services.igl.IGLService._retrieve_messages")
+def test_store_messages_batch(retrieve_mock, process_task_mock, docapi_env):
+    doc = DocumentFactory()
+    NodeMessage.objects.create(document=doc, sender_ref="outbound-1", subject="subject-1", is_outbound=True)
+    NodeMessage.objects.create(document=doc, sender_ref="SG:known", subject="subject-1", is_outbound=False)
+    retrieve_mock.return_value = {
+        "SG:1": message("SG:1", "subject-1"),
+        "SG:2": message("SG:2", "subject-2"),
+        "SG:3": message("SG:3", "subject-2", predicate="UN.CEFACT.Regulation.CoO.acknowledged"),
+        "SG:4": None,
+        "SG:known": message("SG:known", "subject-1"),
+    }
+
+    stored = IGLService(ig_client=mock.MagicMock()).store_messages_by_ping_bodies([
+        {"sender_ref": sender_ref, "predicate": f"message.{sender_ref}.status"}
+        for sender_ref in ("SG:1", "SG:2", "SG:3", "SG:1", "SG:4", "SG:known")
+    ])
+
+    # retrieved once each
+    assert retrieve_mock.call_args[0][0] == ["SG:1", "SG:2", "SG:3", "SG:4", "SG:known"]
+    # SG:1 joined the existing conversation, SG:3 - the one started by SG:2 in the same batch
+    assert stored == 2
+    assert NodeMessage.objects.get(sender_ref="SG:1").document == doc
+    new_doc = Document.objects.get(status=Document.STATUS_INCOMING)
+    assert NodeMessage.objects.get(sender_ref="SG:2").document == new_doc
+    assert NodeMessage.objects.get(sender_ref="SG:3").document == new_doc
+    assert process_task_mock.call_count == 1
+    assert not NodeMessage.objects.filter(sender_ref="SG:4").exists()
+    assert NodeMessage.objects.filter(is_outbound=False).count() == 4
+    assert DocumentHistoryItem.objects.filter(
+        type="nodemessage", linked_obj_id=NodeMessage.objects.get(sender_ref="SG:1").pk
+    ).count() == 1
+
+    # the replayed notifications are ignored
+    assert IGLService(ig_client=mock.MagicMock()).store_messages_by_ping_bodies([{"sender_ref": "SG:1"}]) == 0
+    assert NodeMessage.objects.count() == 5
+
+
+@pytest.mark.django_db
+def test_store_message_by_ping_body(docapi_env):
+    doc = DocumentFactory()
+    NodeMessage.objects.create(document=doc, sender_ref="outbound-1", subject="subject-1", is_outbound=True)
+    ig_client = mock.MagicMock()
+    ig_client.retrieve_message.return_value = message("SG:1", "subject-1")
+    service = IGLService(ig_client=ig_client)
+
+    # the same history item as the batch version renders
+    for _ in range(2):
+        assert service.store_message_by_ping_body({"sender_ref": "SG:1"}) is True
+    msg = NodeMessage.objects.get(sender_ref="SG:1")
+    assert msg.document == doc
+    history_item = DocumentHistoryItem.objects.get(type="nodemessage", linked_obj_id=msg.pk)
+    assert history_item.document == doc
+    assert history_item.message == "The message has been received"
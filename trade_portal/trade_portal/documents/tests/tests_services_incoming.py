@@ -0,0 +1,56 @@
+import base64
+from unittest import mock
+
+import pytest
+
+from trade_portal.documents.models import DocumentFile
+from trade_portal.documents.services.incoming import IncomingDocumentService
+from trade_portal.documents.tests.factories import DocumentFactory
+
+OBJ = b'{"version": "https://schema.openattestation.com/2.0/schema.json", "data": {}}'
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.documents.tasks.document_oa_verify.apply_async")
+@mock.patch("trade_portal.documents.services.incoming.IncomingDocumentService.get_incoming_document_format")
+@mock.patch("trade_portal.documents.services.incoming.default_storage.save")
+def test_process_new_reads_obj_after_upload(save_mock, format_mock, verify_task_mock, docapi_env):
+    def save(name, content):
+        # like the S3 upload does
+        content.read()
+        content.close()
+        return name
+
+    save_mock.side_effect = save
+    parsed = []
+    format_mock.side_effect = lambda doc, obj_file: parsed.append(obj_file.read())
+    ig_client = mock.MagicMock()
+    ig_client.retrieve_document_stream.return_value = iter([OBJ[:10], OBJ[10:]])
+    doc = DocumentFactory(intergov_details={"obj": "QmObj"})
+
+    assert IncomingDocumentService(ig_client=ig_client).process_new(doc) is True
+
+    # parsed after the file is uploaded
+    assert parsed == [OBJ]
+    the_file = DocumentFile.objects.get(doc=doc, filename="QmObj")
+    assert the_file.size == len(OBJ)
+    assert the_file.metadata["sha256"]
+    assert verify_task_mock.call_count == 1
+
+
+@mock.patch("trade_portal.documents.services.incoming.CHUNK_SIZE", 8)
+@mock.patch("trade_portal.documents.services.incoming.default_storage.save")
+def test_save_base64_file_by_chunks(save_mock):
+    saved = []
+
+    def save(name, content):
+        saved.append(content.read())
+        return name
+
+    save_mock.side_effect = save
+    content = bytes(range(256)) * 3
+    # line breaks split the 4 characters groups over the chunks
+    base64_content = base64.encodebytes(content).decode().replace("\n", "\r\n")
+    service = IncomingDocumentService(ig_client=mock.MagicMock())
+    assert service._save_base64_file("incoming/file.pdf", base64_content) == ("incoming/file.pdf", len(content))
+    assert saved == [content]
@@ -0,0 +1,107 @@
+import base64
+import json
+import os
+
+from trade_portal.documents.services.encryption import AESCipher
+from trade_portal.documents.services.oa import OaNativeClient
+from trade_portal.utils import oa_v2
+
+ASSETS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))),
+    "oa_verify", "tests", "assets",
+)
+
+
+def _load_wrapped_fixtures():
+    """
+    Return OA documents wrapped by the reference implementation:
+    the simple one and real CoO issued by the portal (stored encrypted)
+    """
+    simple = json.loads(open(os.path.join(ASSETS_PATH, "simple-oa.json"), "rb").read())
+    encrypted = json.loads(open(os.path.join(
+        ASSETS_PATH, "trade-get-resp-1f4abad2-adaf-4704-834c-fe2b26db5a63.json"
+    ), "rb").read())["document"]
+    cleartext_b64 = AESCipher(
+        "BCE7AC1B7BAFA6D2FB18775F63D770A293757D19E5A58A013478F4A73712A09B"
+    ).decrypt(encrypted["iv"], encrypted["tag"], encrypted["cipherText"])
+    coo = json.loads(base64.b64decode(cleartext_b64))
+    return [simple, coo]
+
+
+def test_digest_matches_reference_fixtures():
+    for wrapped in _load_wrapped_fixtures():
+        assert oa_v2.digest_document(wrapped) == wrapped["signature"]["targetHash"]
+
+
+def test_wrap_is_identical_to_reference_fixtures():
+    for wrapped in _load_wrapped_fixtures():
+        # reuse the fixture salts, so the output must be byte-identical
+        salts = iter(
+            value[:oa_v2.UUIDV4_LENGTH]
+            for value in oa_v2.flatten(wrapped["data"]).values()
+        )
+        rewrapped = oa_v2.wrap_document(
+            oa_v2.unsalt_data(wrapped["data"]),
+            salt_factory=lambda: next(salts),
+        )
+        assert rewrapped == wrapped
+        assert oa_v2.to_json(rewrapped) == json.dumps(wrapped, separators=(",", ":"), ensure_ascii=False)
+
+
+def test_wrap_salts_values():
+    wrapped = oa_v2.wrap_document({
+        "name": "string value",
+        "amount": 15.0,
+        "qty": 3,
+        "flags": [True, False, None],
+        "nested": {"empty": {}, "list": []},
+    })
+    data = wrapped["data"]
+    assert data["name"][oa_v2.UUIDV4_LENGTH:] == ":string:string value"
+    assert data["amount"][oa_v2.UUIDV4_LENGTH:] == ":number:15"
+    assert data["qty"][oa_v2.UUIDV4_LENGTH:] == ":number:3"
+    assert [v[oa_v2.UUIDV4_LENGTH:] for v in data["flags"]] == [":boolean:true", ":boolean:false", ":null:null"]
+    assert data["nested"] == {"empty": {}, "list": []}
+    assert wrapped["signature"]["proof"] == []
+    assert wrapped["signature"]["merkleRoot"] == wrapped["signature"]["targetHash"]
+
+    # salts are random
+    assert oa_v2.wrap_document({"name": "x"})["data"] != oa_v2.wrap_document({"name": "x"})["data"]
+
+
+def test_unsalt_data():
+    salt = "6cdb27f1-a46e-4dea-b1af-3b3faf7d983d"
+    assert oa_v2.unsalt_data({
+        "inf": [f"{salt}:number:Infinity", f"{salt}:number:-Infinity"],
+        "qty": f"{salt}:number:-3",
+        "text": f"{salt}:string:a:b",
+        "unsalted": "plain text",
+    }) == {
+        "inf": [float("inf"), float("-inf")],
+        "qty": -3,
+        "text": "a:b",
+        "unsalted": "plain text",
+    }
+
+
+def test_wrap_documents_batch():
+    documents = [{"name": f"document {i}"} for i in range(5)]
+    wrapped = oa_v2.wrap_documents(documents)
+
+    merkle_root = wrapped[0]["signature"]["merkleRoot"]
+    for document in wrapped:
+        signature = document["signature"]
+        assert signature["merkleRoot"] == merkle_root
+        assert signature["targetHash"] == oa_v2.digest_document(document)
+        computed = signature["targetHash"]
+        for proof_hash in signature["proof"]:
+            computed = oa_v2.combine_hashes(computed, proof_hash)
+        assert computed == merkle_root
+
+
+def test_native_client():
+    resp = OaNativeClient().wrap_document({"name": "the document"})
+    assert resp.status_code == 200
+    assert resp.json()["signature"]["merkleRoot"]
+    assert json.loads(resp.content) == resp.json()
+    assert b" " not in resp.content.replace(b"the document", b"")
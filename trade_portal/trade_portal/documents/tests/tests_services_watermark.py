@@ -0,0 +1,37 @@
+import io
+import os
+
+import pytest
+from PyPDF2 import PdfFileReader
+
+from trade_portal.documents.services.watermark import DocumentWatermarkService
+from trade_portal.utils.pdf_update import IncrementallyUpdatedFile
+from trade_portal.utils.qr import get_qrcode_pdf_operators
+
+pytestmark = pytest.mark.django_db
+
+ASSET = os.path.join(os.path.dirname(__file__), "assets", "A5.pdf")
+
+
+def test_watermark_pdf_incremental_update():
+    with open(ASSET, "rb") as f:
+        original = f.read()
+    operators = get_qrcode_pdf_operators("https://example.com/v/?q=test")
+
+    update = DocumentWatermarkService().watermark_pdf(io.BytesIO(original), operators, (0.83, 0.96))
+    assert len(update) < 10 * 1024
+
+    # the original bytes (and so any signatures over them) are untouched, the update is appended
+    updated_file = IncrementallyUpdatedFile(io.BytesIO(original), update)
+    result = b"".join(iter(lambda: updated_file.read(1024), b""))
+    assert result == original + update
+    assert updated_file.size == len(result)
+    updated_file.seek(-len(update), os.SEEK_END)
+    assert updated_file.read() == update
+    original_reader = PdfFileReader(io.BytesIO(original))
+    reader = PdfFileReader(io.BytesIO(result))
+    assert reader.getNumPages() == original_reader.getNumPages()
+    contents = reader.getPage(0).getContents()
+    data = b"".join(stream.getObject().getData() for stream in contents)
+    assert operators in data
+    assert data.startswith(b"q\n")
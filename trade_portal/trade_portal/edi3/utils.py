@@ -1,13 +1,15 @@
-def party_from_json(json_data):
-    from trade_portal.documents.models import Party
-
+def party_lookup_from_json(json_data):
+    """
+    Returns (lookup, defaults) kwargs pair identifying the party in the database,
+    so parties can be fetched one by one or many at once (bulk creation)
+    """
     issuer_id = json_data.get("id") or ""  # we call it issuer but it can be any party
     if ":" in issuer_id:
         issuer_bid_prefix, issuer_clear_business_id = issuer_id.rsplit(":", maxsplit=1)
     else:
         issuer_clear_business_id = issuer_id
         issuer_bid_prefix = ""
-    the_party, _ = Party.objects.get_or_create(
+    lookup = dict(
         bid_prefix=issuer_bid_prefix,
         clear_business_id=issuer_clear_business_id,
         business_id=issuer_id,
@@ -15,17 +17,25 @@ def party_from_json(json_data):
         if "." in issuer_clear_business_id
         else "",
         name=json_data.get("name"),
-        defaults={
-            "country": json_data.get("postalAddress", {}).get("country") or "",
-            "postcode": json_data.get("postalAddress", {}).get("postcode") or "",
-            "countrySubDivisionName": json_data.get("postalAddress", {}).get(
-                "postalAddress"
-            )
-            or "",
-            "line1": json_data.get("postalAddress", {}).get("line1") or "",
-            "line2": json_data.get("postalAddress", {}).get("line2") or "",
-            "city_name": json_data.get("postalAddress", {}).get("cityName") or "",
-        },
     )
+    defaults = {
+        "country": json_data.get("postalAddress", {}).get("country") or "",
+        "postcode": json_data.get("postalAddress", {}).get("postcode") or "",
+        "countrySubDivisionName": json_data.get("postalAddress", {}).get(
+            "postalAddress"
+        )
+        or "",
+        "line1": json_data.get("postalAddress", {}).get("line1") or "",
+        "line2": json_data.get("postalAddress", {}).get("line2") or "",
+        "city_name": json_data.get("postalAddress", {}).get("cityName") or "",
+    }
+    return lookup, defaults
+
+
+def party_from_json(json_data):
+    from trade_portal.documents.models import Party
+
+    lookup, defaults = party_lookup_from_json(json_data)
+    the_party, _ = Party.objects.get_or_create(defaults=defaults, **lookup)
     # TODO: update adresses if changed
     return the_party
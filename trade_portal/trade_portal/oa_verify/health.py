@@ -0,0 +1,106 @@
+"""
+The OA verify API health, shared by all the web workers through the cache.
+
+The background task pings the healthcheck endpoint, keeping the (cold starting) verifier
+warm, and both the pings and the verification calls feed the circuit breaker: after
+OA_VERIFY_BREAKER_FAILURES failures in a row the verification requests fail fast for
+OA_VERIFY_BREAKER_RESET_TIMEOUT seconds, then the next call tries the verifier again.
+"""
+import logging
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from trade_portal.utils.monitoring import statsd_gauge, statsd_timer
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CACHE_KEY = "oa-verify-api-health"
+# stale health (the pings stopped) is forgotten, the breaker is closed then
+HEALTH_CACHE_TIMEOUT = 60 * 60
+PING_TIMEOUT = 10
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+_session = None
+
+
+def get_session():
+    """
+    Keep-alive connections to the verifier, shared by the pings and the verification calls
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+
+def get_health() -> dict:
+    return cache.get(HEALTH_CACHE_KEY) or {
+        "state": CLOSED,
+        "failures": 0,
+        "latency": None,
+        "checked_at": None,
+        "opened_at": None,
+    }
+
+
+def get_breaker_state(health: dict = None) -> str:
+    health = health or get_health()
+    if health["state"] == OPEN and time.time() - health["opened_at"] >= settings.OA_VERIFY_BREAKER_RESET_TIMEOUT:
+        # the next call tries the verifier
+        return HALF_OPEN
+    return health["state"]
+
+
+def is_available() -> bool:
+    """
+    False if the verifier is known to be down, so there is no point to call it
+    """
+    return get_breaker_state() != OPEN
+
+
+def record_result(success: bool, latency: float = None) -> None:
+    health = get_health()
+    state = get_breaker_state(health)
+    health["checked_at"] = time.time()
+    if latency is not None:
+        health["latency"] = round(latency, 4)
+    if success:
+        if state != CLOSED:
+            logger.info("OA Verify API is available again")
+        health.update(state=CLOSED, failures=0, opened_at=None)
+    else:
+        health["failures"] += 1
+        if state == HALF_OPEN or health["failures"] >= settings.OA_VERIFY_BREAKER_FAILURES:
+            if state == CLOSED:
+                logger.warning("OA Verify API is down after %s failures", health["failures"])
+            health.update(state=OPEN, opened_at=time.time())
+    cache.set(HEALTH_CACHE_KEY, health, HEALTH_CACHE_TIMEOUT)
+    statsd_gauge("oa_verify.api.available", int(health["state"] == CLOSED))
+
+
+@statsd_timer("oa_verify.api.healthcheck")
+def ping() -> bool:
+    """
+    Call the healthcheck API to ensure it's warm and ready, and record the result
+    """
+    if not settings.OA_VERIFY_API_HEALTHCHECK_URL:
+        return False
+    t0 = time.time()
+    try:
+        resp = get_session().get(settings.OA_VERIFY_API_HEALTHCHECK_URL, timeout=PING_TIMEOUT)
+    except Exception as e:
+        logger.warning("Verifier healthcheck temporary unavailable (%s)", str(e))
+        record_result(False)
+        return False
+    latency = time.time() - t0
+    if resp.status_code != 200:
+        logger.warning("OA Verify API healthcheck resp %s, %s", resp.status_code, resp.content)
+    logger.info("Verifier healthcheck resp is %s, %ss", resp.status_code, round(latency, 4))
+    record_result(resp.status_code == 200, latency)
+    return resp.status_code == 200
@@ -0,0 +1,48 @@
+import glob
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from trade_portal.oa_verify.qrcodes import get_pool
+from trade_portal.oa_verify.services import PdfVerificationService
+
+ASSETS_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "tests", "assets")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure QR codes extraction from the test PDFs: in the calling thread "
+        "versus the process pool, looking for all codes or stopping at 2 like the verification does "
+        "(enough to tell there are multiple ones)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("files", nargs="*", help="PDF files, the oa_verify test assets by default")
+
+    def handle(self, *args, **kwargs):
+        files = kwargs["files"] or sorted(glob.glob(os.path.join(ASSETS_PATH, "*.pdf")))
+        # processes start once per web worker, not per request
+        get_pool()
+
+        self.stdout.write(
+            f"{'PDF':<50} {'codes':>5} {'inline, s':>10} {'pool, s':>8} {'pool limit=2, s':>16}"
+        )
+        for filename in files:
+            with override_settings(PDF_QR_EXTRACTION_PROCESSES=0):
+                inline_time, codes = self._measure(filename, None, kwargs["repeat"])
+            pool_time, _ = self._measure(filename, None, kwargs["repeat"])
+            limited_time, _ = self._measure(filename, 2, kwargs["repeat"])
+            self.stdout.write(
+                f"{os.path.basename(filename):<50} {len(codes or []):>5} "
+                f"{inline_time:>10.3f} {pool_time:>8.3f} {limited_time:>16.3f}"
+            )
+
+    def _measure(self, filename, limit, repeat):
+        started_at = time.perf_counter()
+        for _ in range(repeat):
+            with open(filename, "rb") as pdf_file:
+                codes = PdfVerificationService(pdf_file).get_valid_qrcodes(limit=limit)
+        return (time.perf_counter() - started_at) / repeat, codes
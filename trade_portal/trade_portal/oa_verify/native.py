@@ -0,0 +1,452 @@
+"""
+Native OpenAttestation v2 verification, reproducing the fragments of the reference
+implementation (https://github.com/Open-Attestation/oa-verify) the OA verify API returns:
+the document integrity (targetHash and merkle proof), the document store issuance and
+revocation status and the DNS-TXT issuer identity.
+
+All the document store calls of a verification are sent as a single JSON-RPC batch,
+so the verification costs one round trip to the Ethereum node and the DNS queries.
+Documents using the features not supported here (token registries, DID signing and
+identity) raise NativeVerificationUnsupported, so the caller can use the API instead.
+"""
+import logging
+
+import requests
+from django.conf import settings
+
+from trade_portal.utils import oa_v2
+
+logger = logging.getLogger(__name__)
+
+RPC_TIMEOUT = 10
+DNS_TIMEOUT = 5
+DNS_TXT_TYPE = 16
+
+
+class NativeVerificationUnsupported(Exception):
+    """
+    The document can't be verified natively, but the reference implementation may handle it
+    """
+
+
+class NativeVerificationError(Exception):
+    """
+    The Ethereum node or the DNS resolver failed, the result is unknown
+    """
+
+
+_session = None
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        # keep-alive connections to the node and the resolver
+        _session = requests.Session()
+    return _session
+
+
+def function_call_data(signature: str, *bytes32_args: str) -> str:
+    """
+    ABI-encoded call of the contract function accepting bytes32 arguments (hex, with or without 0x)
+    """
+    selector = oa_v2.keccak256(signature)[:8]
+    return "0x" + selector + "".join(arg[2:] if arg.startswith("0x") else arg for arg in bytes32_args)
+
+
+class EthereumRpcProvider:
+    """
+    JSON-RPC client of the Ethereum node, sending the calls as a batch
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def batch(self, calls: list) -> list:
+        """
+        Accepts [(method, params), ...] and returns their results in the same order
+        """
+        if not calls:
+            return []
+        payload = [
+            {"jsonrpc": "2.0", "id": call_id, "method": method, "params": params}
+            for call_id, (method, params) in enumerate(calls)
+        ]
+        try:
+            resp = _get_session().post(self.url, json=payload, timeout=RPC_TIMEOUT)
+            resp.raise_for_status()
+            responses = {item["id"]: item for item in resp.json()}
+        except Exception as e:
+            raise NativeVerificationError(f"Ethereum node is unavailable ({e.__class__.__name__})")
+        results = []
+        for call_id in range(len(calls)):
+            response = responses.get(call_id) or {}
+            if "result" not in response:
+                raise NativeVerificationError(f"Ethereum node call failed: {response.get('error')}")
+            results.append(response["result"])
+        return results
+
+
+class LocalChainProvider:
+    """
+    In-memory stand-in of the Ethereum node with document stores, for tests and local development:
+        chain = LocalChainProvider(network_id="3")
+        chain.issue(store_address, merkle_root)
+        NativeVerifier(provider=chain, ...)
+    """
+
+    def __init__(self, network_id: str = "3"):
+        self.network_id = network_id
+        self.contracts = set()  # deployed store addresses
+        self.issued = set()  # (store address, hash)
+        self.revoked = set()
+        self.calls_count = 0
+
+    def deploy(self, address: str):
+        self.contracts.add(address.lower())
+
+    def issue(self, address: str, document_hash: str):
+        self.deploy(address)
+        self.issued.add((address.lower(), self._normalise(document_hash)))
+
+    def revoke(self, address: str, document_hash: str):
+        self.deploy(address)
+        self.revoked.add((address.lower(), self._normalise(document_hash)))
+
+    def batch(self, calls: list) -> list:
+        self.calls_count += 1
+        functions = {
+            function_call_data("isIssued(bytes32)")[:10]: self.issued,
+            function_call_data("isRevoked(bytes32)")[:10]: self.revoked,
+        }
+        results = []
+        for method, params in calls:
+            if method == "net_version":
+                results.append(self.network_id)
+            elif method == "eth_call":
+                data = params[0]["data"]
+                if params[0]["to"].lower() not in self.contracts:
+                    # like the node does for an address without code
+                    results.append("0x")
+                    continue
+                hashes = functions[data[:10]]
+                found = (params[0]["to"].lower(), data[10:]) in hashes
+                results.append("0x" + format(int(found), "064x"))
+            else:
+                raise NativeVerificationError(f"Unsupported method {method}")
+        return results
+
+    @staticmethod
+    def _normalise(document_hash):
+        return (document_hash[2:] if document_hash.startswith("0x") else document_hash).lower()
+
+
+def dns_over_https_resolver(domain: str) -> list:
+    """
+    TXT records of the domain, using the DNS-over-HTTPS JSON API (like OA verify does)
+    """
+    try:
+        resp = _get_session().get(
+            settings.OA_VERIFY_DNS_RESOLVER_URL,
+            params={"name": domain, "type": "TXT"},
+            headers={"Accept": "application/dns-json"},
+            timeout=DNS_TIMEOUT,
+        )
+        resp.raise_for_status()
+        answers = resp.json().get("Answer") or []
+    except Exception as e:
+        raise NativeVerificationError(f"DNS resolver is unavailable ({e.__class__.__name__})")
+    return [
+        # long records are split to quoted strings
+        answer["data"].replace('" "', "").strip('"')
+        for answer in answers
+        if answer.get("type") == DNS_TXT_TYPE
+    ]
+
+
+class Fragment:
+    """
+    Single verification check, returns the fragment dict the OA verify API returns;
+    the JSON-RPC calls it needs are sent by the verifier in a batch with the others
+    """
+    name = None
+    type = None
+
+    def get_calls(self, context) -> list:
+        return []
+
+    def check(self, context, results: list) -> dict:
+        raise NotImplementedError()
+
+    def skipped(self, message: str) -> dict:
+        return {
+            "status": "SKIPPED",
+            "type": self.type,
+            "name": self.name,
+            "reason": {"code": 0, "codeString": "SKIPPED", "message": message},
+        }
+
+    def invalid(self, data, code: int, code_string: str, message: str) -> dict:
+        return {
+            "name": self.name,
+            "type": self.type,
+            "data": data,
+            "reason": {"code": code, "codeString": code_string, "message": message},
+            "status": "INVALID",
+        }
+
+    def valid(self, data) -> dict:
+        return {"name": self.name, "type": self.type, "data": data, "status": "VALID"}
+
+
+class HashFragment(Fragment):
+    name = "OpenAttestationHash"
+    type = "DOCUMENT_INTEGRITY"
+
+    def check(self, context, results):
+        if context.is_intact:
+            return self.valid(True)
+        return self.invalid(False, 0, "DOCUMENT_TAMPERED", "Document has been tampered with")
+
+
+class TokenRegistryFragment(Fragment):
+    name = "OpenAttestationEthereumTokenRegistryStatus"
+    type = "DOCUMENT_STATUS"
+
+    def check(self, context, results):
+        return self.skipped("Document issuers doesn't have \"tokenRegistry\" property or TOKEN_REGISTRY method")
+
+
+class DocumentStoreFragment(Fragment):
+    name = "OpenAttestationEthereumDocumentStoreStatus"
+    type = "DOCUMENT_STATUS"
+
+    def get_calls(self, context):
+        calls = []
+        for address in context.document_stores:
+            calls.append(self._call(address, "isIssued(bytes32)", context.merkle_root))
+            for document_hash in context.revocation_hashes:
+                calls.append(self._call(address, "isRevoked(bytes32)", document_hash))
+        return calls
+
+    def check(self, context, results):
+        results = iter(results)
+        issuance, revocation = [], []
+        for address in context.document_stores:
+            issued = self._to_bool(next(results))
+            # the document, any of the intermediate hashes or the whole batch may be revoked
+            revoked = [self._to_bool(next(results)) for _ in context.revocation_hashes]
+            if issued is None or None in revoked:
+                # no contract at the address on this network
+                return self.invalid(
+                    {
+                        "issuedOnAll": False,
+                        "details": {"issuance": [{"issued": False, "address": address}]},
+                    },
+                    2, "CONTRACT_ADDRESS_INVALID", f"Contract is not found at {address}",
+                )
+            issuance.append({"issued": issued, "address": address})
+            revocation.append({"revoked": any(revoked), "address": address})
+        data = {
+            "issuedOnAll": all(item["issued"] for item in issuance),
+            "revokedOnAny": any(item["revoked"] for item in revocation),
+            "details": {"issuance": issuance, "revocation": revocation},
+        }
+        if not data["issuedOnAll"]:
+            address = next(item["address"] for item in issuance if not item["issued"])
+            return self.invalid(
+                data, 1, "DOCUMENT_NOT_ISSUED",
+                f"Document 0x{context.merkle_root} has not been issued under contract {address}",
+            )
+        if data["revokedOnAny"]:
+            address = next(item["address"] for item in revocation if item["revoked"])
+            return self.invalid(
+                data, 5, "DOCUMENT_REVOKED",
+                f"Document 0x{context.merkle_root} has been revoked under contract {address}",
+            )
+        return self.valid(data)
+
+    @staticmethod
+    def _to_bool(value):
+        """
+        The bool returned by the contract call, None if there is no contract ("0x")
+        """
+        if not value or value == "0x":
+            return None
+        return int(value, 16) != 0
+
+    @staticmethod
+    def _call(address, signature, document_hash):
+        return "eth_call", [{"to": address, "data": function_call_data(signature, document_hash)}, "latest"]
+
+
+class DidSignedFragment(Fragment):
+    name = "OpenAttestationDidSignedDocumentStatus"
+    type = "DOCUMENT_STATUS"
+
+    def check(self, context, results):
+        return self.skipped("Document was not signed by DID directly")
+
+
+class DnsTxtFragment(Fragment):
+    name = "OpenAttestationDnsTxtIdentityProof"
+    type = "ISSUER_IDENTITY"
+
+    def get_calls(self, context):
+        # the records are per network, so the network of the node is needed
+        return [("net_version", [])]
+
+    def check(self, context, results):
+        network_id = str(results[0])
+        data = []
+        for issuer in context.issuers:
+            location = issuer["identityProof"]["location"]
+            address = issuer["documentStore"]
+            records = context.resolver(location)
+            data.append({
+                "status": "VALID" if self._is_matching(records, address, network_id) else "INVALID",
+                "location": location,
+                "value": address,
+            })
+        invalid = [item for item in data if item["status"] != "VALID"]
+        if invalid:
+            return self.invalid(
+                data, 1, "MATCHING_RECORD_NOT_FOUND",
+                f"Matching DNS record not found for {invalid[0]['value']}",
+            )
+        return self.valid(data)
+
+    @staticmethod
+    def _is_matching(records, address, network_id) -> bool:
+        """
+        Record format is "openatts net=ethereum netId=3 addr=0x..."
+        """
+        for record in records:
+            parts = record.split()
+            if not parts or parts[0] != "openatts":
+                continue
+            values = dict(part.split("=", 1) for part in parts[1:] if "=" in part)
+            if (
+                values.get("net") == "ethereum"
+                and values.get("netId") == network_id
+                and values.get("addr", "").lower() == address.lower()
+            ):
+                return True
+        return False
+
+
+class DnsDidFragment(Fragment):
+    name = "OpenAttestationDnsDidIdentityProof"
+    type = "ISSUER_IDENTITY"
+
+    def check(self, context, results):
+        return self.skipped("Document was not issued using DNS-DID")
+
+
+class VerificationContext:
+    """
+    What the fragments know about the wrapped document
+    """
+
+    def __init__(self, wrapped_document: dict, resolver):
+        self.resolver = resolver
+        signature = wrapped_document.get("signature") or {}
+        self.is_intact = oa_v2.verify_signature(wrapped_document)
+        try:
+            data = oa_v2.unsalt_data(wrapped_document["data"])
+            self.issuers = list(data["issuers"])
+            self.merkle_root = signature["merkleRoot"]
+            self.revocation_hashes = self._get_revocation_hashes(signature)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise NativeVerificationUnsupported("Not an OA v2 document")
+        for issuer in self.issuers:
+            identity_proof = issuer.get("identityProof") if isinstance(issuer, dict) else None
+            if (
+                not isinstance(identity_proof, dict)
+                or identity_proof.get("type") != "DNS-TXT"
+                or not isinstance(identity_proof.get("location"), str)
+                or not isinstance(issuer.get("documentStore"), str)
+                or not issuer["documentStore"]
+            ):
+                # token registries, DID signed documents, DNS-DID identities and malformed issuers
+                raise NativeVerificationUnsupported(
+                    "Only document store issuers with DNS-TXT identity are supported"
+                )
+        self.document_stores = []
+        for issuer in self.issuers:
+            if issuer["documentStore"] not in self.document_stores:
+                self.document_stores.append(issuer["documentStore"])
+
+    @staticmethod
+    def _get_revocation_hashes(signature) -> list:
+        hashes = [signature["targetHash"]]
+        for proof_hash in signature.get("proof") or []:
+            hashes.append(oa_v2.combine_hashes(hashes[-1], proof_hash))
+        if signature["merkleRoot"] not in hashes:
+            hashes.append(signature["merkleRoot"])
+        return hashes
+
+
+class NativeVerifier:
+    """
+    Usage:
+        fragments = NativeVerifier(provider=EthereumRpcProvider(url)).verify(wrapped_document)
+
+    The fragments are checked in order and are pluggable: pass the list of Fragment instances
+    """
+    FRAGMENTS = (
+        HashFragment,
+        TokenRegistryFragment,
+        DocumentStoreFragment,
+        DidSignedFragment,
+        DnsTxtFragment,
+        DnsDidFragment,
+    )
+
+    def __init__(self, provider, resolver=None, fragments=None):
+        self.provider = provider
+        self.resolver = resolver or dns_over_https_resolver
+        self.fragments = fragments if fragments is not None else [cls() for cls in self.FRAGMENTS]
+
+    def verify(self, wrapped_document: dict) -> list:
+        context = VerificationContext(wrapped_document, self.resolver)
+        if not context.is_intact:
+            # the status and identity of a tampered document tell nothing
+            return [
+                fragment.check(context, []) if isinstance(fragment, HashFragment)
+                else fragment.skipped("Document has been tampered with")
+                for fragment in self.fragments
+            ]
+        return self._check(context, self.fragments)
+
+    def verify_status(self, wrapped_document: dict, fragments: list) -> list:
+        """
+        Re-check only the issuance/revocation status of the document verified before,
+        the integrity and identity fragments are taken from the previous result
+        """
+        context = VerificationContext(wrapped_document, self.resolver)
+        if not context.is_intact:
+            return self.verify(wrapped_document)
+        status_fragments = [fragment for fragment in self.fragments if fragment.type == "DOCUMENT_STATUS"]
+        rechecked = {
+            result["name"]: result
+            for result in self._check(context, status_fragments)
+        }
+        return [rechecked.get(fragment["name"], fragment) for fragment in fragments]
+
+    def _check(self, context, fragments) -> list:
+        fragment_calls = [fragment.get_calls(context) for fragment in fragments]
+        results = iter(self.provider.batch([call for calls in fragment_calls for call in calls]))
+        return [
+            fragment.check(context, [next(results) for _ in calls])
+            for fragment, calls in zip(fragments, fragment_calls)
+        ]
+
+
+def get_native_verifier():
+    """
+    Verifier using the configured Ethereum node, None if it's not configured
+    """
+    if not settings.OA_VERIFY_RPC_URL:
+        return None
+    return NativeVerifier(provider=EthereumRpcProvider(settings.OA_VERIFY_RPC_URL))
@@ -0,0 +1,264 @@
+"""
+CPU-bound part of the QR codes extraction from PDF files: decoding the images
+and rasterising the pages. Done in the process pool, so the web worker serving
+the verification upload only waits for the results, several images or pages
+are decoded at once and the first found codes stop the rest of the work.
+
+When a single code is enough every image (or rasterised page) is searched in
+the likely regions first - where our watermark and the QR codes of the similar
+documents were found - of the downscaled copy; the whole image in full resolution
+is decoded only if those fail.
+
+Functions run in the pool must be picklable, so they are module-level and accept
+only plain values (bytes, file paths, tuples) - not PyPDF2 objects.
+"""
+import json
+import logging
+import multiprocessing
+import threading
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image
+from pyzbar.pyzbar import decode as pyzbar_decode
+
+logger = logging.getLogger(__name__)
+
+# the longest side of the image decoded before the full resolution one: about 200 DPI for A4,
+# 2+ pixels per module of the 20mm QR code with the long link, while scans are often 300-600 DPI
+PREPASS_MAX_SIDE = 2400
+# smaller images (like the QR code image itself) are decoded whole at once
+REGIONS_MIN_SIDE = 600
+# regions are (left, top, right, bottom) parts of the image, 0..1 from the top left corner;
+# the watermark is put at the top (the issuer picks the place), more regions make
+# the documents without QR codes slower to process
+CORNER_REGIONS = (
+    (0.65, 0, 1, 0.3),  # top right, the default watermark position
+    (0, 0, 0.35, 0.3),
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Process pool shared by all the threads of this process,
+    None if the extraction is configured to be done in the calling thread
+    """
+    global _pool
+    if settings.PDF_QR_EXTRACTION_PROCESSES <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # not forked: the web worker process has threads, which locks are copied by fork
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_QR_EXTRACTION_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _reset_pool(broken_pool):
+    global _pool
+    with _pool_lock:
+        if _pool is broken_pool:
+            _pool = None
+
+
+def is_supported_qrcode(text: str) -> bool:
+    if text.startswith("tradetrust://{") and text.endswith("}"):
+        json_body = text[len("tradetrust://"):]
+        try:
+            json.loads(json_body)
+        except Exception:
+            pass
+        else:
+            return True  # tradetrust format, JSON with prefix
+    if text.startswith("http://") or text.startswith("https://"):
+        # possibly a link format
+        try:
+            components = urllib.parse.urlparse(text)
+            params = urllib.parse.parse_qs(components.query)
+            req = json.loads(params["q"][0])
+            if req["type"].upper() == "DOCUMENT":
+                req["payload"]["uri"]
+                req["payload"]["key"]  # it's always AES
+            else:
+                raise KeyError("Not a DOCUMENT type")
+        except KeyError:
+            pass  # not our case
+        else:
+            return True  # http format
+    return False
+
+
+def decode_qrcodes(img: Image) -> set:
+    decoded_texts = set()
+    for decoded in pyzbar_decode(img):
+        if decoded.type == "QRCODE":
+            decoded_texts.add(decoded.data.decode("utf-8"))
+    return decoded_texts
+
+
+def _decode_located(img: Image, offset=(0, 0), scale=1.0):
+    """
+    Texts of the QR codes found and the box (in the full image pixels) of the first one
+    """
+    decoded_texts = set()
+    location = None
+    for decoded in pyzbar_decode(img):
+        if decoded.type == "QRCODE":
+            decoded_texts.add(decoded.data.decode("utf-8"))
+            if location is None and decoded.rect:
+                left, top, width, height = decoded.rect
+                location = (
+                    (offset[0] + left) / scale,
+                    (offset[1] + top) / scale,
+                    (offset[0] + left + width) / scale,
+                    (offset[1] + top + height) / scale,
+                )
+    return decoded_texts, location
+
+
+def _has_supported(texts):
+    for text in texts:
+        try:
+            if is_supported_qrcode(text):
+                return True
+        except Exception:
+            # like not a JSON in the link
+            pass
+    return False
+
+
+def search_qrcodes(img: Image, regions=(), downscale=True):
+    """
+    Decodes the likely regions of the downscaled image, the whole downscaled image
+    if no supported code is found there and the full resolution one if nothing is found.
+
+    Returns (texts, region) - region is where the first QR code was found, relative
+    and with a margin around, to be tried first for the similar documents next time
+    """
+    width, height = img.size
+    small, scale = img, 1.0
+    if downscale and max(width, height) > PREPASS_MAX_SIDE:
+        scale = PREPASS_MAX_SIDE / max(width, height)
+        small = img.resize((round(width * scale), round(height * scale)), Image.BILINEAR)
+
+    texts, location = set(), None
+    small_width, small_height = small.size
+    if max(small_width, small_height) >= REGIONS_MIN_SIDE:
+        for region in regions:
+            box = (
+                round(region[0] * small_width), round(region[1] * small_height),
+                round(region[2] * small_width), round(region[3] * small_height),
+            )
+            texts, location = _decode_located(small.crop(box), offset=box[:2], scale=scale)
+            if _has_supported(texts):
+                break
+    if not _has_supported(texts):
+        texts, location = _decode_located(small, scale=scale)
+        if not texts and small is not img:
+            texts, location = _decode_located(img)
+
+    if location is None:
+        return texts, None
+    # with the margin of the QR code size, so the slightly moved one is inside too
+    margin_x = location[2] - location[0]
+    margin_y = location[3] - location[1]
+    return texts, (
+        round(max(location[0] - margin_x, 0) / width, 3),
+        round(max(location[1] - margin_y, 0) / height, 3),
+        round(min(location[2] + margin_x, width) / width, 3),
+        round(min(location[3] + margin_y, height) / height, 3),
+    )
+
+
+def decode_image(mode: str, size: tuple, is_raw: bool, data: bytes, regions=()):
+    """
+    QR codes from the PDF image: raw pixels (after FlateDecode or without filters)
+    or the image file content (JPEG, JPEG2000, TIFF)
+    """
+    if is_raw:
+        img = Image.frombytes(mode, size, data)
+    else:
+        img = Image.open(BytesIO(data))
+    return search_qrcodes(img, regions)
+
+
+def decode_page(pdf_path: str, page_number: int, dpi: int, regions=()):
+    """
+    QR codes from the single page (0-based) rasterised with the given DPI
+    """
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(
+        pdf_path, dpi=dpi, first_page=page_number + 1, last_page=page_number + 1, grayscale=True,
+    )
+    if not images:
+        return set(), None
+    # the DPI is the resolution already, no downscaling
+    return search_qrcodes(images[0], regions, downscale=False)
+
+
+def run_until_done(tasks, is_done):
+    """
+    Runs the tasks - (key, func, args) tuples - in the pool, yielding (key, result)
+    in the order of completion, result is None if the task failed.
+    Stops (cancelling the tasks not started) once is_done() returns True after a result.
+    No more than 2 tasks per pool process are queued at once, so a single large document
+    doesn't occupy the pool for the other requests
+    """
+    tasks = list(tasks)
+    pool = get_pool()
+    if pool is None:
+        for key, func, args in tasks:
+            yield key, _run_safely(func, args)
+            if is_done():
+                return
+        return
+
+    max_in_flight = settings.PDF_QR_EXTRACTION_PROCESSES * 2
+    pending = {}
+    try:
+        while tasks or pending:
+            while tasks and len(pending) < max_in_flight:
+                key, func, args = tasks[0]
+                pending[pool.submit(func, *args)] = tasks.pop(0)
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                key, func, args = pending[future]
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    logger.exception(e)
+                    result = None
+                del pending[future]
+                yield key, result
+                if is_done():
+                    return
+    except BrokenProcessPool as e:
+        # a worker process died (killed for the memory?), the pool can't be used anymore
+        logger.exception(e)
+        _reset_pool(pool)
+        for key, func, args in list(pending.values()) + tasks:
+            yield key, _run_safely(func, args)
+            if is_done():
+                return
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _run_safely(func, args):
+    try:
+        return func(*args)
+    except Exception as e:
+        logger.exception(e)
+        return None
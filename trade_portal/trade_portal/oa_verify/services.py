@@ -1,20 +1,42 @@
 import base64
+import hashlib
 import json
 import logging
+import shutil
+import tempfile
 import time
 import urllib
-from io import BytesIO
 
 import PyPDF2
 import requests
+from constance import config
 from django.conf import settings
+from django.core.cache import cache
 from PIL import Image
-from pyzbar.pyzbar import decode as pyzbar_decode
 
 from trade_portal.documents.services.encryption import AESCipher
+from trade_portal.oa_verify import health
+from trade_portal.oa_verify.native import (
+    NativeVerificationError,
+    NativeVerificationUnsupported,
+    get_native_verifier,
+)
+from trade_portal.oa_verify.qrcodes import (
+    CORNER_REGIONS,
+    decode_image,
+    decode_page,
+    decode_qrcodes,
+    is_supported_qrcode,
+    run_until_done,
+)
+from trade_portal.utils.monitoring import statsd_timer
+from trade_portal.utils.oa_v2 import verify_signature
+from trade_portal.utils.pdf_inspect import get_unparseable_info, inspect_pdf
 
 logger = logging.getLogger(__name__)
 
+VERIFY_API_TIMEOUT = 60
+
 
 class OaVerificationError(Exception):
     pass
@@ -60,11 +82,16 @@ class OaVerificationService:
                 # might be wrapped document number
                 doc_number = doc_number.split(":", maxsplit=2)[2]
 
-        self.kick_verify_api()
+        native_verifier = get_native_verifier() if settings.OA_VERIFY_MODE == "native" else None
+        cache_key = self._get_cache_key(json_content)
+        api_verify_resp, is_status_known = self._get_cached_verify_result(cache_key)
 
         t0 = time.time()
         try:
-            api_verify_resp = self._api_verify_tt_json_file(file_content)
+            if not is_status_known:
+                api_verify_resp = self._verify_tt_json_file(
+                    file_content, json_content, native_verifier, previous_resp=api_verify_resp
+                )
         except OaVerificationError as e:
             logger.info("Document verification (api call), failed in %ss", round(time.time() - t0, 4))
             result = {
@@ -72,7 +99,10 @@ class OaVerificationService:
                 "error_message": str(e),
             }
         else:
-            logger.info("Document verification (api call), success in %ss", round(time.time() - t0, 4))
+            if is_status_known:
+                logger.info("Document verification (cached), success in %ss", round(time.time() - t0, 4))
+            else:
+                logger.info("Document verification (api call), success in %ss", round(time.time() - t0, 4))
             # the file has been verified and either valid or invalid, calculate the final status
             result["status"] = "valid"
             result["verify_result"] = api_verify_resp.copy()
@@ -95,6 +125,10 @@ class OaVerificationService:
                     "The document doesn't have at least 2 valid subjects. "
                     "Most likely it's just not an OA document"
                 )
+            if not is_status_known:
+                self._cache_verify_result(
+                    cache_key, api_verify_resp, result["status"], keep_fragments=native_verifier is not None
+                )
         if result["status"] == "valid":
             # worth further parsing only if the file is valid
             try:
@@ -123,7 +157,8 @@ class OaVerificationService:
         https://github.com/gs-gs/ha-igl-project/issues/54
         """
         try:
-            valid_qrcodes = PdfVerificationService(pdf_file).get_valid_qrcodes()
+            # 2 is enough to tell there are multiple ones
+            valid_qrcodes = PdfVerificationService(pdf_file).get_valid_qrcodes(limit=2)
         except Exception as e:
             if "file has not been decrypted" in str(e):
                 return {
@@ -227,36 +262,69 @@ class OaVerificationService:
 
         return OaVerificationService().verify_json_tt_document(cleartext)
 
-    def kick_verify_api(self):
+    def _get_cache_key(self, json_content):
         """
-        Call the healthcheck API to ensure it's warm and ready
+        The same wrapped document has the same verification result, so it's cached by its
+        merkleRoot and targetHash; but only if the document data matches them (the signature
+        is checked locally, cheap) - otherwise the altered document would get the cached result
         """
-        if not settings.OA_VERIFY_API_HEALTHCHECK_URL:
-            return False
-        t0 = time.time()
-        try:
-            kick_resp = requests.get(settings.OA_VERIFY_API_HEALTHCHECK_URL)
-        except Exception as e:
-            logger.error(
-                "Verifier healthcheck temporary unavailable (%s)", str(e)
+        if not settings.OA_VERIFY_CACHE_TIMEOUT or not isinstance(json_content, dict):
+            return None
+        if not verify_signature(json_content):
+            # not OA v2 or tampered with, the verifier will tell
+            return None
+        signature = json_content["signature"]
+        return "oa_verify_{}_{}".format(signature["merkleRoot"], signature["targetHash"])
+
+    def _get_cached_verify_result(self, cache_key):
+        """
+        Returns (verifier response, is the status known); with the native verifier the response
+        of the document known to be valid is kept longer than its issuance/revocation status,
+        so when the status expires only the document store is asked again
+        """
+        if not cache_key:
+            return None, False
+        cached = cache.get_many([cache_key, cache_key + "_status"])
+        api_verify_resp = cached.get(cache_key)
+        return api_verify_resp, api_verify_resp is not None and cache_key + "_status" in cached
+
+    def _cache_verify_result(self, cache_key, api_verify_resp, status, keep_fragments=False):
+        if not cache_key:
+            return
+        if status == "valid":
+            status_timeout = min(settings.OA_VERIFY_STATUS_CACHE_TIMEOUT, settings.OA_VERIFY_CACHE_TIMEOUT)
+            # the API result can't be partially re-checked, so it's not worth keeping longer
+            cache.set(
+                cache_key,
+                api_verify_resp,
+                settings.OA_VERIFY_CACHE_TIMEOUT if keep_fragments else status_timeout,
             )
-            return False
+            cache.set(cache_key + "_status", True, status_timeout)
         else:
-            if kick_resp.status_code != 200:
-                logger.warning(
-                    "OA Verify API healthcheck resp %s, %s",
-                    kick_resp.status_code,
-                    kick_resp.content
-                )
-
-        kick_timeout = time.time() - t0
-        logger.info(
-            "Verifier healthcheck resp is %s, %ss",
-            kick_resp.status_code,
-            round(kick_timeout, 4)
-        )
-        return kick_resp.status_code == 200
+            # revoked since, or the verifier is misconfigured - don't reuse the previous result
+            cache.delete_many([cache_key, cache_key + "_status"])
 
+    def _verify_tt_json_file(self, file_content, json_content, native_verifier=None, previous_resp=None):
+        """
+        Return the verification fragments, the same as the remote OA verification API returns;
+        the native verifier is used if given (re-checking only the status of the previous
+        response, if any), and the API - for the documents it doesn't support
+        or if the Ethereum node is unavailable
+        """
+        if native_verifier is not None:
+            try:
+                if previous_resp is not None:
+                    return native_verifier.verify_status(json_content, previous_resp)
+                return native_verifier.verify(json_content)
+            except NativeVerificationUnsupported as e:
+                logger.info("The document can't be verified natively (%s), using the API", e)
+            except NativeVerificationError as e:
+                if not settings.OA_VERIFY_API_URL:
+                    raise OaVerificationError(f"{e}; please try again later.")
+                logger.warning("Native verification failed (%s), using the API", e)
+        return self._api_verify_tt_json_file(file_content)
+
+    @statsd_timer("oa_verify.api.verify")
     def _api_verify_tt_json_file(self, file_content):
         """
         Return response from the remote OA verification API
@@ -265,18 +333,29 @@ class OaVerificationService:
         Raises OaVerificationError with details if it's impossible
         Or returns raw verify endpoint response as dict if success
         """
+        if not health.is_available():
+            # known to be down (see oa_verify.health), don't make the user wait for the timeout
+            raise OaVerificationError(
+                "Verifier is temporary unavailable; "
+                "please try again later. We are already aware of that issue and working on it."
+            )
+        t0 = time.time()
         try:
-            resp = requests.post(
+            resp = health.get_session().post(
                 settings.OA_VERIFY_API_URL,
                 files={
                     "file": file_content,
                 },
+                timeout=VERIFY_API_TIMEOUT,
             )
         except Exception as e:
+            health.record_result(False)
             raise OaVerificationError(
                 f"Verifier is temporary unavailable (reported {e.__class__.__name__}); "
                 f"please try again later. We are already aware of that issue and working on it."
             )
+        # 400 is the verifier working, but not accepting the file
+        health.record_result(resp.status_code < 500, time.time() - t0)
         if resp.status_code == 200:
             # now it contains list of dicts, each tells us something
             # about one aspect of the OA document
@@ -357,6 +436,11 @@ class OaVerificationService:
         Or just the OA-coded value if can't perform request with 200 resp
         """
         url = unwrapped_file.get("data", {}).get("$template", {}).get("url")
+        # the same few renderers for all the documents
+        cache_key = "oa_template_url_{}".format(hashlib.sha1(str(url).encode("utf-8")).hexdigest())
+        ret = cache.get(cache_key)
+        if ret is not None:
+            return ret
         try:
             url_resp = requests.get(url)
         except Exception as e:
@@ -369,6 +453,9 @@ class OaVerificationService:
                 ret = url
             if ret and not ret.startswith("http"):
                 ret = "https://" + ret
+            if url_resp.status_code == 200:
+                # errors aren't cached, the renderer may be back soon
+                cache.set(cache_key, ret, settings.OA_TEMPLATE_URL_CACHE_TIMEOUT)
         return ret
 
 
@@ -380,10 +467,20 @@ class PdfVerificationService:
     https://github.com/gs-gs/ha-igl-project/issues/54
     """
 
+    MAX_PAGES = 20  # performance
+    # the pages without QR codes found are rasterised again with the next DPI;
+    # the codes of the usual size are readable at the first one, which is 4 times faster
+    RASTERISATION_DPIS = (100, 200)
+    # where our watermark is put by default (DocumentWatermarkService.get_qr_position)
+    WATERMARK_POSITION = (0.83, 0.96)
+    # regions where the QR codes were found in the documents of the same producer and layout
+    LOCATOR_CACHE_TIMEOUT = 3600 * 24 * 7
+    LOCATOR_CACHE_REGIONS = 3
+
     def __init__(self, pdf_file: bytes):
         self._pdf_binary = pdf_file
 
-    def get_valid_qrcodes(self):
+    def get_valid_qrcodes(self, limit: int = None):
         """
         For the PDF with which this service has been initialized
         Tries to parse it
@@ -391,146 +488,205 @@ class PdfVerificationService:
         And if parsed - verify QR code format to be one of supported ones
         And return the text from all the supported QR codes
 
+        The images (identical ones only once) and then, if no codes found there, pages rasterised
+        with increasing DPI are decoded in the process pool (see oa_verify.qrcodes);
+        limit stops the work as soon as that many supported QR codes are found.
+        The likely regions of every image or page are decoded before the whole one,
+        which is skipped if a supported code is found there
+
         Seems to handle scanned PDFs well, but real usage will give us a lot of complex PDFs which
         are not supported - so just need to be considered as well
         """
         qr_texts_found = set()
 
+        def is_done():
+            return limit is not None and len(qr_texts_found) >= limit
+
+        def add_found(kind, result):
+            texts, region = result or (set(), None)
+            # we filter out all which are not supported
+            supported = {text for text in texts if self.is_qr_of_supported_format(text)}
+            if supported:
+                qr_texts_found.update(supported)
+                self._remember_region(pdf_info, kind, region)
+
+        reader = self._get_reader()
+        if reader is None:
+            # known to be unparseable, only the rasterisation is left
+            pdf_info = get_unparseable_info(self._pdf_binary)
+        else:
+            # the same reader, so the file is parsed once
+            pdf_info = inspect_pdf(self._pdf_binary, reader=reader)
+
+        if any(page["images"] for page in pdf_info["pages"][:self.MAX_PAGES]):
+            regions = self._get_likely_regions(pdf_info, "image")
+            image_tasks = self._get_image_tasks(reader, pdf_info, regions)
+            for _, result in run_until_done(image_tasks, is_done):
+                add_found("image", result)
+
+        if not qr_texts_found:
+            # unparseable PDF, no images or no QR codes in them: try another library
+            # to rasterize that PDF and read QRs from images
+            from pdf2image import pdfinfo_from_path
+
+            regions = self._get_likely_regions(pdf_info, "page")
+            with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+                self._pdf_binary.seek(0)
+                shutil.copyfileobj(self._pdf_binary, pdf_file)
+                pdf_file.flush()
+                pages_count = pdf_info["pages_count"] or pdfinfo_from_path(pdf_file.name)["Pages"]
+                for dpi in self.RASTERISATION_DPIS:
+                    page_tasks = [
+                        ((page_number,), decode_page, (pdf_file.name, page_number, dpi, regions))
+                        for page_number in range(min(pages_count, self.MAX_PAGES))
+                    ]
+                    for _, result in run_until_done(page_tasks, is_done):
+                        add_found("page", result)
+                    if qr_texts_found:
+                        break
+
+        return list(qr_texts_found) or None
+
+    def _get_locator_cache_key(self, pdf_info, kind):
+        """
+        Documents of the same producer and first page layout usually have
+        the QR code at the same place; None if there is nothing to tell them by
+        """
+        if not pdf_info["pages"]:
+            return None
+        first_page = pdf_info["pages"][0]
+        fingerprint = "{}|{}|{}|{}".format(
+            pdf_info.get("producer") or "",
+            kind,
+            ",".join(str(round(value)) for value in first_page["mediabox"]),
+            first_page["rotate"],
+        )
+        return "qr_locator_{}".format(hashlib.sha1(fingerprint.encode("utf-8")).hexdigest())
+
+    def _get_likely_regions(self, pdf_info, kind) -> list:
+        """
+        Regions of the image ("image") or rasterised page ("page") to search first:
+        where the QR codes of the similar documents were found, our watermark and the corners
+        """
+        regions = []
+        cache_key = self._get_locator_cache_key(pdf_info, kind)
+        if cache_key:
+            regions.extend(tuple(region) for region in cache.get(cache_key) or [])
+        if kind == "page" and pdf_info["pages"] and pdf_info["pages"][0]["rotate"] % 360 == 0:
+            regions.append(self._get_watermark_region(pdf_info["pages"][0]["mediabox"]))
+        for region in CORNER_REGIONS:
+            if region not in regions:
+                regions.append(region)
+        return regions
+
+    def _get_watermark_region(self, mediabox):
+        """
+        Relative (from the top left corner) region of the default position watermark, with the margin
+        """
+        page_width = float(mediabox[2]) - float(mediabox[0])
+        page_height = float(mediabox[3]) - float(mediabox[1])
+        # millimetres to points
+        qr_size = config.QR_CODE_SIZE_MM * 72 / 25.4
+        margin_x, margin_y = qr_size / page_width, qr_size / page_height
+        left = self.WATERMARK_POSITION[0]
+        top = 1 - self.WATERMARK_POSITION[1]
+        return (
+            round(max(left - margin_x, 0), 3),
+            round(max(top - margin_y, 0), 3),
+            round(min(left + margin_x * 2, 1), 3),
+            round(min(top + margin_y * 2, 1), 3),
+        )
+
+    def _remember_region(self, pdf_info, kind, region):
+        cache_key = self._get_locator_cache_key(pdf_info, kind)
+        if not cache_key or not region:
+            return
         try:
-            reader = PyPDF2.PdfFileReader(self._pdf_binary)
-            pages_count = reader.numPages
+            regions = [tuple(r) for r in cache.get(cache_key) or [] if tuple(r) != tuple(region)]
+            regions.insert(0, tuple(region))
+            cache.set(cache_key, regions[:self.LOCATOR_CACHE_REGIONS], self.LOCATOR_CACHE_TIMEOUT)
         except Exception as e:
+            # just a hint for the next time
             logger.exception(e)
-            # try another library to rasterize that PDF and read QRs from images
-            qr_texts_found = self._try_rasterisation()
-        else:
-            # PDF can be parsed, do it
-            if pages_count > 20:
-                pages_count = 20  # performance
-            for page_num in range(0, pages_count):
-                page = reader.getPage(page_num)
-
-                if '/XObject' in page['/Resources']:
-                    xObject = page['/Resources']['/XObject'].getObject()
-                    qr_texts_found = qr_texts_found.union(self._parse_xobject(xObject))
-                else:
-                    # nothing to parse - no xobjects
-                    pass
-            if not qr_texts_found:
-                # try rasterisation in that case as well
-                qr_texts_found = self._try_rasterisation()
-
-        # now qr_texts_found contains all texts of any format from the first page of that PDF
-        # first - we filter out all which are not supported
-        supported_qr_codes = []
-        for qr_code in qr_texts_found:
-            if self.is_qr_of_supported_format(qr_code):
-                supported_qr_codes.append(qr_code)
-        return supported_qr_codes or None
-
-    def _parse_xobject(self, xObject):
-        """
-        For given xObject
-        Tries to parse it as Image or, in case of Form, parses it recursively
-        """
-        qrtexts_in_that_xobject = set()
-        for obj in xObject:
-            try:
-                if xObject[obj]['/Subtype'] == '/Form':
-                    if '/XObject' in xObject[obj]['/Resources']:
-                        qrtexts_in_that_xobject = qrtexts_in_that_xobject.union(
-                            self._parse_xobject(xObject[obj]['/Resources']['/XObject'].getObject())
-                        )
-                elif xObject[obj]['/Subtype'] == '/Image':
-                    size = (xObject[obj]['/Width'], xObject[obj]['/Height'])
-                    data = xObject[obj].getData()  # already unfiltered
-                    if xObject[obj]['/ColorSpace'] == '/DeviceRGB':
-                        mode = "RGB"
-                    else:
-                        mode = "P"
-
-                    if '/Filter' in xObject[obj]:
-                        filters = xObject[obj]['/Filter']
-
-                        # we are interested only in last filter because PyPDF2 does all unpacking for us
-                        if isinstance(filters, list):
-                            the_filter = filters[-1]
-                        else:
-                            the_filter = filters
-
-                        # now we parse the image, assuming all filters were unfiltered
-                        if the_filter == '/FlateDecode':
-                            img = Image.frombytes(mode, size, data)
-                        elif the_filter == '/DCTDecode':
-                            # data is already JPEG
-                            img = Image.open(BytesIO(data))
-                        elif the_filter == '/JPXDecode':
-                            # data is already jp2 format
-                            img = Image.open(BytesIO(data))
-                        elif the_filter == '/CCITTFaxDecode':
-                            # data is already tiff format
-                            img = Image.open(BytesIO(data))
-                        else:
-                            # unsupported something, ignore that file
-                            logger.warning("Unsupported PDF image filter %s", the_filter)
-                            img = None
-                    else:
-                        img = Image.frombytes(mode, size, data)
 
-                    if img:
-                        qr_texts_in_this_image = self.parse_qr_code(img)
-                        if qr_texts_in_this_image:
-                            qrtexts_in_that_xobject = qrtexts_in_that_xobject.union(qr_texts_in_this_image)
+    def _get_reader(self):
+        try:
+            self._pdf_binary.seek(0)
+            reader = PyPDF2.PdfFileReader(self._pdf_binary, strict=False)
+        except Exception as e:
+            logger.exception(e)
+            return None
+        if reader.isEncrypted:
+            try:
+                # files protected only from updates have the empty password
+                reader.decrypt("")
             except Exception as e:
-                # some parsing issue, just skip to the next xObject
-                # we won't read images from that block but at least there is a chance that we don't need it anyway
-                logger.exception(e)
-        return qrtexts_in_that_xobject
+                # the inspection result tells if the pages can be read at all
+                logger.info("Unable to decrypt the PDF: %s", e)
+        return reader
 
-    def parse_qr_code(self, img: Image):
-        decoded_texts = set()
-        for decoded in pyzbar_decode(img):
-            if decoded.type == "QRCODE":
-                decoded_texts.add(decoded.data.decode("utf-8"))
-        return decoded_texts or None
+    def _get_image_tasks(self, reader, pdf_info, regions=()):
+        """
+        Decoding tasks for the images of the first pages from the inspection inventory,
+        the same image (used on many pages, or just identical content) is decoded once
+        """
+        images = {}  # content hash: [pages, decode args]
+        for page_number, page in enumerate(pdf_info["pages"][:self.MAX_PAGES]):
+            for image_info in page["images"]:
+                try:
+                    image = reader.getObject(PyPDF2.generic.IndirectObject(*image_info["ref"], reader))
+                    # of the encoded data, so the duplicates are not even unpacked
+                    digest = hashlib.sha1(image._data).hexdigest()
+                    if digest not in images:
+                        args = self._get_image_args(image)
+                        if args is not None:
+                            args = args + (regions,)
+                        images[digest] = [set(), args]
+                    images[digest][0].add(page_number)
+                except Exception as e:
+                    # some parsing issue, just skip to the next image
+                    # we won't read that image but at least there is a chance that we don't need it anyway
+                    logger.exception(e)
+        return [
+            (tuple(pages), decode_image, args)
+            for pages, args in images.values()
+            if args is not None
+        ]
+
+    def _get_image_args(self, image):
+        """
+        decode_image arguments for the PDF image XObject, or None if its format is not supported
+        """
+        size = (image['/Width'], image['/Height'])
+        data = image.getData()  # already unfiltered
+        if image['/ColorSpace'] == '/DeviceRGB':
+            mode = "RGB"
+        else:
+            mode = "P"
 
-    def is_qr_of_supported_format(self, text: str) -> bool:
-        if text.startswith("tradetrust://{") and text.endswith("}"):
-            json_body = text[len("tradetrust://"):]
-            try:
-                json.loads(json_body)
-            except Exception:
-                pass
+        if '/Filter' in image:
+            filters = image['/Filter']
+
+            # we are interested only in last filter because PyPDF2 does all unpacking for us
+            if isinstance(filters, list):
+                the_filter = filters[-1]
             else:
-                return True  # tradetrust format, JSON with prefix
-        if text.startswith("http://") or text.startswith("https://"):
-            # possibly a link format
-            try:
-                components = urllib.parse.urlparse(text)
-                params = urllib.parse.parse_qs(components.query)
-                req = json.loads(params["q"][0])
-                if req["type"].upper() == "DOCUMENT":
-                    req["payload"]["uri"]
-                    req["payload"]["key"]  # it's always AES
-                else:
-                    raise KeyError("Not a DOCUMENT type")
-            except KeyError:
-                pass  # not our case
+                the_filter = filters
+
+            # now we parse the image, assuming all filters were unfiltered
+            if the_filter == '/FlateDecode':
+                return mode, size, True, data
+            elif the_filter in ('/DCTDecode', '/JPXDecode', '/CCITTFaxDecode'):
+                # data is already JPEG, jp2 or tiff format
+                return mode, size, False, data
             else:
-                return True  # http format
-        return False
-
-    def _try_rasterisation(self):
-        """
-        Convert all pages to images and feeds them to QR code finder
-        This is used as last resort when usual PDF parsing wasn't able to find any codes
-        """
-        from pdf2image import convert_from_bytes
-        qrcodes = set()
-        self._pdf_binary.seek(0)
-        images = convert_from_bytes(self._pdf_binary.read())
-        for image in images:
-            this_page_codes = self.parse_qr_code(image)
-            if this_page_codes:
-                qrcodes = qrcodes.union(this_page_codes)
-        return qrcodes
+                # unsupported something, ignore that file
+                logger.warning("Unsupported PDF image filter %s", the_filter)
+                return None
+        return mode, size, True, data
+
+    def parse_qr_code(self, img: Image):
+        return decode_qrcodes(img) or None
+
+    def is_qr_of_supported_format(self, text: str) -> bool:
+        return is_supported_qrcode(text)
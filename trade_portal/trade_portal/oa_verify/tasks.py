@@ -0,0 +1,11 @@
+from config import celery_app
+from trade_portal.oa_verify import health
+
+
+@celery_app.task(ignore_result=True, time_limit=60, soft_time_limit=50)
+def keep_verify_api_warm():
+    """
+    Scheduled ping of the OA verify API, so the verification requests don't wait
+    for the cold start and know whether the verifier is up
+    """
+    health.ping()
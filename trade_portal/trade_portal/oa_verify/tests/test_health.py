@@ -0,0 +1,71 @@
+import time
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+
+from trade_portal.documents.tests.tests_services_lodge import MockResponse
+from trade_portal.oa_verify import health
+from trade_portal.oa_verify.services import OaVerificationError, OaVerificationService
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def breaker_settings(settings):
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    settings.OA_VERIFY_API_URL = "http://verifier/verify/fragments"
+    settings.OA_VERIFY_API_HEALTHCHECK_URL = "http://verifier/healthcheck"
+    settings.OA_VERIFY_BREAKER_FAILURES = 2
+    settings.OA_VERIFY_BREAKER_RESET_TIMEOUT = 30
+    # the locmem caches share the storage, so the breaker state would leak between the tests
+    cache.delete(health.HEALTH_CACHE_KEY)
+    yield settings
+    cache.delete(health.HEALTH_CACHE_KEY)
+
+
+def test_circuit_breaker(breaker_settings):
+    assert health.get_breaker_state() == health.CLOSED
+    health.record_result(False)
+    assert health.is_available()
+    health.record_result(False)
+    assert health.get_breaker_state() == health.OPEN
+    assert not health.is_available()
+
+    # after the reset timeout the next call tries the verifier, the failure opens the breaker again
+    with mock.patch("time.time", return_value=time.time() + 31):
+        assert health.get_breaker_state() == health.HALF_OPEN
+        health.record_result(False)
+        assert health.get_breaker_state() == health.OPEN
+
+    health.record_result(True, 0.5)
+    assert health.get_health()["state"] == health.CLOSED
+    assert health.get_health()["failures"] == 0
+    assert health.get_health()["latency"] == 0.5
+
+
+def test_ping(breaker_settings):
+    with mock.patch.object(health.get_session(), "get") as get_mock:
+        get_mock.return_value = MockResponse(status_code=200, json_resp={})
+        assert health.ping() is True
+        assert get_mock.call_args[0][0] == "http://verifier/healthcheck"
+        assert health.get_health()["latency"] is not None
+
+        get_mock.side_effect = ConnectionError()
+        assert health.ping() is False
+        assert health.ping() is False
+    assert not health.is_available()
+
+
+def test_verify_fails_fast(breaker_settings):
+    with mock.patch.object(health.get_session(), "post") as post_mock:
+        post_mock.return_value = MockResponse(status_code=502, json_resp={})
+        for _ in range(2):
+            with pytest.raises(OaVerificationError):
+                OaVerificationService()._api_verify_tt_json_file(b"{}")
+        assert post_mock.call_count == 2
+
+        # known to be down, not called
+        with pytest.raises(OaVerificationError):
+            OaVerificationService()._api_verify_tt_json_file(b"{}")
+        assert post_mock.call_count == 2
@@ -0,0 +1,214 @@
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from trade_portal.oa_verify.native import (
+    LocalChainProvider,
+    NativeVerificationUnsupported,
+    NativeVerifier,
+)
+from trade_portal.oa_verify.services import OaVerificationService
+from trade_portal.utils import oa_v2
+
+pytestmark = pytest.mark.django_db
+
+ASSETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets")
+STORE = "0xd1F122506c02063913939acC4451B7C26aD7FCC9"
+LOCATION = "wpca-alpha.datatrust.link"
+RECORDS = {LOCATION: [f"openatts net=ethereum netId=3 addr={STORE.lower()}"]}
+
+
+def load_document():
+    with open(os.path.join(ASSETS_PATH, "simple-oa.json"), "rb") as f:
+        return json.loads(f.read())
+
+
+def get_verifier(chain):
+    return NativeVerifier(provider=chain, resolver=lambda domain: RECORDS.get(domain, []))
+
+
+def statuses(fragments):
+    return {fragment["name"]: fragment["status"] for fragment in fragments}
+
+
+def test_native_verifier_valid():
+    document = load_document()
+    chain = LocalChainProvider(network_id="3")
+    chain.issue(STORE, document["signature"]["merkleRoot"])
+
+    fragments = get_verifier(chain).verify(document)
+
+    # the same fragments the OA verify API returns
+    assert statuses(fragments) == {
+        "OpenAttestationHash": "VALID",
+        "OpenAttestationEthereumTokenRegistryStatus": "SKIPPED",
+        "OpenAttestationEthereumDocumentStoreStatus": "VALID",
+        "OpenAttestationDidSignedDocumentStatus": "SKIPPED",
+        "OpenAttestationDnsTxtIdentityProof": "VALID",
+        "OpenAttestationDnsDidIdentityProof": "SKIPPED",
+    }
+    store_fragment = fragments[2]
+    assert store_fragment["data"] == {
+        "issuedOnAll": True,
+        "revokedOnAny": False,
+        "details": {
+            "issuance": [{"issued": True, "address": STORE}],
+            "revocation": [{"revoked": False, "address": STORE}],
+        },
+    }
+    assert fragments[4]["data"] == [{"status": "VALID", "location": LOCATION, "value": STORE}]
+    # all the document store calls in one batch
+    assert chain.calls_count == 1
+
+
+def test_native_verifier_invalid():
+    document = load_document()
+    chain = LocalChainProvider(network_id="3")
+    chain.deploy(STORE)
+    # not issued
+    assert statuses(get_verifier(chain).verify(document))["OpenAttestationEthereumDocumentStoreStatus"] == "INVALID"
+
+    chain.issue(STORE, document["signature"]["merkleRoot"])
+    chain.revoke(STORE, document["signature"]["targetHash"])
+    fragment = get_verifier(chain).verify(document)[2]
+    assert fragment["status"] == "INVALID"
+    assert fragment["reason"]["codeString"] == "DOCUMENT_REVOKED"
+    assert fragment["data"]["revokedOnAny"] is True
+
+    # the DNS record is for another network
+    fragments = get_verifier(LocalChainProvider(network_id="1")).verify(document)
+    assert statuses(fragments)["OpenAttestationDnsTxtIdentityProof"] == "INVALID"
+
+    # tampered, the salt is kept
+    document["data"]["recipient"]["name"] = document["data"]["recipient"]["name"].rsplit(":", 1)[0] + ":changed"
+    chain = LocalChainProvider(network_id="3")
+    fragments = get_verifier(chain).verify(document)
+    assert statuses(fragments)["OpenAttestationHash"] == "INVALID"
+    assert chain.calls_count == 0
+
+
+def test_native_verifier_batch():
+    """
+    The revocation is checked for the document, the intermediate hashes and the merkle root
+    """
+    documents = oa_v2.wrap_documents([
+        {
+            "issuers": [{
+                "name": "Issuer",
+                "documentStore": STORE,
+                "identityProof": {"type": "DNS-TXT", "location": LOCATION},
+            }],
+            "number": str(number),
+        }
+        for number in range(3)
+    ])
+    chain = LocalChainProvider(network_id="3")
+    chain.issue(STORE, documents[0]["signature"]["merkleRoot"])
+    for document in documents:
+        assert statuses(get_verifier(chain).verify(document))["OpenAttestationEthereumDocumentStoreStatus"] == "VALID"
+
+    chain.revoke(STORE, documents[0]["signature"]["merkleRoot"])
+    for document in documents:
+        assert get_verifier(chain).verify(document)[2]["reason"]["codeString"] == "DOCUMENT_REVOKED"
+
+
+def test_native_verifier_no_contract():
+    """
+    The document store is not deployed on the network of the node (another chain or a fake store)
+    """
+    document = load_document()
+    fragment = get_verifier(LocalChainProvider(network_id="3")).verify(document)[2]
+    assert fragment["status"] == "INVALID"
+    assert fragment["reason"]["codeString"] == "CONTRACT_ADDRESS_INVALID"
+
+
+def test_native_verifier_status():
+    """
+    Only the document store is asked again, the other fragments are reused
+    """
+    document = load_document()
+    chain = LocalChainProvider(network_id="3")
+    chain.issue(STORE, document["signature"]["merkleRoot"])
+    fragments = get_verifier(chain).verify(document)
+
+    chain.revoke(STORE, document["signature"]["targetHash"])
+    resolver = mock.MagicMock()
+    rechecked = NativeVerifier(provider=chain, resolver=resolver).verify_status(document, fragments)
+
+    assert statuses(rechecked)["OpenAttestationEthereumDocumentStoreStatus"] == "INVALID"
+    assert rechecked[4] == fragments[4]
+    assert resolver.call_count == 0
+    assert chain.calls_count == 2
+
+
+def test_native_verifier_unsupported():
+    document = load_document()
+    document["data"]["issuers"][0].pop("documentStore")
+    document["data"]["issuers"][0]["tokenRegistry"] = "0xd1F122506c02063913939acC4451B7C26aD7FCC9"
+    with pytest.raises(NativeVerificationUnsupported):
+        get_verifier(LocalChainProvider()).verify(document)
+
+    # malformed issuers
+    for issuers in (["issuer"], [{"documentStore": STORE, "identityProof": {"type": "DNS-TXT"}}]):
+        document = oa_v2.wrap_document({"issuers": issuers})
+        with pytest.raises(NativeVerificationUnsupported):
+            get_verifier(LocalChainProvider()).verify(document)
+
+
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService._api_verify_tt_json_file")
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService._retrieve_template_url")
+@mock.patch("trade_portal.oa_verify.services.get_native_verifier")
+def test_verify_tt_document_native(native_mock, retr_mock, api_verify_mock, settings):
+    settings.OA_VERIFY_MODE = "native"
+    document = load_document()
+    chain = LocalChainProvider(network_id="3")
+    chain.issue(STORE, document["signature"]["merkleRoot"])
+    native_mock.return_value = get_verifier(chain)
+    retr_mock.return_value = "https://template-url/"
+
+    verify_result = OaVerificationService().verify_json_tt_document(json.dumps(document).encode("utf-8"))
+
+    assert verify_result["status"] == "valid"
+    assert len(verify_result["verify_result_rotated"]) == 6
+    assert api_verify_mock.call_count == 0
+
+    # token registries are verified by the API
+    document["data"]["issuers"][0]["documentStore"] = ""
+    api_verify_mock.return_value = []
+    OaVerificationService().verify_json_tt_document(json.dumps(document).encode("utf-8"))
+    assert api_verify_mock.call_count == 1
+
+
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService._api_verify_tt_json_file")
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService._retrieve_template_url")
+@mock.patch("trade_portal.oa_verify.services.get_native_verifier")
+def test_verify_tt_document_native_cache(native_mock, retr_mock, api_verify_mock, settings):
+    from django.core.cache import cache
+
+    settings.OA_VERIFY_MODE = "native"
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    settings.OA_VERIFY_CACHE_TIMEOUT = 3600
+    settings.OA_VERIFY_STATUS_CACHE_TIMEOUT = 600
+    document = load_document()
+    tt_document = json.dumps(document).encode("utf-8")
+    cache_key = "oa_verify_{}_{}".format(document["signature"]["merkleRoot"], document["signature"]["targetHash"])
+    chain = LocalChainProvider(network_id="3")
+    chain.issue(STORE, document["signature"]["merkleRoot"])
+    resolver = mock.MagicMock(return_value=RECORDS[LOCATION])
+    native_mock.return_value = NativeVerifier(provider=chain, resolver=resolver)
+    retr_mock.return_value = "https://template-url/"
+
+    assert OaVerificationService().verify_json_tt_document(tt_document)["status"] == "valid"
+    assert OaVerificationService().verify_json_tt_document(tt_document)["status"] == "valid"
+    assert chain.calls_count == 1
+
+    # the status expires earlier, then only the document store is asked
+    cache.delete(cache_key + "_status")
+    chain.revoke(STORE, document["signature"]["targetHash"])
+    assert OaVerificationService().verify_json_tt_document(tt_document)["status"] == "invalid"
+    assert chain.calls_count == 2
+    assert resolver.call_count == 1
+    assert api_verify_mock.call_count == 0
+    assert cache.get(cache_key) is None
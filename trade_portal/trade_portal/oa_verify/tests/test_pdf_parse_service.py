@@ -1,8 +1,11 @@
+import io
 import os
+from unittest import mock
 
 import pytest
 
 from trade_portal.oa_verify.services import PdfVerificationService
+from trade_portal.utils.pdf_inspect import inspect_pdf
 
 
 pytestmark = pytest.mark.django_db
@@ -91,3 +94,47 @@ def test_pdf_parse_service():
     scanned = open(os.path.join(ASSETS_PATH, "protected_printing_allowed-no-qr.pdf"), "rb")
     s = PdfVerificationService(scanned)
     assert s.get_valid_qrcodes() is None
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_pdf_parse_service_limit(settings, processes):
+    settings.PDF_QR_EXTRACTION_PROCESSES = processes
+    ASSETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets")
+
+    # 2 images with different codes, the work stops after the first decoded one
+    with open(os.path.join(ASSETS_PATH, "2-different-qrcodes-duplicates-rasterized.pdf"), "rb") as f:
+        assert len(PdfVerificationService(f).get_valid_qrcodes(limit=1)) == 1
+    with open(os.path.join(ASSETS_PATH, "2-different-qrcodes-duplicates-rasterized.pdf"), "rb") as f:
+        assert len(PdfVerificationService(f).get_valid_qrcodes(limit=2)) == 2
+
+    # found only by the rasterisation
+    with open(os.path.join(ASSETS_PATH, "protected-from-update-with-qr.pdf"), "rb") as f:
+        assert len(PdfVerificationService(f).get_valid_qrcodes(limit=1)) == 1
+
+
+def test_pdf_parse_service_locator_cache():
+    from django.core.cache import cache
+
+    ASSETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets")
+    with open(os.path.join(ASSETS_PATH, "tt_qr_code_format.pdf"), "rb") as f:
+        s = PdfVerificationService(f)
+        pdf_info = inspect_pdf(f)
+        cache_key = s._get_locator_cache_key(pdf_info, "page")
+        cache.delete(cache_key)
+        assert len(s.get_valid_qrcodes(limit=1)) == 1
+
+    # the region the code was found in is searched first for the similar documents
+    region = cache.get(cache_key)[0]
+    assert len(region) == 4 and 0 <= region[0] < region[2] <= 1 and 0 <= region[1] < region[3] <= 1
+    assert PdfVerificationService(None)._get_likely_regions(pdf_info, "page")[0] == tuple(region)
+    with open(os.path.join(ASSETS_PATH, "tt_qr_code_format.pdf"), "rb") as f:
+        assert len(PdfVerificationService(f).get_valid_qrcodes(limit=1)) == 1
+    cache.delete(cache_key)
+
+
+@mock.patch("trade_portal.oa_verify.services.inspect_pdf")
+def test_pdf_parse_service_unparseable(inspect_mock):
+    # not parsed again after the reader failed, the rasterisation fails too
+    with pytest.raises(Exception):
+        PdfVerificationService(io.BytesIO(b"not a PDF")).get_valid_qrcodes()
+    assert inspect_mock.call_count == 0
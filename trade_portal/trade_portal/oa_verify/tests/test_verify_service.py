@@ -85,9 +85,8 @@ TYPICAL_VERIFY_RESP = [
 ]
 
 
-@mock.patch("trade_portal.oa_verify.services.OaVerificationService.kick_verify_api")
 @mock.patch("trade_portal.oa_verify.services.OaVerificationService._api_verify_tt_json_file")
-def test_verify_tt_document(api_verify_mock, kick_mock):
+def test_verify_tt_document(api_verify_mock):
     ASSETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets")
 
     tt_document = open(os.path.join(ASSETS_PATH, "simple-oa.json"), "rb").read()
@@ -97,7 +96,6 @@ def test_verify_tt_document(api_verify_mock, kick_mock):
 
     verify_result = s.verify_json_tt_document(tt_document)
 
-    assert kick_mock.call_count == 1
     assert api_verify_mock.call_count == 1
 
     assert verify_result.get("attachments") == []
@@ -108,11 +106,10 @@ def test_verify_tt_document(api_verify_mock, kick_mock):
     assert verify_result["verify_result"] == api_verify_mock.return_value
 
 
-@mock.patch("trade_portal.oa_verify.services.OaVerificationService.kick_verify_api")
 @mock.patch("trade_portal.oa_verify.services.OaVerificationService._api_verify_tt_json_file")
 @mock.patch("requests.get")
 @mock.patch("trade_portal.oa_verify.services.OaVerificationService._retrieve_template_url")
-def test_verify_pdf_file(retr_mock, get_mock, api_verify_mock, kick_mock):
+def test_verify_pdf_file(retr_mock, get_mock, api_verify_mock):
     ASSETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets")
 
     scanned = open(os.path.join(ASSETS_PATH, "scanned-3.pdf"), "rb")
@@ -127,12 +124,10 @@ def test_verify_pdf_file(retr_mock, get_mock, api_verify_mock, kick_mock):
             ), "rb").read()
         )
     )
-    kick_mock.return_value = True
     retr_mock.return_value = "https://template-url/"
 
     verify_result = s.verify_pdf_file(scanned)
 
-    assert kick_mock.call_count == 1
     assert api_verify_mock.call_count == 1
     assert get_mock.call_count == 1
 
@@ -141,3 +136,57 @@ def test_verify_pdf_file(retr_mock, get_mock, api_verify_mock, kick_mock):
     assert verify_result["status"] == "valid"
     assert verify_result["template_url"] == "https://template-url/"
     assert verify_result["verify_result"] == api_verify_mock.return_value
+
+
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService.verify_qr_code")
+def test_verify_pdf_file_multiple_qrcodes(verify_qr_mock):
+    ASSETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets")
+
+    with open(os.path.join(ASSETS_PATH, "2-different-qrcodes-duplicates-rasterized.pdf"), "rb") as f:
+        verify_result = OaVerificationService().verify_pdf_file(f)
+
+    assert verify_result["status"] == "error"
+    assert "multiple valid QR codes" in verify_result["error_message"]
+    assert verify_qr_mock.call_count == 0
+
+
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService._api_verify_tt_json_file")
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService._retrieve_template_url")
+def test_verify_tt_document_cache(retr_mock, api_verify_mock, settings):
+    from django.core.cache import cache
+
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    settings.OA_VERIFY_CACHE_TIMEOUT = 3600
+    settings.OA_VERIFY_STATUS_CACHE_TIMEOUT = 600
+    ASSETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets")
+
+    tt_document = open(os.path.join(ASSETS_PATH, "simple-oa.json"), "rb").read()
+    wrapped = json.loads(tt_document)
+    cache_key = "oa_verify_{}_{}".format(wrapped["signature"]["merkleRoot"], wrapped["signature"]["targetHash"])
+    api_verify_mock.return_value = TYPICAL_VERIFY_RESP[:]
+    retr_mock.return_value = "https://template-url/"
+
+    assert OaVerificationService().verify_json_tt_document(tt_document)["status"] == "valid"
+    # repeated verification doesn't call the verifier
+    verify_result = OaVerificationService().verify_json_tt_document(tt_document)
+    assert verify_result["status"] == "valid"
+    assert verify_result["verify_result"] == TYPICAL_VERIFY_RESP
+    assert api_verify_mock.call_count == 1
+
+    # the altered document doesn't match the cached result
+    wrapped["data"]["name"] = "changed"
+    OaVerificationService().verify_json_tt_document(json.dumps(wrapped).encode("utf-8"))
+    assert api_verify_mock.call_count == 2
+
+    # the status expires earlier, then re-checked
+    cache.delete(cache_key + "_status")
+    api_verify_mock.return_value = [
+        dict(row, status="INVALID") if row["type"] == "DOCUMENT_STATUS" else row
+        for row in TYPICAL_VERIFY_RESP
+    ]
+    assert OaVerificationService().verify_json_tt_document(tt_document)["status"] == "invalid"
+    assert api_verify_mock.call_count == 3
+    # the revoked document isn't served from the cache anymore
+    assert cache.get(cache_key) is None
+    assert OaVerificationService().verify_json_tt_document(tt_document)["status"] == "invalid"
+    assert api_verify_mock.call_count == 4
@@ -0,0 +1,166 @@
+"""
+Single parse of the uploaded PDF gathering the facts the later stages need
+(page boxes for the QR code placement, encryption flags, images to look
+for QR codes in), so they don't parse the file again for them
+"""
+import hashlib
+import logging
+
+from PyPDF2 import PdfFileReader
+from PyPDF2.generic import IndirectObject
+
+logger = logging.getLogger(__name__)
+
+# bump when the result format changes, so the stored results are re-calculated
+PDF_INSPECTION_VERSION = 2
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def inspect_pdf(source, reader: PdfFileReader = None) -> dict:
+    """
+    Accepts a seekable file object (and the reader for it if already created)
+    and returns JSON-serialisable dict:
+        {
+            "version": 2,
+            "sha256": "...",  # of the file content
+            "producer": "Microsoft® Word 2016",  # from the document info, if any
+            "size": 12345,
+            "unparseable": False,  # not a PDF or broken one, no other facts then
+            "encrypted": False,  # can't be updated, pages are known if readable with empty password
+            "pages_count": 2,
+            "pages": [
+                {
+                    "mediabox": [0, 0, 595.28, 841.89],
+                    "cropbox": [0, 0, 595.28, 841.89],
+                    "rotate": 0,
+                    # images drawn directly or by forms, inline images aren't included
+                    "images": [{"ref": [12, 0], "width": 600, "height": 600, "filter": "/FlateDecode"}],
+                },
+                ...
+            ],
+        }
+    Never raises for the PDF content issues
+    """
+    info = _get_base_info(source)
+    try:
+        if reader is None:
+            reader = PdfFileReader(source, strict=False)
+        info["encrypted"] = bool(reader.isEncrypted)
+        if info["encrypted"] and not _decrypt(reader):
+            # protected by the password, nothing else to know
+            return info
+        info["producer"] = _get_producer(reader)
+        info["pages_count"] = reader.getNumPages()
+        for page_number in range(info["pages_count"]):
+            info["pages"].append(_inspect_page(reader.getPage(page_number)))
+    except Exception as e:
+        logger.info("The PDF can't be parsed: %s", e)
+        info.update(unparseable=True, pages_count=None, pages=[])
+    return info
+
+
+def get_unparseable_info(source) -> dict:
+    """
+    The inspect_pdf result for the file the reader couldn't be created for,
+    without parsing it again
+    """
+    info = _get_base_info(source)
+    info["unparseable"] = True
+    return info
+
+
+def _get_base_info(source) -> dict:
+    info = {
+        "version": PDF_INSPECTION_VERSION,
+        "unparseable": False,
+        "encrypted": False,
+        "producer": None,
+        "pages_count": None,
+        "pages": [],
+    }
+    info["sha256"], info["size"] = _get_content_hash(source)
+    return info
+
+
+def _get_content_hash(source):
+    source.seek(0)
+    content_hash = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+        content_hash.update(chunk)
+        size += len(chunk)
+    source.seek(0)
+    return content_hash.hexdigest(), size
+
+
+def _decrypt(reader) -> bool:
+    """
+    Files protected only from updates have the empty user password
+    """
+    try:
+        return reader.decrypt("") > 0
+    except Exception as e:
+        # unsupported algorithm
+        logger.info("Unable to decrypt the PDF: %s", e)
+        return False
+
+
+def _get_producer(reader):
+    try:
+        document_info = reader.getDocumentInfo()
+        producer = document_info.producer if document_info else None
+    except Exception as e:
+        # the info dictionary is optional and not always valid
+        logger.info("Unable to read the PDF info: %s", e)
+        return None
+    return str(producer)[:200] if producer else None
+
+
+def _get(dictionary, key, default=None):
+    # unlike .get() resolves the indirect references
+    return dictionary[key] if key in dictionary else default
+
+
+def _box(box):
+    return [round(float(value), 2) for value in box]
+
+
+def _inspect_page(page) -> dict:
+    return {
+        "mediabox": _box(page.mediaBox),
+        "cropbox": _box(page.cropBox),
+        "rotate": int(_get(page, "/Rotate", 0)),
+        "images": _get_images(_get(page, "/Resources"), seen=set()),
+    }
+
+
+def _get_images(resources, seen) -> list:
+    """
+    Image XObjects of the resources dictionary, including the ones of nested forms
+    """
+    images = []
+    if not resources or "/XObject" not in resources:
+        return images
+    xobjects = resources["/XObject"].getObject()
+    for name in xobjects:
+        ref = xobjects.raw_get(name)
+        if not isinstance(ref, IndirectObject) or (ref.idnum, ref.generation) in seen:
+            # streams are always indirect; forms may be shared and even recursive
+            continue
+        seen.add((ref.idnum, ref.generation))
+        xobject = ref.getObject()
+        subtype = _get(xobject, "/Subtype")
+        if subtype == "/Image":
+            image_filter = _get(xobject, "/Filter")
+            if isinstance(image_filter, list):
+                # the last one is the image format, the previous are decoded by PyPDF2
+                image_filter = image_filter[-1] if image_filter else None
+            images.append({
+                "ref": [ref.idnum, ref.generation],
+                "width": int(_get(xobject, "/Width", 0)),
+                "height": int(_get(xobject, "/Height", 0)),
+                "filter": str(image_filter) if image_filter else None,
+            })
+        elif subtype == "/Form":
+            images.extend(_get_images(_get(xobject, "/Resources"), seen))
+    return images
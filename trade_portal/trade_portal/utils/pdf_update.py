@@ -0,0 +1,256 @@
+"""
+PDF incremental update: changed and new objects are appended after the original
+bytes with their own xref section and trailer pointing to the previous one,
+so the original file content isn't parsed into a new document and re-serialised.
+
+The original bytes are never changed, so the signatures covering them stay valid,
+and the original isn't parsed or copied to build the result: it's read partially
+from a seekable file object and the result is streamed to the storage
+by IncrementallyUpdatedFile (the seekable file itself may be a full local copy,
+like the one S3Boto3Storage downloads)
+"""
+import io
+import os
+import re
+import struct
+
+from PyPDF2.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+)
+
+STARTXREF_RE = re.compile(rb"startxref\s+(\d+)\s+%%EOF", re.MULTILINE)
+# startxref is at the end of the file, but some producers add garbage after %%EOF
+STARTXREF_LOOKUP_SIZE = 4096
+# trailer keys inherited by the new section, the rest (/Prev, /Size, /XRefStm) are rewritten
+TRAILER_KEYS = ("/Root", "/Info", "/ID")
+
+
+class PdfUpdateError(Exception):
+    pass
+
+
+def find_startxref(data: bytes) -> int:
+    """
+    Offset of the last xref section, the new one must point to it
+    """
+    matches = list(STARTXREF_RE.finditer(data[-STARTXREF_LOOKUP_SIZE:]))
+    if not matches:
+        raise PdfUpdateError("startxref is not found")
+    return int(matches[-1].group(1))
+
+
+class PdfIncrementalUpdate:
+    """
+    Usage:
+        update = PdfIncrementalUpdate(reader, original_file)
+        ref = update.add_object(some_stream)
+        update.update_object(page_ref, changed_page_dict)
+        default_storage.save(name, IncrementallyUpdatedFile(original_file, update.render()))
+
+    The original PDF using the cross-reference stream (PDF 1.5+) gets the cross-reference
+    stream in the update as well, older ones - the xref table, as readers expect
+    """
+
+    def __init__(self, reader, original):
+        if reader.isEncrypted:
+            # appended objects would have to be encrypted as well
+            raise PdfUpdateError("Encrypted PDFs are not supported")
+        self.reader = reader
+        original.seek(0, os.SEEK_END)
+        self.original_size = original.tell()
+        original.seek(max(self.original_size - STARTXREF_LOOKUP_SIZE, 0))
+        tail = original.read()
+        self.prefix = b"" if tail.endswith(b"\n") else b"\n"
+        self.prev_startxref = find_startxref(tail)
+        if self.prev_startxref >= self.original_size:
+            raise PdfUpdateError("startxref points outside of the file")
+        original.seek(self.prev_startxref)
+        self.xref_stream = not original.read(32).lstrip().startswith(b"xref")
+        self.size = self._get_size(reader)
+        self.objects = {}  # (idnum, generation): object
+
+    @staticmethod
+    def _get_size(reader) -> int:
+        if "/Size" in reader.trailer:
+            return int(reader.trailer["/Size"])
+        # PyPDF2 doesn't copy /Size from the cross-reference streams to the trailer
+        idnums = list(reader.xref_objStm)
+        for generation_objects in reader.xref.values():
+            idnums.extend(generation_objects)
+        return max(idnums, default=0) + 1
+
+    def add_object(self, obj) -> IndirectObject:
+        ref = IndirectObject(self.size, 0, self.reader)
+        self.size += 1
+        self.objects[(ref.idnum, ref.generation)] = obj
+        return ref
+
+    def update_object(self, ref: IndirectObject, obj) -> None:
+        self.objects[(ref.idnum, ref.generation)] = obj
+
+    def add_stream(self, data: bytes, compress: bool = False) -> IndirectObject:
+        stream = DecodedStreamObject()
+        stream.setData(data)
+        if compress:
+            stream = stream.flateEncode()
+        return self.add_object(stream)
+
+    def render(self) -> bytes:
+        """
+        Bytes to append to the original file
+        """
+        out = io.BytesIO()
+        out.write(self.prefix)
+        offsets = {}
+        for (idnum, generation), obj in sorted(self.objects.items()):
+            offsets[idnum] = (self.original_size + out.tell(), generation)
+            self._write_object(out, idnum, generation, obj)
+
+        xref_offset = self.original_size + out.tell()
+        if self.xref_stream:
+            self._write_xref_stream(out, offsets, xref_offset)
+        else:
+            self._write_xref_table(out, offsets)
+        out.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+        return out.getvalue()
+
+    def _trailer(self, size):
+        trailer = DictionaryObject()
+        trailer[NameObject("/Size")] = NumberObject(size)
+        trailer[NameObject("/Prev")] = NumberObject(self.prev_startxref)
+        for key in TRAILER_KEYS:
+            if key in self.reader.trailer:
+                # raw_get keeps the indirect references as they are
+                trailer[NameObject(key)] = self.reader.trailer.raw_get(key)
+        return trailer
+
+    def _write_xref_table(self, out, offsets):
+        out.write(b"xref\n")
+        # the head of free objects list, makes the section zero-indexed for the picky readers
+        out.write(b"0 1\n0000000000 65535 f\r\n")
+        for subsection in self._subsections(sorted(offsets)):
+            out.write(f"{subsection[0]} {len(subsection)}\n".encode())
+            for idnum in subsection:
+                offset, generation = offsets[idnum]
+                out.write(f"{offset:010d} {generation:05d} n\r\n".encode())
+        out.write(b"trailer\n")
+        self._trailer(self.size).writeToStream(out, None)
+
+    def _write_xref_stream(self, out, offsets, xref_offset):
+        # the cross-reference stream is an object too and is listed in itself
+        xref_idnum = self.size
+        offsets = dict(offsets)
+        offsets[xref_idnum] = (xref_offset, 0)
+        index = ArrayObject()
+        rows = []
+        for subsection in self._subsections(sorted(offsets)):
+            index.extend([NumberObject(subsection[0]), NumberObject(len(subsection))])
+            for idnum in subsection:
+                offset, generation = offsets[idnum]
+                # type 1 - object in use, not compressed
+                rows.append(b"\x01" + struct.pack(">Q", offset)[-5:] + struct.pack(">H", generation))
+
+        data = DecodedStreamObject()
+        data.setData(b"".join(rows))
+        stream = data.flateEncode()
+        stream.update(self._trailer(xref_idnum + 1))
+        stream[NameObject("/Type")] = NameObject("/XRef")
+        stream[NameObject("/W")] = ArrayObject([NumberObject(1), NumberObject(5), NumberObject(2)])
+        stream[NameObject("/Index")] = index
+        self._write_object(out, xref_idnum, 0, stream)
+
+    @staticmethod
+    def _write_object(out, idnum, generation, obj):
+        out.write(f"{idnum} {generation} obj\n".encode())
+        obj.writeToStream(out, None)
+        out.write(b"\nendobj\n")
+
+    @staticmethod
+    def _subsections(idnums):
+        subsection = []
+        for idnum in idnums:
+            if subsection and idnum != subsection[-1] + 1:
+                yield subsection
+                subsection = []
+            subsection.append(idnum)
+        if subsection:
+            yield subsection
+
+
+def append_page_content(update: PdfIncrementalUpdate, page_number: int, content: bytes) -> None:
+    """
+    Draw the content over the page: the original content is wrapped
+    into q/Q so its graphics state changes don't affect the new one
+    """
+    page = update.reader.getPage(page_number)
+    page_ref = page.indirectRef
+    # not flattened page object, without attributes inherited from the parents
+    raw_page = update.reader.getObject(page_ref)
+
+    contents = raw_page.raw_get("/Contents") if "/Contents" in raw_page else None
+    if contents is None:
+        content_refs = []
+    elif isinstance(contents, IndirectObject) and isinstance(contents.getObject(), ArrayObject):
+        content_refs = list(contents.getObject())
+    elif isinstance(contents, ArrayObject):
+        content_refs = list(contents)
+    else:
+        content_refs = [contents]
+
+    new_page = DictionaryObject()
+    for key in raw_page:
+        new_page[NameObject(key)] = raw_page.raw_get(key)
+    new_page[NameObject("/Contents")] = ArrayObject(
+        [update.add_stream(b"q\n")] + content_refs + [update.add_stream(b"\nQ\n" + content, compress=True)]
+    )
+    update.update_object(page_ref, new_page)
+
+
+class IncrementallyUpdatedFile(io.RawIOBase):
+    """
+    Read-only file object of the original file followed by the update,
+    to be passed to the storage without concatenating them in memory
+    """
+
+    def __init__(self, original, update: bytes):
+        self.original = original
+        original.seek(0, os.SEEK_END)
+        self.original_size = original.tell()
+        self.update = update
+        self.size = self.original_size + len(update)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position < self.original_size:
+            self.original.seek(self.position)
+            chunk = self.original.read(min(len(buffer), self.original_size - self.position))
+        else:
+            start = self.position - self.original_size
+            chunk = self.update[start:start + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
@@ -1,23 +1,75 @@
 import qrcode
+import qrcode.image.svg
 from io import BytesIO
 
 # from PIL import Image
 
 
-def get_qrcode_image(data):
+def _make_qrcode(data, box_size):
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
+        box_size=box_size,
         border=1,
     )
     qr.add_data(data)
     qr.make(fit=True)
+    return qr
 
-    img = qr.make_image()
+
+def get_qrcode_image(data, box_size=10):
+    img = _make_qrcode(data, box_size).make_image()
     sio = BytesIO()
     img.save(sio)
     sio.seek(0)
     return sio.read()
     # pil_image = Image.open(sio)
     # return pil_image
+
+
+def get_qrcode_pdf_operators(data):
+    """
+    PDF content stream operators drawing the QR code as vector rectangles in
+    the 1x1 square, so the caller scales it by the "cm" operator to any size:
+    white background (the border included) and dark modules, adjacent
+    modules of the row are merged to a single rectangle
+    """
+    matrix = _make_qrcode(data, box_size=1).get_matrix()
+    size = len(matrix)
+    rectangles = []
+    for row_number, row in enumerate(matrix):
+        # PDF y axis goes up
+        row_y = size - row_number - 1
+        column = 0
+        while column < len(row):
+            if not row[column]:
+                column += 1
+                continue
+            run_start = column
+            while column < len(row) and row[column]:
+                column += 1
+            rectangles.append(f"{run_start} {row_y} {column - run_start} 1 re")
+    return "\n".join([
+        "q",
+        # modules are drawn in integer coordinates
+        f"{1 / size:.6f} 0 0 {1 / size:.6f} 0 0 cm",
+        "1 g",
+        f"0 0 {size} {size} re f",
+        "0 g",
+        *rectangles,
+        "f",
+        "Q",
+        "",
+    ]).encode("ascii")
+
+
+def get_qrcode_svg(data, box_size=10):
+    """
+    Vector QR code, a single path; the module size is box_size/10 mm
+    """
+    img = _make_qrcode(data, box_size).make_image(
+        image_factory=qrcode.image.svg.SvgPathImage
+    )
+    sio = BytesIO()
+    img.save(sio)
+    return sio.getvalue()
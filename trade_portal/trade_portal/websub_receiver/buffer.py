@@ -0,0 +1,58 @@
+"""
+Redis buffer of the incoming message notifications.
+
+A partner node replaying its backlog sends thousands of notifications at once; instead
+of a task per notification they are collected for INCOMING_MESSAGES_BATCH_WINDOW seconds
+and stored by the batch task (the first notification of the burst schedules it).
+"""
+import json
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BUFFER_KEY = "websub-incoming-pings"
+# set while the batch task is scheduled
+SCHEDULED_KEY = "websub-incoming-pings-scheduled"
+
+
+def get_redis():
+    from django_redis import get_redis_connection
+
+    return get_redis_connection("default")
+
+
+def buffer_incoming_ping(ping_body: dict) -> bool:
+    """
+    Returns False if the notification is not buffered (batching is disabled
+    or Redis is unavailable), so it should be processed on its own
+    """
+    from trade_portal.websub_receiver.tasks import store_incoming_messages_batch
+
+    window = settings.INCOMING_MESSAGES_BATCH_WINDOW
+    if not window:
+        return False
+    try:
+        pipe = get_redis().pipeline()
+        pipe.rpush(BUFFER_KEY, json.dumps(ping_body))
+        # expires in case the scheduled task is lost, then the next notification schedules it again
+        pipe.set(SCHEDULED_KEY, 1, nx=True, ex=window * 10 + 60)
+        _, is_first = pipe.execute()
+    except Exception as e:
+        logger.warning("Unable to buffer the incoming message notification: %s", e)
+        return False
+    if is_first:
+        store_incoming_messages_batch.apply_async(countdown=window)
+    return True
+
+
+def pop_incoming_pings(limit: int) -> list:
+    redis = get_redis()
+    # the notifications received from now on schedule the next batch
+    redis.delete(SCHEDULED_KEY)
+    pipe = redis.pipeline()
+    pipe.lrange(BUFFER_KEY, 0, limit - 1)
+    pipe.ltrim(BUFFER_KEY, limit, -1)
+    items, _ = pipe.execute()
+    return [json.loads(item) for item in items]
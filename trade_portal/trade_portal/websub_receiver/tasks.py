@@ -1,6 +1,10 @@
 import logging
 
+from django.conf import settings
+
 from trade_portal.documents.services.igl import IGLService
+from trade_portal.documents.tasks import store_message_by_ping_body
+from trade_portal.websub_receiver.buffer import pop_incoming_pings
 from config import celery_app as app
 
 logger = logging.getLogger(__name__)
@@ -12,3 +16,26 @@ def subscribe_to_new_messages():
         IGLService().subscribe_to_new_messages()
     except Exception as e:
         logger.exception(e)
+
+
+@app.task(ignore_result=True)
+def store_incoming_messages_batch():
+    """
+    Store the buffered incoming message notifications;
+    also scheduled to pick up the notifications left if the task was lost
+    """
+    ping_bodies = pop_incoming_pings(settings.INCOMING_MESSAGES_BATCH_SIZE)
+    if not ping_bodies:
+        return
+    if len(ping_bodies) == settings.INCOMING_MESSAGES_BATCH_SIZE:
+        # the burst continues
+        store_incoming_messages_batch.delay()
+    try:
+        stored = IGLService().store_messages_by_ping_bodies(ping_bodies)
+    except Exception as e:
+        logger.exception(e)
+        # the notifications are not lost, just processed one by one
+        for ping_body in ping_bodies:
+            store_message_by_ping_body.delay(ping_body)
+    else:
+        logger.info("Stored %s of %s incoming messages notifications", stored, len(ping_bodies))
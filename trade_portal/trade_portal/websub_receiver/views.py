@@ -11,6 +11,7 @@ from trade_portal.documents.tasks import (
     store_message_by_ping_body,
 )
 from trade_portal.utils.monitoring import statsd_timer
+from trade_portal.websub_receiver.buffer import buffer_incoming_ping
 
 logger = logging.getLogger(__name__)
 
@@ -96,7 +97,8 @@ class IncomingMessageThinPing(BaseNotificationReceiveView):
         return super().dispatch(*args, **kwargs)
 
     def _process_notification(self, event):
-        store_message_by_ping_body.delay(event)
+        if not buffer_incoming_ping(event):
+            store_message_by_ping_body.delay(event)
         return
 
 
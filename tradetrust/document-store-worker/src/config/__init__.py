@@ -46,6 +46,23 @@ class Config:
             'MaxNumberOfMessages': int(os.environ['WORKER_POLLING_MAX_NUMBER_OF_MESSAGES']),
             'VisibilityTimeout': worker_polling_visibility_timeout
         }
+        # Batch mode wraps several documents into one merkle tree issued by a single transaction.
+        # Documents are collected while their messages are hidden, so the wait must fit the VisibilityTimeout.
+        worker_batch = {
+            'MaxDocuments': int(os.environ.get('WORKER_BATCH_MAX_DOCUMENTS', '1')),
+            'MaxWaitSeconds': int(os.environ.get('WORKER_BATCH_MAX_WAIT_SECONDS', '10'))
+        }
+        if worker_batch['MaxWaitSeconds'] >= worker_polling_visibility_timeout // 2:
+            raise ValueError('WORKER_BATCH_MAX_WAIT_SECONDS must be < WORKER_POLLING_VISIBILITY_TIMEOUT / 2')
+        # Pipeline mode broadcasts up to MaxPendingTransactions issue transactions without waiting for receipts.
+        worker_pipeline = {
+            'MaxPendingTransactions': int(os.environ.get('WORKER_PIPELINE_MAX_PENDING_TRANSACTIONS', '1')),
+            'ReceiptPollIntervalSeconds': int(os.environ.get('WORKER_PIPELINE_RECEIPT_POLL_INTERVAL_SECONDS', '2'))
+        }
+        if worker_pipeline['MaxPendingTransactions'] > 1 and worker_batch['MaxDocuments'] > 1:
+            raise ValueError(
+                'WORKER_PIPELINE_MAX_PENDING_TRANSACTIONS and WORKER_BATCH_MAX_DOCUMENTS can not be used together'
+            )
 
         open_attestation = {}
         open_attestation['Endpoint'] = Config.get_env_or_singleline_file_value(
@@ -57,7 +74,13 @@ class Config:
             'Endpoint': os.environ['BLOCKCHAIN_ENDPOINT'],
             'GasPrice': os.environ.get('BLOCKCHAIN_GAS_PRICE', 'medium'),
             'GasPriceRefreshRate': int(os.environ.get('BLOCKCHAIN_GAS_PRICE_REFRESH_RATE', 10)),
-            'ReceiptTimeout': int(os.environ.get('BLOCKCHAIN_RECEIPT_TIMEOUT', 180))
+            'ReceiptTimeout': int(os.environ.get('BLOCKCHAIN_RECEIPT_TIMEOUT', 180)),
+            # used by the "oracle" gas price strategy
+            'GasPriceOracle': {
+                'Percentile': int(os.environ.get('BLOCKCHAIN_GAS_PRICE_ORACLE_PERCENTILE', 60)),
+                'Blocks': int(os.environ.get('BLOCKCHAIN_GAS_PRICE_ORACLE_BLOCKS', 20)),
+                'RefreshInterval': int(os.environ.get('BLOCKCHAIN_GAS_PRICE_ORACLE_REFRESH_INTERVAL', 15))
+            }
         }
 
         document_store = {
@@ -93,7 +116,13 @@ class Config:
 
         return {
             'Worker': {
-                'Polling': worker_polling
+                'Polling': worker_polling,
+                'Batch': worker_batch,
+                'Pipeline': worker_pipeline,
+                'Metrics': {
+                    # Prometheus metrics endpoint, disabled if 0
+                    'Port': int(os.environ.get('WORKER_METRICS_PORT', '0'))
+                }
             },
             'AWS': {
                 'Config': aws_config,
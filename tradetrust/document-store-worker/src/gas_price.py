@@ -0,0 +1,101 @@
+import math
+import threading
+from collections import OrderedDict
+
+from src.loggers import logging
+
+logger = logging.getLogger('GAS_PRICE_ORACLE')
+
+
+# geth rejects a replacement transaction priced less than 10% higher, Parity/OpenEthereum - 12.5%
+REPLACEMENT_GAS_PRICE_BUMP_PERMILLE = 125
+
+
+def get_minimal_replacement_gas_price(gas_price):
+    # integer math, and a wei above the threshold in case the node requires a strictly higher price
+    return gas_price * (1000 + REPLACEMENT_GAS_PRICE_BUMP_PERMILLE) // 1000 + 1
+
+
+def get_percentile(sorted_values, percentile):
+    # nearest-rank method
+    index = max(math.ceil(percentile / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+class GasPriceOracle:
+    """
+    Recommends gas price as a percentile of the gas prices paid in the recent blocks.
+    Blocks are fetched by a background thread, each one only once,
+    so reading the recommendation never waits for the node.
+    """
+
+    def __init__(self, web3, percentile=60, blocks=20, refresh_interval=15):
+        self.web3 = web3
+        self.percentile = percentile
+        self.blocks = blocks
+        self.refresh_interval = refresh_interval
+        self.blocks_gas_prices = OrderedDict()
+        self.gas_price = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        # the first recommendation is calculated synchronously to have a price right away
+        self.update()
+        self.thread = threading.Thread(target=self.run, name='gas-price-oracle', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+            self.stopped.clear()
+
+    def run(self):
+        while not self.stopped.wait(self.refresh_interval):
+            try:
+                self.update()
+            except Exception as e:
+                logger.exception(e)
+
+    def get_block_gas_prices(self, block_number):
+        block = self.web3.eth.getBlock(block_number, full_transactions=True)
+        return [transaction['gasPrice'] for transaction in block['transactions']]
+
+    def update(self):
+        logger.debug('update')
+        latest_block_number = self.web3.eth.blockNumber
+        first_block_number = max(latest_block_number - self.blocks + 1, 0)
+        for block_number in list(self.blocks_gas_prices):
+            if block_number < first_block_number:
+                del self.blocks_gas_prices[block_number]
+        for block_number in range(first_block_number, latest_block_number + 1):
+            if block_number not in self.blocks_gas_prices:
+                self.blocks_gas_prices[block_number] = self.get_block_gas_prices(block_number)
+
+        gas_prices = sorted(price for prices in self.blocks_gas_prices.values() for price in prices)
+        if gas_prices:
+            gas_price = get_percentile(gas_prices, self.percentile)
+        else:
+            # no transactions in the recent blocks, the node knows better
+            gas_price = self.web3.eth.gasPrice
+        with self.lock:
+            self.gas_price = gas_price
+        logger.debug(
+            'gas price=%s (%s percentile of %s transactions in blocks %s-%s)',
+            gas_price, self.percentile, len(gas_prices), first_block_number, latest_block_number
+        )
+        return gas_price
+
+    def get_gas_price(self):
+        with self.lock:
+            return self.gas_price
+
+    def get_replacement_gas_price(self, gas_price):
+        """
+        Returns the price accepted for a replacement of transaction priced at gas_price in one step:
+        the minimal bump or the current recommendation if it's higher
+        """
+        return max(get_minimal_replacement_gas_price(gas_price), self.get_gas_price() or 0)
@@ -0,0 +1,74 @@
+import io
+import json
+from json.encoder import encode_basestring_ascii
+
+
+# long strings (like base64 attachments) are escaped and encoded by pieces of this size
+STRING_PIECE_SIZE = 64 * 1024
+
+
+def iterencode(value):
+    """
+    json.dumps(value) split into pieces, without building any long string in memory
+    """
+    if isinstance(value, str):
+        if len(value) <= STRING_PIECE_SIZE:
+            yield encode_basestring_ascii(value)
+        else:
+            yield '"'
+            for start in range(0, len(value), STRING_PIECE_SIZE):
+                yield encode_basestring_ascii(value[start:start + STRING_PIECE_SIZE])[1:-1]
+            yield '"'
+    elif isinstance(value, dict):
+        yield '{'
+        for index, (key, item) in enumerate(value.items()):
+            prefix = ', ' if index else ''
+            yield f'{prefix}{encode_basestring_ascii(str(key))}: '
+            yield from iterencode(item)
+        yield '}'
+    elif isinstance(value, (list, tuple)):
+        yield '['
+        for index, item in enumerate(value):
+            if index:
+                yield ', '
+            yield from iterencode(item)
+        yield ']'
+    else:
+        yield json.dumps(value)
+
+
+class JSONStream(io.RawIOBase):
+    """
+    Readable file-like object with json.dumps(value).encode() content, serialized lazily on read,
+    so memory used doesn't depend on the document size
+    """
+
+    def __init__(self, value):
+        self.pieces = iterencode(value)
+        self.leftover = b''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        # BytesIO returns its buffer without copying, so a read takes about `size` bytes,
+        # and only the tail of the last piece is kept for the next one
+        buffer = io.BytesIO()
+        buffer.write(self.leftover)
+        while size < 0 or buffer.tell() < size:
+            piece = next(self.pieces, None)
+            if piece is None:
+                break
+            buffer.write(piece.encode('ascii'))
+        if 0 <= size < buffer.tell():
+            with buffer.getbuffer() as view:
+                self.leftover = bytes(view[size:])
+            buffer.truncate(size)
+        else:
+            self.leftover = b''
+        return buffer.getvalue()
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
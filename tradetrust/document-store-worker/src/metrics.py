@@ -0,0 +1,90 @@
+import boto3
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+from src.loggers import logging
+
+logger = logging.getLogger('METRICS')
+
+
+STAGE_DURATION = Histogram(
+    'document_store_worker_stage_duration_seconds',
+    'Duration of the document processing stages',
+    ['stage'],
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300, float('inf'))
+)
+TRANSACTION_REPLACEMENTS = Counter(
+    'document_store_worker_transaction_replacements',
+    'Gas price increases to replace timed out or underpriced issue transactions'
+)
+IN_FLIGHT_TRANSACTIONS = Gauge(
+    'document_store_worker_in_flight_transactions',
+    'Issue transactions sent and not confirmed yet'
+)
+GAS_PRICE = Gauge(
+    'document_store_worker_gas_price_wei',
+    'Gas price used for the issue transactions'
+)
+
+
+def get_wallet_metrics(web3, address):
+    """
+    Wallet values which are read from the node, the same ones are pushed to CloudWatch by the monitoring lambdas
+    """
+    confirmed_transactions = web3.eth.getTransactionCount(address, block_identifier='latest')
+    all_transactions = web3.eth.getTransactionCount(address, block_identifier='pending')
+    return {
+        'Balance': float(web3.fromWei(web3.eth.getBalance(address), 'ether')),
+        # nonce gap, transactions sent but not mined yet
+        'PendingTransactions': all_transactions - confirmed_transactions
+    }
+
+
+class WorkerCollector:
+    """
+    Values requested at scrape time, from the scraping thread.
+    SQS is queried using its own client as boto3 resources of the worker aren't thread safe
+    """
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.sqs = boto3.client('sqs', **worker.config['AWS']['Config'])
+
+    def collect(self):
+        queue_url = self.worker.config['AWS']['Resources']['Queues']['Unprocessed']
+        address = self.worker.config['DocumentStore']['Owner']['PublicKey']
+        try:
+            attributes = self.sqs.get_queue_attributes(
+                QueueUrl=queue_url,
+                AttributeNames=['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible']
+            )['Attributes']
+            queue_depth = GaugeMetricFamily(
+                'document_store_worker_queue_depth',
+                'Messages in the unprocessed queue',
+                labels=['state']
+            )
+            queue_depth.add_metric(['visible'], int(attributes['ApproximateNumberOfMessages']))
+            queue_depth.add_metric(['in_flight'], int(attributes['ApproximateNumberOfMessagesNotVisible']))
+            yield queue_depth
+        except Exception as e:
+            logger.exception(e)
+        try:
+            wallet_metrics = get_wallet_metrics(self.worker.web3, address)
+            yield GaugeMetricFamily(
+                'document_store_worker_wallet_balance_ether',
+                'Document store owner balance',
+                value=wallet_metrics['Balance']
+            )
+            yield GaugeMetricFamily(
+                'document_store_worker_nonce_gap',
+                'Difference between pending and mined transactions count of the document store owner',
+                value=wallet_metrics['PendingTransactions']
+            )
+        except Exception as e:
+            logger.exception(e)
+
+
+def start_metrics_server(worker, port):
+    REGISTRY.register(WorkerCollector(worker))
+    start_http_server(port)
+    logger.info('Metrics are exposed on port %s', port)
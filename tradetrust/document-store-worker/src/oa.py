@@ -0,0 +1,211 @@
+"""
+Native OpenAttestation v2 wrapping, unwrapping and signature verification, a Python reproduction of
+https://github.com/Open-Attestation/open-attestation/tree/master/src/2.0
+"""
+import decimal
+import json
+import uuid
+
+from Crypto.Hash import keccak
+
+
+OPEN_ATTESTATION_V2_SIGNATURE_TYPE = 'SHA3MerkleProof'
+OPEN_ATTESTATION_V2_SCHEMA_ID = 'https://schema.openattestation.com/2.0/schema.json'
+
+UUIDV4_LENGTH = len('6cdb27f1-a46e-4dea-b1af-3b3faf7d983d')
+
+
+def keccak256(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return keccak.new(digest_bits=256, data=data).hexdigest()
+
+
+def js_keys(obj):
+    # JS enumerates integer-like keys first (ascending), then the rest in insertion order
+    index_keys = [
+        k for k in obj.keys()
+        if k.isascii() and k.isdigit() and str(int(k)) == k and int(k) < 2 ** 32 - 1
+    ]
+    other_keys = [k for k in obj.keys() if k not in index_keys]
+    return sorted(index_keys, key=int) + other_keys
+
+
+def js_number_to_string(value):
+    if isinstance(value, int):
+        return str(value)
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return 'Infinity' if value > 0 else '-Infinity'
+    if value.is_integer() and abs(value) < 1e21:
+        return str(int(value))
+    text = repr(value)
+    if 'e' in text:
+        mantissa, exponent = text.split('e')
+        exponent = int(exponent)
+        if -7 < exponent < 21:
+            return format(decimal.Decimal(text), 'f')
+        return f"{mantissa}e{'+' if exponent > 0 else '-'}{abs(exponent)}"
+    return text
+
+
+def to_json(obj):
+    # JSON.stringify equivalent
+    if isinstance(obj, dict):
+        return '{' + ','.join(f'{to_json(str(k))}:{to_json(obj[k])}' for k in js_keys(obj)) + '}'
+    if isinstance(obj, (list, tuple)):
+        return '[' + ','.join(to_json(v) for v in obj) + ']'
+    if isinstance(obj, float):
+        return js_number_to_string(obj)
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def primitive_to_typed_string(value):
+    if value is None:
+        return 'null:null'
+    if isinstance(value, bool):
+        return 'boolean:true' if value else 'boolean:false'
+    if isinstance(value, (int, float)):
+        return f'number:{js_number_to_string(value)}'
+    if isinstance(value, str):
+        return f'string:{value}'
+    raise ValueError(f'Parsing error, value is not of primitive type: {value!r}')
+
+
+def typed_string_to_primitive(text):
+    vtype, value = text.split(':', maxsplit=1)
+    if vtype == 'number':
+        if any(c in value for c in '.eE') or value in ('NaN', 'Infinity', '-Infinity'):
+            return float(value)
+        return int(value)
+    if vtype == 'boolean':
+        return value == 'true'
+    if vtype in ('null', 'undefined'):
+        return None
+    return value
+
+
+def salt_data(data, salt_factory=None):
+    salt_factory = salt_factory or (lambda: str(uuid.uuid4()))
+    if isinstance(data, dict):
+        return {k: salt_data(data[k], salt_factory) for k in js_keys(data)}
+    if isinstance(data, list):
+        return [salt_data(v, salt_factory) for v in data]
+    return f'{salt_factory()}:{primitive_to_typed_string(data)}'
+
+
+def unsalt_data(data):
+    if isinstance(data, dict):
+        return {k: unsalt_data(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [unsalt_data(v) for v in data]
+    if isinstance(data, str) and data[UUIDV4_LENGTH:UUIDV4_LENGTH + 1] == ':':
+        return typed_string_to_primitive(data[UUIDV4_LENGTH + 1:])
+    return data
+
+
+def flatten(data, prefix=''):
+    # "flat" npm library behaviour, empty dicts and lists are kept as values
+    result = {}
+    if isinstance(data, dict):
+        items = ((k, data[k]) for k in js_keys(data))
+    else:
+        items = ((str(i), v) for i, v in enumerate(data))
+    for key, value in items:
+        full_key = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, (dict, list)) and value:
+            result.update(flatten(value, full_key))
+        else:
+            result[full_key] = value
+    return result
+
+
+def digest_document(document):
+    hashes = list(document.get('privacy', {}).get('obfuscatedData', []))
+    hashes += [keccak256(to_json({key: value})) for key, value in flatten(document.get('data', {})).items()]
+    return keccak256(to_json(sorted(hashes)))
+
+
+def combine_hashes(first, second):
+    if not second:
+        return first
+    if not first:
+        return second
+    return keccak256(b''.join(sorted([bytes.fromhex(first), bytes.fromhex(second)])))
+
+
+class MerkleTree:
+
+    def __init__(self, hashes):
+        self.elements = sorted(set(hashes))
+        self.layers = [self.elements]
+        while len(self.layers[-1]) > 1:
+            layer = self.layers[-1]
+            self.layers.append([
+                combine_hashes(layer[i], layer[i + 1] if i + 1 < len(layer) else None)
+                for i in range(0, len(layer), 2)
+            ])
+
+    @property
+    def root(self):
+        return self.layers[-1][0]
+
+    def get_proof(self, element):
+        index = self.elements.index(element)
+        proof = []
+        for layer in self.layers:
+            pair_index = index - 1 if index % 2 else index + 1
+            if pair_index < len(layer):
+                proof.append(layer[pair_index])
+            index = index // 2
+        return proof
+
+
+def wrap_documents(documents, salt_factory=None):
+    """
+    Wraps raw v2 documents as a single batch: every wrapped document
+    gets the same merkleRoot and it's own proof
+    """
+    if not documents:
+        raise ValueError('At least one document must be provided')
+    salted = [
+        {
+            'version': OPEN_ATTESTATION_V2_SCHEMA_ID,
+            'data': salt_data(document, salt_factory)
+        }
+        for document in documents
+    ]
+    target_hashes = [digest_document(document) for document in salted]
+    tree = MerkleTree(target_hashes)
+    for document, target_hash in zip(salted, target_hashes):
+        document['signature'] = {
+            'type': OPEN_ATTESTATION_V2_SIGNATURE_TYPE,
+            'targetHash': target_hash,
+            'proof': tree.get_proof(target_hash),
+            'merkleRoot': tree.root
+        }
+    return salted
+
+
+def unwrap_document(wrapped_document):
+    return unsalt_data(wrapped_document['data'])
+
+
+def verify_signature(wrapped_document):
+    """
+    Recomputes targetHash from the document data and walks the proof up to the merkleRoot
+    """
+    signature = wrapped_document.get('signature') or {}
+    if signature.get('type') != OPEN_ATTESTATION_V2_SIGNATURE_TYPE:
+        return False
+    try:
+        target_hash = digest_document(wrapped_document)
+        if target_hash != signature['targetHash']:
+            return False
+        computed_hash = target_hash
+        for proof_hash in signature['proof']:
+            computed_hash = combine_hashes(computed_hash, proof_hash)
+        return computed_hash == signature['merkleRoot']
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return False
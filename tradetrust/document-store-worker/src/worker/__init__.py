@@ -1,13 +1,26 @@
 import json
 import time
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 import boto3
 import requests
+from boto3.s3.transfer import TransferConfig
+from requests.adapters import HTTPAdapter
 from web3 import Web3
 from web3.exceptions import TimeExhausted
 from web3.gas_strategies.time_based import fast_gas_price_strategy, medium_gas_price_strategy
 
 from src.loggers import logging
+from src import oa
+from src.gas_price import GasPriceOracle, get_minimal_replacement_gas_price
+from src.json_stream import JSONStream
+from src.metrics import (
+    GAS_PRICE,
+    IN_FLIGHT_TRANSACTIONS,
+    STAGE_DURATION,
+    TRANSACTION_REPLACEMENTS,
+    start_metrics_server
+)
 
 logger = logging.getLogger('WORKER')
 
@@ -19,6 +32,9 @@ OPEN_ATTESTATION_VERSION_ID_V3_SHORT = 'open-attestation/3.0'
 
 DOCUMENT_STORE_PROOF_TYPE = 'DOCUMENT_STORE'
 
+# pause between the empty short polling receives while a batch is collected
+EMPTY_RECEIVE_SLEEP_SECONDS = 1
+
 
 class DocumentError(Exception):
     pass
@@ -34,12 +50,18 @@ class UnderpricedReplacementTransactionException(Exception):
 
 class Worker:
 
-    GAS_PRICE_INCREASE_FACTOR = 1.1
+    # unwrap, signature verification and issuance status check of a wrapped document run concurrently
+    DOCUMENT_CHECKS_THREADS = 3
+    OPEN_ATTESTATION_POOL_MAX_SIZE = 10
+    # issued documents larger than that are uploaded in parts of the same size
+    ISSUED_DOCUMENT_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
 
     def __init__(self, config=None):
         self.config = config
 
         self.connect_resources()
+        self.connect_open_attestation_api()
+        self.executor = ThreadPoolExecutor(max_workers=self.DOCUMENT_CHECKS_THREADS, thread_name_prefix='document')
 
         self.set_gas_price_strategy()
         self.update_gas_price()
@@ -70,6 +92,7 @@ class Worker:
 
         self.dynamic_gas_price_strategy = False
         self.static_gas_price = None
+        self.gas_price_oracle = None
         # static gas price strategy
         try:
             self.static_gas_price = int(gas_price_config)
@@ -89,6 +112,18 @@ class Worker:
             self.dynamic_gas_price_strategy = True
             self.web3.eth.setGasPriceStrategy(medium_gas_price_strategy)
             logger.info('gas price strategy=medium(5min), price=dynamic')
+        # percentile of recent blocks gas prices, refreshed in background
+        elif gas_price_config == 'oracle':
+            self.dynamic_gas_price_strategy = True
+            oracle_config = self.config['Blockchain']['GasPriceOracle']
+            self.gas_price_oracle = GasPriceOracle(
+                self.web3,
+                percentile=oracle_config['Percentile'],
+                blocks=oracle_config['Blocks'],
+                refresh_interval=oracle_config['RefreshInterval']
+            )
+            self.gas_price_oracle.start()
+            logger.info('gas price strategy=oracle(%s percentile), price=dynamic', oracle_config['Percentile'])
         else:
             raise Exception(f'Invalid gas price strategy:{repr(gas_price_config)}')
         return gas_price_config
@@ -103,6 +138,8 @@ class Worker:
             logger.debug('static_gas_price')
             self.gas_price = self.static_gas_price
         self.transactions_count = 1
+        if self.gas_price is not None:
+            GAS_PRICE.set(self.gas_price)
         logger.info('gas price=%s', 'default' if self.gas_price is None else self.gas_price)
         logger.debug('transactions count reset')
 
@@ -112,16 +149,33 @@ class Worker:
             self.update_gas_price()
             logger.debug('gas price refreshed')
 
+    def get_replacement_gas_price(self, gas_price):
+        if self.gas_price_oracle is not None:
+            return self.gas_price_oracle.get_replacement_gas_price(gas_price)
+        return get_minimal_replacement_gas_price(gas_price)
+
     def increase_gas_price(self):
         logger.debug('increase_gas_price')
-        new_gas_price = int(self.gas_price * self.GAS_PRICE_INCREASE_FACTOR)
+        new_gas_price = self.get_replacement_gas_price(self.gas_price)
         logger.info('Gas price increased. OLD: %s NEW: %s', self.gas_price, new_gas_price)
         self.gas_price = new_gas_price
+        GAS_PRICE.set(new_gas_price)
+        TRANSACTION_REPLACEMENTS.inc()
 
     def generate_gas_price(self):
         logger.debug('generate_gas_price')
+        if self.gas_price_oracle is not None:
+            return self.gas_price_oracle.get_gas_price()
         return self.web3.eth.generateGasPrice()
 
+    def connect_open_attestation_api(self):
+        logger.debug('connect_open_attestation_api')
+        # keep-alive connections are reused by all the worker's calls to the API
+        self.open_attestation_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.OPEN_ATTESTATION_POOL_MAX_SIZE)
+        self.open_attestation_session.mount('http://', adapter)
+        self.open_attestation_session.mount('https://', adapter)
+
     def connect_unprocessed_queue(self):
         logger.debug('connect_unprocessed_queue')
         config = self.config['AWS']['Config']
@@ -148,6 +202,7 @@ class Worker:
         )
 
     # this operation also validates document schema
+    @STAGE_DURATION.labels('wrap').time()
     def wrap_document(self, document, version):
         if not isinstance(document, dict):
             raise Exception("a dict must be passed to the wrap_document")
@@ -162,7 +217,7 @@ class Worker:
                 'version': version
             }
         }
-        response = requests.post(url, json=payload)
+        response = self.open_attestation_session.post(url, json=payload)
         if response.status_code == 200:
             return response.json()
         elif response.status_code == 400:
@@ -170,6 +225,7 @@ class Worker:
         else:
             raise RuntimeError(response.text)
 
+    @STAGE_DURATION.labels('unwrap').time()
     def unwrap_document(self, document, version):
         logger.debug('unwrap_document')
         if not isinstance(document, dict):
@@ -180,6 +236,12 @@ class Worker:
         )
         if not is_wrapped:
             raise Exception("The document must be wrapped to unwrap it")
+        if version == OPEN_ATTESTATION_VERSION_ID_V2_FRAMEWORK:
+            # v2 unwrapping is just removing the salts, no need to call the API
+            try:
+                return oa.unwrap_document(document)
+            except ValueError as e:
+                raise DocumentError(f'Unable to unwrap the document: {e}') from e
         url = urllib.parse.urljoin(
             self.config['OpenAttestation']['Endpoint'], 'document/unwrap'
         )
@@ -189,7 +251,7 @@ class Worker:
                 'version': version
             }
         }
-        response = requests.post(url, json=payload)
+        response = self.open_attestation_session.post(url, json=payload)
         if response.status_code == 200:
             return response.json()
         elif response.status_code == 400:
@@ -197,6 +259,7 @@ class Worker:
         else:
             raise RuntimeError(response.text)
 
+    @STAGE_DURATION.labels('verify').time()
     def verify_document_signature(self, wrapped_document):
         logger.debug('verify_document_signature')
         if not isinstance(wrapped_document, dict):
@@ -204,11 +267,16 @@ class Worker:
         is_wrapped = "data" in wrapped_document and "signature" in wrapped_document
         if not is_wrapped:
             raise Exception("The document is not wrapped")
+        if wrapped_document.get('version') == OPEN_ATTESTATION_VERSION_ID_V2_FRAMEWORK:
+            # v2 signature is a merkle proof which is verified locally
+            if not oa.verify_signature(wrapped_document):
+                raise DocumentError('Document signature is invalid')
+            return
         url = urllib.parse.urljoin(self.config['OpenAttestation']['Endpoint'], 'document/verify/signature')
         payload = {
             'document': wrapped_document,
         }
-        response = requests.post(url, json=payload)
+        response = self.open_attestation_session.post(url, json=payload)
         if response.status_code == 200:
             if not response.json()['valid']:
                 raise DocumentError('Document signature is invalid')
@@ -221,26 +289,37 @@ class Worker:
         logger.debug('is_issued_document')
         return self.document_store.functions.isIssued(wrapped_document['signature']['merkleRoot']).call()
 
-    def create_issue_document_transaction(self, wrapped_document):
+    @STAGE_DURATION.labels('tx_build').time()
+    def create_issue_document_transaction(self, wrapped_document, nonce=None, gas_price=None):
         logger.debug('create_issue_document_transaction')
         public_key = self.config['DocumentStore']['Owner']['PublicKey']
         private_key = self.config['DocumentStore']['Owner']['PrivateKey']
-        # excluding pending transactions to not cause transactions replication
-        # this way duplicate transactions will just cancel each other
-        nonce = self.web3.eth.getTransactionCount(public_key, 'latest')
+        if nonce is None:
+            # excluding pending transactions to not cause transactions replication
+            # this way duplicate transactions will just cancel each other
+            nonce = self.web3.eth.getTransactionCount(public_key, 'latest')
         transaction = {
             'from': public_key,
             'nonce': nonce
         }
 
-        transaction['gasPrice'] = self.gas_price
+        transaction['gasPrice'] = self.gas_price if gas_price is None else gas_price
         merkleRoot = wrapped_document['signature']['merkleRoot']
         unsigned_transaction = self.document_store.functions.issue(merkleRoot).buildTransaction(transaction)
         signed_transaction = self.web3.eth.account.sign_transaction(unsigned_transaction, private_key=private_key)
-        tx_hash = self.web3.eth.sendRawTransaction(signed_transaction.rawTransaction)
+        try:
+            tx_hash = self.web3.eth.sendRawTransaction(signed_transaction.rawTransaction)
+        except ValueError as e:
+            try:
+                if e.args[0]['message'] == 'replacement transaction underpriced':
+                    raise UnderpricedReplacementTransactionException() from e
+            except (IndexError, KeyError, TypeError):
+                pass
+            raise
         logger.info('[%s] documentStore.issue(%s) %s', Web3.toHex(tx_hash), merkleRoot, unsigned_transaction)
         return tx_hash
 
+    @STAGE_DURATION.labels('receipt_wait').time()
     def wait_for_transaction_receipt(self, tx_hash):
         logger.debug('wait_for_transaction_receipt')
         try:
@@ -248,21 +327,15 @@ class Worker:
         except TimeExhausted as e:
             raise TransactionTimeoutException() from e
 
+    @IN_FLIGHT_TRANSACTIONS.track_inprogress()
     def issue_document(self, wrapped_document):
         logger.debug('issue_document')
-        try:
-            tx_hash = self.create_issue_document_transaction(wrapped_document)
-            receipt = self.wait_for_transaction_receipt(tx_hash)
-            if receipt.status != 1:
-                raise RuntimeError(json.dumps(Web3.toJSON(receipt)))
-        except ValueError as e:
-            try:
-                if e.args[0]['message'] == 'replacement transaction underpriced':
-                    raise UnderpricedReplacementTransactionException() from e
-            except (IndexError, KeyError, TypeError):
-                pass
-            raise
+        tx_hash = self.create_issue_document_transaction(wrapped_document)
+        receipt = self.wait_for_transaction_receipt(tx_hash)
+        if receipt.status != 1:
+            raise RuntimeError(json.dumps(Web3.toJSON(receipt)))
 
+    @STAGE_DURATION.labels('s3_load').time()
     def load_unprocessed_document(self, event):
         logger.info("Loading unprocessed document %s...", event['s3']['object']['key'])
         key = event['s3']['object']['key']
@@ -317,13 +390,28 @@ class Worker:
                 f"is not equal to {self.config['DocumentStore']['Address']}"
             )
 
-    def put_document(self, key, wrapped_document):
+    @STAGE_DURATION.labels('s3_put').time()
+    def put_document(self, key, wrapped_document, copy_source=False):
+        """
+        copy_source=True means the wrapped document is the unprocessed one unchanged,
+        it's copied by S3 without passing the bytes through the worker
+        """
         logger.debug('put_document')
-        body = json.dumps(wrapped_document).encode('utf-8')
-        content_length = len(body)
-        self.issued_bucket.Object(key).put(
-            Body=body,
-            ContentLength=content_length
+        if copy_source:
+            self.issued_bucket.Object(key).copy_from(
+                CopySource={
+                    'Bucket': self.config['AWS']['Resources']['Buckets']['Unprocessed'],
+                    'Key': key
+                }
+            )
+            return
+        # serialized while uploading, the whole JSON text is never in memory
+        self.issued_bucket.Object(key).upload_fileobj(
+            JSONStream(wrapped_document),
+            Config=TransferConfig(
+                multipart_threshold=self.ISSUED_DOCUMENT_MULTIPART_CHUNKSIZE,
+                multipart_chunksize=self.ISSUED_DOCUMENT_MULTIPART_CHUNKSIZE
+            )
         )
 
     def process_message(self, message):
@@ -332,60 +420,192 @@ class Worker:
         for record in event['Records']:
             try:
                 key, document = self.load_unprocessed_document(record)
-                version = self.get_document_version(document)
+            except Exception as e:
+                logger.exception(e)
+                return False
+            return self.process_document(key, document)
 
-                is_wrapped = "data" in document and "signature" in document
+    def prepare_document(self, key, document):
+        """
+        Returns the wrapped document ready to be issued
+        or None if it's already issued and has been moved to the issued bucket
+        """
+        logger.debug('prepare_document')
+        version = self.get_document_version(document)
 
-                if not is_wrapped:
-                    logger.info("Document is not wrapped, wrapping it...")
-                    wrapped_document = self.wrap_document(document, version)
-                else:
-                    logger.info("Document is wrapped, unwrapping it to access business data...")
-                    wrapped_document = document.copy()
-                    document = self.unwrap_document(document, version)
-                    self.verify_document_signature(wrapped_document)
-                    # This is used to fix potential rare error when a stuck pending transaction
-                    # gets mined before a higher-priced one which causes a wrapped document to hang forever
-                    # in the unprocessed bucket because it's already issued
-                    logger.info("Checking issuance status")
-                    if self.is_issued_document(wrapped_document):
-                        logger.info("The document already issued, moving to issued bucket")
-                        self.verify_document_store_address(document, version)
-                        self.put_document(key, wrapped_document)
-                        return True
-                    logger.info('The document is not issued, continuing normally')
+        is_wrapped = "data" in document and "signature" in document
+
+        if not is_wrapped:
+            logger.info("Document is not wrapped, wrapping it...")
+            wrapped_document = self.wrap_document(document, version)
+        else:
+            logger.info("Document is wrapped, unwrapping it to access business data...")
+            # the same object is returned to let the caller know it wasn't changed
+            wrapped_document = document
+            # independent round-trips, results are checked in the original order
+            unwrapped_document = self.executor.submit(self.unwrap_document, document, version)
+            verified_signature = self.executor.submit(self.verify_document_signature, wrapped_document)
+            # This is used to fix potential rare error when a stuck pending transaction
+            # gets mined before a higher-priced one which causes a wrapped document to hang forever
+            # in the unprocessed bucket because it's already issued
+            issued = self.executor.submit(self.is_issued_document, wrapped_document)
+            document = unwrapped_document.result()
+            verified_signature.result()
+            logger.info("Checking issuance status")
+            if issued.result():
+                logger.info("The document already issued, moving to issued bucket")
                 self.verify_document_store_address(document, version)
-                self.refresh_gas_price()
-                self.issue_document(wrapped_document)
-                self.put_document(key, wrapped_document)
-                self.transactions_count += 1
+                self.put_document(key, wrapped_document, copy_source=True)
+                return None
+            logger.info('The document is not issued, continuing normally')
+        self.verify_document_store_address(document, version)
+        return wrapped_document
+
+    def process_document(self, key, document):
+        logger.debug('process_document')
+        try:
+            wrapped_document = self.prepare_document(key, document)
+            if wrapped_document is None:
                 return True
+            self.refresh_gas_price()
+            self.issue_document(wrapped_document)
+            self.put_document(key, wrapped_document, copy_source=wrapped_document is document)
+            self.transactions_count += 1
+            return True
+        except DocumentError as e:
+            logger.exception(e)
+            return True
+        except TransactionTimeoutException:
+            # next transaction will replace this one using actual gas price because of the same nonce value
+            logger.warn('Transaction timed out, increasing gas price')
+            self.increase_gas_price()
+            return False
+        except UnderpricedReplacementTransactionException:
+            logger.warn('Replacement transaction is underpriced, increasing gas price')
+            self.increase_gas_price()
+            return False
+        except Exception as e:
+            logger.exception(e)
+            return False
+
+    def is_batchable_document(self, document):
+        # only raw v2 documents can be wrapped together, everything else is issued one by one
+        is_wrapped = "data" in document and "signature" in document
+        return not is_wrapped and document.get('version') in [
+            OPEN_ATTESTATION_VERSION_ID_V2_FRAMEWORK,
+            OPEN_ATTESTATION_VERSION_ID_V2_SHORT
+        ]
+
+    def receive_batch(self):
+        """
+        Collects up to Batch.MaxDocuments batchable documents, waiting at most Batch.MaxWaitSeconds.
+        Messages with documents which can't be batched are processed immediately.
+        """
+        logger.debug('receive_batch')
+        max_documents = self.config['Worker']['Batch']['MaxDocuments']
+        deadline = time.time() + self.config['Worker']['Batch']['MaxWaitSeconds']
+        batch = []
+        while len(batch) < max_documents and time.time() < deadline:
+            remaining = deadline - time.time()
+            # long polling must not outlast the deadline
+            wait_time_seconds = min(self.config['Worker']['Polling']['WaitTimeSeconds'], int(remaining))
+            messages = self.receive_messages(
+                max_number_of_messages=max_documents - len(batch),
+                wait_time_seconds=wait_time_seconds
+            )
+            if not messages and not wait_time_seconds:
+                # short polling returns at once, don't hammer the queue until the deadline
+                time.sleep(min(EMPTY_RECEIVE_SLEEP_SECONDS, remaining))
+            for message in messages:
+                records = json.loads(message.body).get('Records', [])
+                if len(records) == 1:
+                    try:
+                        key, document = self.load_unprocessed_document(records[0])
+                    except Exception as e:
+                        logger.exception(e)
+                        continue
+                    if self.is_batchable_document(document):
+                        batch.append((message, key, document))
+                        continue
+                    processed = self.process_document(key, document)
+                else:
+                    processed = self.process_message(message)
+                if processed:
+                    logger.debug('message.delete')
+                    message.delete()
+                    logger.info("Message has been processed sucessfully")
+        return batch
+
+    def process_batch(self, batch):
+        """
+        Wraps all the batch documents into one merkle tree and issues only its root,
+        so a single transaction issues every document of the batch
+        """
+        logger.debug('process_batch')
+        version = OPEN_ATTESTATION_VERSION_ID_V2_FRAMEWORK
+        valid_batch = []
+        for message, key, document in batch:
+            try:
+                self.verify_document_store_address(document, version)
             except DocumentError as e:
                 logger.exception(e)
-                return True
-            except TransactionTimeoutException:
-                # next transaction will replace this one using actual gas price because of the same nonce value
-                logger.warn('Transaction timed out, increasing gas price')
-                self.increase_gas_price()
-                return False
-            except UnderpricedReplacementTransactionException:
-                logger.warn('Replacement transaction is underpriced, increasing gas price')
-                self.increase_gas_price()
-                return False
+                message.delete()
+            else:
+                valid_batch.append((message, key, document))
+        if not valid_batch:
+            return False
+
+        logger.info("Wrapping %s documents into a single batch...", len(valid_batch))
+        try:
+            with STAGE_DURATION.labels('wrap').time():
+                wrapped_documents = oa.wrap_documents([document for message, key, document in valid_batch])
+            self.refresh_gas_price()
+            self.issue_document(wrapped_documents[0])
+        except TransactionTimeoutException:
+            logger.warn('Transaction timed out, increasing gas price')
+            self.increase_gas_price()
+            return False
+        except UnderpricedReplacementTransactionException:
+            logger.warn('Replacement transaction is underpriced, increasing gas price')
+            self.increase_gas_price()
+            return False
+        except Exception as e:
+            logger.exception(e)
+            return False
+        self.transactions_count += 1
+
+        for (message, key, document), wrapped_document in zip(valid_batch, wrapped_documents):
+            try:
+                self.put_document(key, wrapped_document)
             except Exception as e:
+                # the message will be received again and its document issued in another batch
                 logger.exception(e)
-                return False
+                continue
+            message.delete()
+        logger.info("Batch of %s documents has been issued sucessfully", len(valid_batch))
+        return True
 
-    def receive_messages(self):
+    def receive_messages(self, max_number_of_messages=None, wait_time_seconds=None):
         # logger.debug('receive_messages')
+        max_number_of_messages = min(
+            max_number_of_messages or self.config['Worker']['Polling']['MaxNumberOfMessages'],
+            self.config['Worker']['Polling']['MaxNumberOfMessages']
+        )
+        if wait_time_seconds is None:
+            wait_time_seconds = self.config['Worker']['Polling']['WaitTimeSeconds']
         return self.unprocessed_queue.receive_messages(
-            WaitTimeSeconds=self.config['Worker']['Polling']['WaitTimeSeconds'],
-            MaxNumberOfMessages=self.config['Worker']['Polling']['MaxNumberOfMessages'],
+            WaitTimeSeconds=wait_time_seconds,
+            MaxNumberOfMessages=max_number_of_messages,
             VisibilityTimeout=self.config['Worker']['Polling']['VisibilityTimeout']
         )
 
     def poll(self):
         # logger.debug('poll')
+        if self.config['Worker']['Batch']['MaxDocuments'] > 1:
+            batch = self.receive_batch()
+            if batch:
+                self.process_batch(batch)
+            return
         for message in self.receive_messages():
             if self.process_message(message):
                 logger.debug('message.delete')
@@ -395,6 +615,8 @@ class Worker:
     def start(self):  # pragma: no cover
         polling_interval = self.config['Worker']['Polling']['IntervalSeconds']
         logger.info("Starting the worker with polling_interval %s", polling_interval)
+        if self.config['Worker']['Metrics']['Port']:
+            start_metrics_server(self, self.config['Worker']['Metrics']['Port'])
 
         while True:
             self.poll()
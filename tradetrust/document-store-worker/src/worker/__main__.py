@@ -1,4 +1,7 @@
 from src.worker import Worker  # pragma: no cover
+from src.worker.pipeline import PipelineWorker  # pragma: no cover
 from src.config import Config  # pragma: no cover
 
-Worker(Config.from_environ()).start()  # pragma: no cover
+config = Config.from_environ()  # pragma: no cover
+pipelined = config['Worker']['Pipeline']['MaxPendingTransactions'] > 1  # pragma: no cover
+(PipelineWorker if pipelined else Worker)(config).start()  # pragma: no cover
@@ -0,0 +1,252 @@
+import json
+import threading
+import time
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from src.loggers import logging
+from src.metrics import GAS_PRICE, IN_FLIGHT_TRANSACTIONS, STAGE_DURATION, TRANSACTION_REPLACEMENTS
+from src.worker import Worker, DocumentError, UnderpricedReplacementTransactionException
+
+logger = logging.getLogger('PIPELINE_WORKER')
+
+
+class PendingTransaction:
+
+    def __init__(self, message, key, wrapped_document, nonce, copy_source=False):
+        self.message = message
+        self.key = key
+        self.wrapped_document = wrapped_document
+        self.copy_source = copy_source
+        self.nonce = nonce
+        # replacements share the nonce, so any of them can be mined
+        self.tx_hashes = []
+        self.gas_price = None
+        self.sent_at = None
+        self.first_sent_at = None
+        self.visibility_extended_at = time.time()
+        self.receipt = None
+
+
+class PipelineWorker(Worker):
+    """
+    Broadcasts up to Pipeline.MaxPendingTransactions issue transactions back-to-back
+    using locally managed consecutive nonces. Receipts are checked by a background thread,
+    messages are deleted only after their transaction is confirmed.
+    SQS and S3 are used only by the main thread, boto3 resources aren't thread safe.
+    """
+
+    def __init__(self, config=None):
+        self.lock = threading.RLock()
+        self.stopped = threading.Event()
+        self.receipt_poller = None
+        self.nonce = None
+        self.pending_transactions = {}
+        self.confirmed_transactions = []
+        super().__init__(config)
+
+    def start_receipt_poller(self):
+        if self.receipt_poller is None:
+            logger.debug('start_receipt_poller')
+            self.receipt_poller = threading.Thread(target=self.poll_receipts, name='receipt-poller', daemon=True)
+            self.receipt_poller.start()
+
+    def stop_receipt_poller(self):
+        if self.receipt_poller is not None:
+            logger.debug('stop_receipt_poller')
+            self.stopped.set()
+            self.receipt_poller.join()
+            self.receipt_poller = None
+            self.stopped.clear()
+
+    def poll_receipts(self):
+        interval = self.config['Worker']['Pipeline']['ReceiptPollIntervalSeconds']
+        while not self.stopped.wait(interval):
+            try:
+                self.check_receipts()
+            except Exception as e:
+                logger.exception(e)
+
+    def get_nonce(self):
+        if self.nonce is None:
+            public_key = self.config['DocumentStore']['Owner']['PublicKey']
+            # with nothing in flight pending transactions are treated as stuck and replaced
+            # the same way the sequential worker does it
+            block_identifier = 'pending' if self.pending_transactions else 'latest'
+            self.nonce = self.web3.eth.getTransactionCount(public_key, block_identifier)
+            logger.info('nonce=%s (%s)', self.nonce, block_identifier)
+        return self.nonce
+
+    def send_transaction(self, pending_transaction, gas_price):
+        tx_hash = self.create_issue_document_transaction(
+            pending_transaction.wrapped_document,
+            nonce=pending_transaction.nonce,
+            gas_price=gas_price
+        )
+        pending_transaction.tx_hashes.append(tx_hash)
+        pending_transaction.gas_price = gas_price
+        pending_transaction.sent_at = time.time()
+        pending_transaction.first_sent_at = pending_transaction.first_sent_at or pending_transaction.sent_at
+
+    def broadcast_issue_document_transaction(self, message, key, wrapped_document, copy_source=False):
+        logger.debug('broadcast_issue_document_transaction')
+        with self.lock:
+            pending_transaction = PendingTransaction(
+                message, key, wrapped_document, self.get_nonce(), copy_source=copy_source
+            )
+            try:
+                self.send_transaction(pending_transaction, self.gas_price)
+            except Exception:
+                # the nonce wasn't used, but the local value may be out of sync with the node
+                self.nonce = None
+                raise
+            self.nonce += 1
+            self.pending_transactions[pending_transaction.nonce] = pending_transaction
+            IN_FLIGHT_TRANSACTIONS.set(len(self.pending_transactions))
+
+    def get_transaction_receipt(self, pending_transaction):
+        for tx_hash in pending_transaction.tx_hashes:
+            try:
+                return self.web3.eth.getTransactionReceipt(tx_hash)
+            except TransactionNotFound:
+                pass
+        return None
+
+    def replace_transaction(self, pending_transaction):
+        """
+        Returns the gas price of the replacement sent, None if it wasn't sent
+        """
+        logger.warning(
+            '[%s] nonce:%s transaction timed out, replacing it',
+            Web3.toHex(pending_transaction.tx_hashes[-1]),
+            pending_transaction.nonce
+        )
+        # based on the price of this transaction only, the stuck ones don't raise each other's price
+        gas_price = self.get_replacement_gas_price(pending_transaction.gas_price)
+        try:
+            self.send_transaction(pending_transaction, gas_price)
+        except UnderpricedReplacementTransactionException:
+            logger.warning('Replacement transaction is underpriced, increasing gas price')
+            # the next attempt bumps this price, after the receipt timeout like any other
+            pending_transaction.gas_price = gas_price
+            pending_transaction.sent_at = time.time()
+            return None
+        except Exception as e:
+            logger.exception(e)
+            return None
+        TRANSACTION_REPLACEMENTS.inc()
+        return gas_price
+
+    def replace_transactions(self, pending_transactions):
+        """
+        Replaces the timed out transactions and raises the price of the new ones
+        once per round, up to the highest replacement sent
+        """
+        gas_prices = [self.replace_transaction(pending_transaction) for pending_transaction in pending_transactions]
+        gas_prices = [gas_price for gas_price in gas_prices if gas_price is not None]
+        if not gas_prices:
+            return
+        with self.lock:
+            if self.gas_price is None or max(gas_prices) > self.gas_price:
+                logger.info('Gas price increased. OLD: %s NEW: %s', self.gas_price, max(gas_prices))
+                self.gas_price = max(gas_prices)
+                GAS_PRICE.set(self.gas_price)
+
+    def check_receipts(self):
+        logger.debug('check_receipts')
+        with self.lock:
+            pending_transactions = list(self.pending_transactions.values())
+        timed_out = []
+        for pending_transaction in pending_transactions:
+            receipt = self.get_transaction_receipt(pending_transaction)
+            if receipt is not None:
+                with self.lock:
+                    del self.pending_transactions[pending_transaction.nonce]
+                    pending_transaction.receipt = receipt
+                    self.confirmed_transactions.append(pending_transaction)
+                    IN_FLIGHT_TRANSACTIONS.set(len(self.pending_transactions))
+                STAGE_DURATION.labels('receipt_wait').observe(time.time() - pending_transaction.first_sent_at)
+            elif time.time() - pending_transaction.sent_at > self.config['Blockchain']['ReceiptTimeout']:
+                timed_out.append(pending_transaction)
+        if timed_out:
+            self.replace_transactions(timed_out)
+
+    def process_confirmed_transactions(self):
+        logger.debug('process_confirmed_transactions')
+        with self.lock:
+            confirmed_transactions, self.confirmed_transactions = self.confirmed_transactions, []
+        for pending_transaction in confirmed_transactions:
+            receipt = pending_transaction.receipt
+            if receipt.status != 1:
+                # the message becomes visible again after the VisibilityTimeout and will be retried
+                logger.error('Transaction failed %s', Web3.toJSON(receipt))
+                continue
+            try:
+                self.put_document(
+                    pending_transaction.key,
+                    pending_transaction.wrapped_document,
+                    copy_source=pending_transaction.copy_source
+                )
+            except Exception as e:
+                logger.exception(e)
+                continue
+            logger.debug('message.delete')
+            pending_transaction.message.delete()
+            logger.info("Message has been processed sucessfully")
+            with self.lock:
+                self.transactions_count += 1
+                self.refresh_gas_price()
+
+    def extend_visibility_timeouts(self):
+        logger.debug('extend_visibility_timeouts')
+        visibility_timeout = self.config['Worker']['Polling']['VisibilityTimeout']
+        with self.lock:
+            pending_transactions = list(self.pending_transactions.values())
+        now = time.time()
+        for pending_transaction in pending_transactions:
+            if now - pending_transaction.visibility_extended_at > visibility_timeout / 2:
+                pending_transaction.message.change_visibility(VisibilityTimeout=visibility_timeout)
+                pending_transaction.visibility_extended_at = now
+
+    def process_message(self, message):
+        """
+        Returns True if the message can be deleted right away,
+        messages of broadcasted transactions are deleted once they are confirmed
+        """
+        logger.debug('process_message')
+        event = json.loads(message.body)
+        for record in event['Records']:
+            try:
+                key, document = self.load_unprocessed_document(record)
+                wrapped_document = self.prepare_document(key, document)
+                if wrapped_document is None:
+                    return True
+                self.broadcast_issue_document_transaction(
+                    message, key, wrapped_document, copy_source=wrapped_document is document
+                )
+                return False
+            except DocumentError as e:
+                logger.exception(e)
+                return True
+            except UnderpricedReplacementTransactionException:
+                logger.warn('Replacement transaction is underpriced, increasing gas price')
+                with self.lock:
+                    self.increase_gas_price()
+                return False
+            except Exception as e:
+                logger.exception(e)
+                return False
+
+    def poll(self):
+        # logger.debug('poll')
+        self.start_receipt_poller()
+        self.process_confirmed_transactions()
+        self.extend_visibility_timeouts()
+        free_slots = self.config['Worker']['Pipeline']['MaxPendingTransactions'] - len(self.pending_transactions)
+        if free_slots <= 0:
+            return
+        for message in self.receive_messages(max_number_of_messages=free_slots):
+            if self.process_message(message):
+                logger.debug('message.delete')
+                message.delete()
+                logger.info("Message has been processed sucessfully")
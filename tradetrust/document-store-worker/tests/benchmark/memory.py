@@ -0,0 +1,65 @@
+"""
+Peak memory of storing issued documents with embedded attachments of different sizes:
+the old json.dumps().encode() body against the streamed upload.
+
+    python -m tests.benchmark.memory
+"""
+import base64
+import json
+import os
+import tracemalloc
+from unittest import mock
+
+from src.json_stream import JSONStream
+from src.worker import Worker
+
+SIZES_MB = [1, 10, 50]
+
+
+def create_document(size_mb):
+    data = base64.b64encode(os.urandom(size_mb * 1024 * 1024 * 3 // 4)).decode('ascii')
+    return {
+        'version': 'https://schema.openattestation.com/2.0/schema.json',
+        'data': {
+            'attachments': [
+                {'filename': 'certificate.pdf', 'type': 'application/pdf', 'data': data}
+            ]
+        },
+        'signature': {}
+    }
+
+
+def measure(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def put_body(document):
+    return json.dumps(document).encode('utf-8')
+
+
+def put_stream(document):
+    # reading like a multipart upload does
+    stream = JSONStream(document)
+    while stream.read(Worker.ISSUED_DOCUMENT_MULTIPART_CHUNKSIZE):
+        pass
+
+
+def put_copy(document):
+    worker = mock.Mock(config={'AWS': {'Resources': {'Buckets': {'Unprocessed': 'unprocessed'}}}})
+    Worker.put_document(worker, 'key', document, copy_source=True)
+
+
+def main():
+    print(f"{'size':>6} {'json.dumps':>12} {'stream':>12} {'s3 copy':>12}")
+    for size_mb in SIZES_MB:
+        document = create_document(size_mb)
+        results = [measure(lambda: func(document)) / 1024 / 1024 for func in [put_body, put_stream, put_copy]]
+        print(f'{size_mb:>4}MB ' + ' '.join(f'{result:>10.1f}MB' for result in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import json
 from string import Template
 
 
@@ -7,3 +8,14 @@ with open('/document-store-worker/tests/data/document.v2.json', 'rt') as f:
 
 with open('/document-store-worker/tests/data/document.v3.json', 'rt') as f:
     DOCUMENT_V3_TEMPLATE = Template(f.read())
+
+
+# documents wrapped by the reference OA implementation
+WRAPPED_DOCUMENTS_DIR = '/document-store-worker/tests/data/wrapped'
+VALID_WRAPPED_DOCUMENTS = ['simple-oa.json', 'ropsten-certificate-obfuscated.json']
+INVALID_WRAPPED_DOCUMENTS = ['ropsten-certificate-invalid.json']
+
+
+def load_wrapped_document(filename):
+    with open(f'{WRAPPED_DOCUMENTS_DIR}/{filename}', 'rt') as f:
+        return json.load(f)
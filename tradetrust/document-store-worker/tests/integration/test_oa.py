@@ -0,0 +1,8 @@
+from src import oa
+from tests.data import VALID_WRAPPED_DOCUMENTS, load_wrapped_document
+
+
+def test_native_unwrap_matches_api(unwrap):
+    for filename in VALID_WRAPPED_DOCUMENTS:
+        wrapped_document = load_wrapped_document(filename)
+        assert oa.unwrap_document(wrapped_document) == unwrap(wrapped_document)
@@ -0,0 +1,56 @@
+import os
+import time
+import json
+from unittest import mock
+from src.config import Config
+from src.worker.pipeline import PipelineWorker
+from tests.data import DOCUMENT_V2_TEMPLATE
+
+
+@mock.patch.dict(
+    os.environ,
+    {
+        'WORKER_POLLING_MESSAGE_WAIT_TIME_SECONDS': '1',
+        'WORKER_POLLING_MAX_NUMBER_OF_MESSAGES': '10',
+        'WORKER_PIPELINE_MAX_PENDING_TRANSACTIONS': '5',
+        'WORKER_PIPELINE_RECEIPT_POLL_INTERVAL_SECONDS': '1',
+        'BLOCKCHAIN_GAS_PRICE': 'fast'
+    }
+)
+def test(unprocessed_queue, unprocessed_bucket, issued_bucket, unwrap):
+    config = Config.from_environ()
+    document_store_address = config['DocumentStore']['Address']
+
+    documents = {}
+    for index in range(5):
+        document = DOCUMENT_V2_TEMPLATE.substitute(DocumentStoreAddress=document_store_address)
+        document = json.loads(document)
+        document['id'] = f'PIPELINE_SERIAL_NUMBER_{index}'
+        documents[f'pipeline-document-{index}'] = document
+
+    worker = PipelineWorker(config)
+    try:
+        for key, document in documents.items():
+            unprocessed_bucket.Object(key).put(Body=json.dumps(document))
+
+        issued_keys = set()
+        deadline = time.time() + 60
+        while issued_keys != set(documents) and time.time() < deadline:
+            worker.poll()
+            issued_keys = {obj.key for obj in issued_bucket.objects.all()}
+            time.sleep(1)
+    finally:
+        worker.stop_receipt_poller()
+
+    for key, document in documents.items():
+        issued_document = json.load(issued_bucket.Object(key).get()['Body'])
+        assert unwrap(issued_document) == document
+        assert worker.is_issued_document(issued_document)
+
+    # all messages were deleted only after confirmation
+    assert not worker.pending_transactions
+    assert not unprocessed_queue.receive_messages(
+        WaitTimeSeconds=1,
+        MaxNumberOfMessages=1,
+        VisibilityTimeout=0
+    )
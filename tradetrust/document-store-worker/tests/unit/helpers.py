@@ -0,0 +1,20 @@
+import json
+from unittest import mock
+
+
+def connect_resources(self):
+    """
+    Worker.connect_resources replacement, the AWS resources and the node are mocked
+    """
+    self.web3 = mock.MagicMock()
+    self.unprocessed_queue = mock.MagicMock()
+    self.unprocessed_bucket = mock.MagicMock()
+    self.issued_bucket = mock.MagicMock()
+    self.document_store = mock.MagicMock()
+
+
+def create_message(key):
+    # SQS message of the unprocessed bucket event
+    message = mock.Mock()
+    message.body = json.dumps({'Records': [{'key': key}]})
+    return message
@@ -136,7 +136,8 @@ def test_validate_document_schema(requests):
     version = 'documentversion'
 
     response = mock.MagicMock()
-    requests.post.return_value = response
+    session = requests.Session.return_value
+    session.post.return_value = response
 
     response.status_code = 200
     response.text = 'Error text'
@@ -144,24 +145,24 @@ def test_validate_document_schema(requests):
     wrapped_document = worker.wrap_document(document, version)
     assert wrapped_document == response.json.return_value
     response.json.assert_called_once()
-    requests.post.assert_called_once()
-    requests.reset_mock()
+    session.post.assert_called_once()
+    session.reset_mock()
 
     response.status_code = 400
     response.text = 'Error text'
     with pytest.raises(DocumentError) as einfo:
         worker.wrap_document(document, version)
     assert str(einfo.value) == response.text
-    requests.post.assert_called_once()
-    requests.reset_mock()
+    session.post.assert_called_once()
+    session.reset_mock()
 
     response.status_code = 500
     response.text = 'Internal server error'
     with pytest.raises(RuntimeError) as einfo:
         worker.wrap_document(document, version)
     assert str(einfo.value) == response.text
-    requests.post.assert_called_once()
-    requests.reset_mock()
+    session.post.assert_called_once()
+    session.reset_mock()
 
 
 @mock.patch('src.worker.Web3.toJSON')
@@ -0,0 +1,128 @@
+import json
+from unittest import mock
+from web3.exceptions import TimeExhausted
+from src.config import Config
+from src.oa import combine_hashes, digest_document
+from src.worker import Worker
+from tests.data import DOCUMENT_V2_TEMPLATE, DOCUMENT_V3_TEMPLATE
+from tests.unit.helpers import connect_resources, create_message
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+@mock.patch('src.worker.Worker.put_document')
+@mock.patch('src.worker.Worker.process_document')
+@mock.patch('src.worker.Worker.load_unprocessed_document')
+def test_batch_issue(load_unprocessed_document, process_document, put_document):
+    config = Config.from_environ()
+    config['Blockchain']['GasPrice'] = 20
+    config['Worker']['Batch']['MaxDocuments'] = 3
+    config['Worker']['Batch']['MaxWaitSeconds'] = 5
+    config['Worker']['Polling']['MaxNumberOfMessages'] = 10
+
+    v2_document = json.loads(DOCUMENT_V2_TEMPLATE.substitute(DocumentStoreAddress=config['DocumentStore']['Address']))
+    v3_document = json.loads(DOCUMENT_V3_TEMPLATE.substitute(DocumentStoreAddress=config['DocumentStore']['Address']))
+    documents = {
+        'v2-1': v2_document,
+        'v2-2': v2_document,
+        'v3': v3_document,
+        'v2-3': v2_document
+    }
+    load_unprocessed_document.side_effect = lambda record: (record['key'], documents[record['key']])
+    process_document.return_value = True
+    messages = [create_message(key) for key in documents]
+
+    worker = Worker(config)
+    worker.unprocessed_queue.receive_messages.side_effect = [messages[:2], messages[2:]]
+    worker.web3.eth.sendRawTransaction.return_value = b'transaction-hash'
+    worker.web3.eth.waitForTransactionReceipt().status = 1
+
+    transactions_count = worker.transactions_count
+    worker.poll()
+
+    # a second receive asks only for the missing documents
+    assert worker.unprocessed_queue.receive_messages.call_args_list[0][1]['MaxNumberOfMessages'] == 3
+    assert worker.unprocessed_queue.receive_messages.call_args_list[1][1]['MaxNumberOfMessages'] == 1
+    # v3 document is not batchable and is processed separately
+    process_document.assert_called_once_with('v3', v3_document)
+    # single transaction for the whole batch
+    worker.document_store.functions.issue.assert_called_once()
+    assert worker.transactions_count == transactions_count + 1
+    for message in messages:
+        message.delete.assert_called_once()
+
+    wrapped_documents = [call[0][1] for call in put_document.call_args_list]
+    assert [call[0][0] for call in put_document.call_args_list] == ['v2-1', 'v2-2', 'v2-3']
+    merkle_root = wrapped_documents[0]['signature']['merkleRoot']
+    worker.document_store.functions.issue.assert_called_once_with(merkle_root)
+    for wrapped_document in wrapped_documents:
+        signature = wrapped_document['signature']
+        assert signature['merkleRoot'] == merkle_root
+        assert signature['targetHash'] == digest_document(wrapped_document)
+        computed = signature['targetHash']
+        for proof_hash in signature['proof']:
+            computed = combine_hashes(computed, proof_hash)
+        assert computed == merkle_root
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+@mock.patch('src.worker.Worker.put_document')
+@mock.patch('src.worker.Worker.load_unprocessed_document')
+def test_batch_transaction_timeout(load_unprocessed_document, put_document):
+    config = Config.from_environ()
+    config['Blockchain']['GasPrice'] = 20
+    config['Worker']['Batch']['MaxDocuments'] = 2
+    config['Worker']['Polling']['MaxNumberOfMessages'] = 10
+
+    document = json.loads(DOCUMENT_V2_TEMPLATE.substitute(DocumentStoreAddress=config['DocumentStore']['Address']))
+    load_unprocessed_document.side_effect = lambda record: (record['key'], document)
+    messages = [create_message('first'), create_message('second')]
+
+    worker = Worker(config)
+    worker.unprocessed_queue.receive_messages.return_value = messages
+    worker.web3.eth.sendRawTransaction.return_value = b'transaction-hash'
+    worker.web3.eth.waitForTransactionReceipt.side_effect = TimeExhausted
+
+    transactions_count = worker.transactions_count
+    worker.poll()
+
+    put_document.assert_not_called()
+    assert worker.gas_price == 23
+    assert worker.transactions_count == transactions_count
+    for message in messages:
+        message.delete.assert_not_called()
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+@mock.patch('src.worker.time')
+def test_batch_receive_wait(time_mock):
+    clock = [1000.0]
+    time_mock.time.side_effect = lambda: clock[0]
+
+    def sleep(seconds):
+        clock[0] += seconds
+
+    time_mock.sleep.side_effect = sleep
+    config = Config.from_environ()
+    config['Worker']['Batch']['MaxDocuments'] = 2
+    config['Worker']['Batch']['MaxWaitSeconds'] = 3
+    config['Worker']['Polling']['WaitTimeSeconds'] = 0
+
+    worker = Worker(config)
+    worker.unprocessed_queue.receive_messages.return_value = []
+    assert worker.receive_batch() == []
+    # the empty short polling receives are paused
+    assert worker.unprocessed_queue.receive_messages.call_count == 3
+    assert time_mock.sleep.call_count == 3
+
+    # long polling is capped by the time left
+    config['Worker']['Polling']['WaitTimeSeconds'] = 20
+
+    def receive_messages(WaitTimeSeconds, **kwargs):
+        clock[0] += WaitTimeSeconds
+        return []
+
+    worker.unprocessed_queue.receive_messages.reset_mock()
+    worker.unprocessed_queue.receive_messages.side_effect = receive_messages
+    assert worker.receive_batch() == []
+    assert worker.unprocessed_queue.receive_messages.call_args_list[0][1]['WaitTimeSeconds'] == 3
+    assert worker.unprocessed_queue.receive_messages.call_count == 1
@@ -0,0 +1,71 @@
+import time
+from unittest import mock
+import pytest
+import requests
+from src.config import Config
+from src.worker import Worker, DocumentError
+from tests.unit.helpers import connect_resources
+
+
+def slow(return_value=None, side_effect=None, delay=0.5):
+    def func(*args, **kwargs):
+        time.sleep(delay)
+        if side_effect:
+            raise side_effect
+        return return_value
+    return mock.Mock(side_effect=func)
+
+
+WRAPPED_DOCUMENT = {'data': {}, 'signature': {'merkleRoot': 'root'}}
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+def test_open_attestation_session():
+    worker = Worker(Config.from_environ())
+    assert isinstance(worker.open_attestation_session, requests.Session)
+    adapter = worker.open_attestation_session.get_adapter('http://open-attestation-api')
+    assert adapter._pool_maxsize == Worker.OPEN_ATTESTATION_POOL_MAX_SIZE
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+@mock.patch('src.worker.Worker.get_document_version', mock.Mock(return_value='version'))
+@mock.patch('src.worker.Worker.verify_document_store_address', mock.Mock())
+@mock.patch('src.worker.Worker.put_document')
+def test_wrapped_document_checks_run_concurrently(put_document):
+    worker = Worker(Config.from_environ())
+
+    with mock.patch.multiple(
+        worker,
+        unwrap_document=slow(return_value={'unwrapped': True}),
+        verify_document_signature=slow(),
+        is_issued_document=slow(return_value=True)
+    ):
+        started_at = time.time()
+        assert worker.prepare_document('key', WRAPPED_DOCUMENT) is None
+        assert time.time() - started_at < 1
+        worker.unwrap_document.assert_called_once_with(WRAPPED_DOCUMENT, 'version')
+        worker.verify_document_signature.assert_called_once_with(WRAPPED_DOCUMENT)
+        worker.is_issued_document.assert_called_once_with(WRAPPED_DOCUMENT)
+        put_document.assert_called_once_with('key', WRAPPED_DOCUMENT, copy_source=True)
+    put_document.reset_mock()
+
+    # not issued document is returned to be issued
+    with mock.patch.multiple(
+        worker,
+        unwrap_document=slow(return_value={'unwrapped': True}),
+        verify_document_signature=slow(),
+        is_issued_document=slow(return_value=False)
+    ):
+        assert worker.prepare_document('key', WRAPPED_DOCUMENT) == WRAPPED_DOCUMENT
+        put_document.assert_not_called()
+
+    # invalid signature error is raised even if the document is issued
+    with mock.patch.multiple(
+        worker,
+        unwrap_document=slow(return_value={'unwrapped': True}),
+        verify_document_signature=slow(side_effect=DocumentError('Document signature is invalid')),
+        is_issued_document=slow(return_value=True)
+    ):
+        with pytest.raises(DocumentError):
+            worker.prepare_document('key', WRAPPED_DOCUMENT)
+        put_document.assert_not_called()
@@ -0,0 +1,97 @@
+from unittest import mock
+from src.config import Config
+from src.gas_price import GasPriceOracle, get_minimal_replacement_gas_price, get_percentile
+from src.worker import Worker
+from tests.unit.helpers import connect_resources
+
+
+def create_web3(blocks):
+    web3 = mock.MagicMock()
+    web3.eth.blockNumber = len(blocks) - 1
+    web3.eth.gasPrice = 7
+    web3.eth.getBlock.side_effect = lambda number, full_transactions: {
+        'transactions': [{'gasPrice': gas_price} for gas_price in blocks[number]]
+    }
+    return web3
+
+
+def test_percentile():
+    assert get_percentile([1], 60) == 1
+    assert get_percentile([1, 2, 3, 4, 5], 0) == 1
+    assert get_percentile([1, 2, 3, 4, 5], 60) == 3
+    assert get_percentile([1, 2, 3, 4, 5], 61) == 4
+    assert get_percentile([1, 2, 3, 4, 5], 100) == 5
+
+
+def test_minimal_replacement_gas_price():
+    assert get_minimal_replacement_gas_price(100) == 113
+    assert get_minimal_replacement_gas_price(111) == 125
+    # float multiplication would give 1000000000000000100 * 1.125 == 1125000000000000128
+    assert get_minimal_replacement_gas_price(1000000000000000100) == 1125000000000000113
+
+
+def test_oracle_update():
+    blocks = [[100], [10, 20], [30, 40, 50], [], [60]]
+    web3 = create_web3(blocks)
+    oracle = GasPriceOracle(web3, percentile=50, blocks=3)
+
+    # 30, 40, 50, 60
+    assert oracle.update() == 40
+    assert oracle.get_gas_price() == 40
+    assert [call[0][0] for call in web3.eth.getBlock.call_args_list] == [2, 3, 4]
+
+    # only new blocks are fetched, old ones are dropped
+    blocks.append([1, 2, 3])
+    web3.eth.blockNumber = len(blocks) - 1
+    web3.eth.getBlock.reset_mock()
+    # 60, 1, 2, 3
+    assert oracle.update() == 2
+    assert [call[0][0] for call in web3.eth.getBlock.call_args_list] == [5]
+    assert list(oracle.blocks_gas_prices) == [3, 4, 5]
+
+    # no transactions in the window
+    blocks.extend([[], [], []])
+    web3.eth.blockNumber = len(blocks) - 1
+    assert oracle.update() == web3.eth.gasPrice
+
+
+def test_oracle_replacement_gas_price():
+    oracle = GasPriceOracle(create_web3([[100]]))
+    oracle.update()
+    # recommendation is higher than the minimal bump
+    assert oracle.get_replacement_gas_price(50) == 100
+    # minimal bump accepted by the node, reached in one step
+    assert oracle.get_replacement_gas_price(100) == 113
+
+
+def test_oracle_thread():
+    web3 = create_web3([[10], [20]])
+    oracle = GasPriceOracle(web3, refresh_interval=0.01)
+    oracle.start()
+    try:
+        # the first recommendation is available right after start
+        assert oracle.get_gas_price() == 20
+    finally:
+        oracle.stop()
+    assert oracle.thread is None
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+@mock.patch('src.worker.GasPriceOracle.start', mock.Mock())
+def test_worker_oracle_strategy():
+    config = Config.from_environ()
+    config['Blockchain']['GasPrice'] = 'oracle'
+
+    with mock.patch('src.worker.GasPriceOracle.get_gas_price', return_value=100):
+        worker = Worker(config)
+        assert worker.gas_price == 100
+        # cached value is used, no blocks scanning on the issuing path
+        worker.update_gas_price()
+        worker.web3.eth.generateGasPrice.assert_not_called()
+        worker.web3.eth.setGasPriceStrategy.assert_not_called()
+
+        worker.gas_price = 50
+        worker.increase_gas_price()
+        assert worker.gas_price == 100
+        worker.increase_gas_price()
+        assert worker.gas_price == 113
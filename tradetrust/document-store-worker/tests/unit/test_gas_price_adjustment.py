@@ -6,14 +6,7 @@ from src.config import Config
 from src.worker import Worker
 from src.worker import fast_gas_price_strategy, medium_gas_price_strategy
 from tests.data import DOCUMENT_V2_TEMPLATE
-
-
-def connect_resources(self):
-    self.web3 = mock.MagicMock()
-    self.unprocessed_queue = mock.MagicMock()
-    self.unprocessed_bucket = mock.MagicMock()
-    self.issued_bucket = mock.MagicMock()
-    self.document_store = mock.MagicMock()
+from tests.unit.helpers import connect_resources
 
 
 @mock.patch('src.worker.Worker.connect_resources', connect_resources)
@@ -80,7 +73,7 @@ def test_gas_price_update(load_unprocessed_document, generate_gas_price):
     worker.web3.eth.waitForTransactionReceipt.side_effect = TimeExhausted
     assert not worker.process_message(message)
     generate_gas_price.assert_not_called()
-    assert worker.gas_price == int(gas_price * 1.1)
+    assert worker.gas_price == gas_price * 1125 // 1000 + 1
 
     # testing gas price refresh
     generate_gas_price.reset_mock()
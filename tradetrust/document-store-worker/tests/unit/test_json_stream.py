@@ -0,0 +1,66 @@
+import io
+import json
+from unittest import mock
+from src.config import Config
+from src.json_stream import JSONStream
+from src.worker import Worker
+from tests.unit.helpers import connect_resources
+
+
+DOCUMENT = {
+    'string': 'value',
+    'unicode': 'значение 値   "quoted" \\',
+    'numbers': [1, 1.5, -3, 1e+21],
+    'flags': [True, False, None],
+    'nested': {'empty': {}, 'list': []},
+    'attachment': 'QUJD' * 100000,
+    'long unicode': 'значение "値" \\ 😀' * 20000
+}
+
+
+def test_json_stream():
+    small_document = {key: value for key, value in DOCUMENT.items() if len(value) < 1000}
+    stream = JSONStream(small_document)
+    assert b''.join(iter(lambda: stream.read(1), b'')) == json.dumps(small_document).encode('utf-8')
+
+    expected = json.dumps(DOCUMENT).encode('utf-8')
+    for read_size in [7, 1024, 1024 * 1024]:
+        stream = JSONStream(DOCUMENT)
+        chunks = []
+        while True:
+            chunk = stream.read(read_size)
+            if not chunk:
+                break
+            assert len(chunk) <= read_size
+            chunks.append(chunk)
+        assert b''.join(chunks) == expected
+    assert JSONStream(DOCUMENT).read() == expected
+    assert io.BufferedReader(JSONStream(DOCUMENT)).read() == expected
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+def test_put_document():
+    config = Config.from_environ()
+    worker = Worker(config)
+
+    uploaded = []
+    issued_object = worker.issued_bucket.Object.return_value
+    issued_object.upload_fileobj.side_effect = lambda fileobj, Config: uploaded.append(fileobj.read())
+    worker.put_document('key', DOCUMENT)
+    worker.issued_bucket.Object.assert_called_once_with('key')
+    assert json.loads(uploaded[0]) == DOCUMENT
+    transfer_config = issued_object.upload_fileobj.call_args[1]['Config']
+    assert transfer_config.multipart_threshold == Worker.ISSUED_DOCUMENT_MULTIPART_CHUNKSIZE
+    assert transfer_config.multipart_chunksize == Worker.ISSUED_DOCUMENT_MULTIPART_CHUNKSIZE
+    issued_object.copy_from.assert_not_called()
+
+    # unchanged documents are copied by S3 itself
+    issued_object.reset_mock()
+    worker.put_document('key', DOCUMENT, copy_source=True)
+    issued_object.copy_from.assert_called_once_with(
+        CopySource={
+            'Bucket': config['AWS']['Resources']['Buckets']['Unprocessed'],
+            'Key': 'key'
+        }
+    )
+    issued_object.upload_fileobj.assert_not_called()
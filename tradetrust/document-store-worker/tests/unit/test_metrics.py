@@ -0,0 +1,73 @@
+from unittest import mock
+from prometheus_client import REGISTRY, CollectorRegistry, generate_latest
+from src.config import Config
+from src.gas_price import get_minimal_replacement_gas_price
+from src.metrics import WorkerCollector
+from src.worker import Worker
+from tests.unit.helpers import connect_resources
+
+
+def get_sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+def test_worker_metrics():
+    config = Config.from_environ()
+    config['Blockchain']['GasPrice'] = 100
+    worker = Worker(config)
+    assert get_sample('document_store_worker_gas_price_wei') == 100
+
+    replacements = get_sample('document_store_worker_transaction_replacements_total')
+    worker.increase_gas_price()
+    assert get_sample('document_store_worker_gas_price_wei') == get_minimal_replacement_gas_price(100)
+    assert get_sample('document_store_worker_transaction_replacements_total') == replacements + 1
+
+    s3_put_count = get_sample('document_store_worker_stage_duration_seconds_count', {'stage': 's3_put'})
+    worker.put_document('key', {}, copy_source=True)
+    assert get_sample('document_store_worker_stage_duration_seconds_count', {'stage': 's3_put'}) == s3_put_count + 1
+
+    # in-flight transaction is counted while waiting for its receipt
+    in_flight = []
+
+    def wait_for_transaction_receipt(tx_hash):
+        in_flight.append(get_sample('document_store_worker_in_flight_transactions'))
+        return mock.Mock(status=1)
+
+    with mock.patch.multiple(
+        worker,
+        create_issue_document_transaction=mock.Mock(),
+        wait_for_transaction_receipt=wait_for_transaction_receipt
+    ):
+        worker.issue_document({})
+    assert in_flight == [1]
+    assert get_sample('document_store_worker_in_flight_transactions') == 0
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+@mock.patch('src.metrics.boto3')
+def test_worker_collector(boto3):
+    worker = Worker(Config.from_environ())
+    boto3.client().get_queue_attributes.return_value = {
+        'Attributes': {
+            'ApproximateNumberOfMessages': '12',
+            'ApproximateNumberOfMessagesNotVisible': '3'
+        }
+    }
+    worker.web3.eth.getTransactionCount.side_effect = (
+        lambda address, block_identifier: {'latest': 10, 'pending': 14}[block_identifier]
+    )
+    worker.web3.fromWei.return_value = 1.5
+
+    registry = CollectorRegistry()
+    registry.register(WorkerCollector(worker))
+    assert registry.get_sample_value('document_store_worker_queue_depth', {'state': 'visible'}) == 12
+    assert registry.get_sample_value('document_store_worker_queue_depth', {'state': 'in_flight'}) == 3
+    assert registry.get_sample_value('document_store_worker_nonce_gap') == 4
+    assert registry.get_sample_value('document_store_worker_wallet_balance_ether') == 1.5
+
+    # node errors don't break the endpoint
+    worker.web3.eth.getTransactionCount.side_effect = ConnectionError
+    output = generate_latest(registry).decode()
+    assert 'document_store_worker_queue_depth' in output
+    assert 'document_store_worker_nonce_gap' not in output
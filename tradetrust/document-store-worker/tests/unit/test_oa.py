@@ -0,0 +1,95 @@
+import copy
+from unittest import mock
+import pytest
+from src import oa
+from src.config import Config
+from src.worker import Worker, DocumentError, OPEN_ATTESTATION_VERSION_ID_V2_FRAMEWORK
+from tests.data import VALID_WRAPPED_DOCUMENTS, INVALID_WRAPPED_DOCUMENTS, load_wrapped_document
+from tests.unit.helpers import connect_resources
+
+
+@pytest.mark.parametrize('filename', VALID_WRAPPED_DOCUMENTS)
+def test_verify_signature_valid(filename):
+    wrapped_document = load_wrapped_document(filename)
+    assert oa.verify_signature(wrapped_document)
+
+    # any change of data, salts or signature breaks it
+    tampered = copy.deepcopy(wrapped_document)
+    tampered['data']['$template']['name'] = tampered['data']['$template']['name'] + 'x'
+    assert not oa.verify_signature(tampered)
+
+    tampered = copy.deepcopy(wrapped_document)
+    tampered['data']['$template']['name'] = '00000000-0000-0000-0000-000000000000:string:main'
+    assert not oa.verify_signature(tampered)
+
+    tampered = copy.deepcopy(wrapped_document)
+    tampered['signature']['merkleRoot'] = '0' * 64
+    assert not oa.verify_signature(tampered)
+
+    tampered = copy.deepcopy(wrapped_document)
+    tampered['signature']['proof'] = ['0' * 64]
+    assert not oa.verify_signature(tampered)
+
+    tampered = copy.deepcopy(wrapped_document)
+    tampered['signature']['type'] = 'Unknown'
+    assert not oa.verify_signature(tampered)
+
+    tampered = copy.deepcopy(wrapped_document)
+    del tampered['signature']['targetHash']
+    assert not oa.verify_signature(tampered)
+
+
+@pytest.mark.parametrize('filename', INVALID_WRAPPED_DOCUMENTS)
+def test_verify_signature_invalid(filename):
+    assert not oa.verify_signature(load_wrapped_document(filename))
+
+
+def test_verify_signature_batch():
+    documents = [{'name': f'document {i}'} for i in range(5)]
+    for wrapped_document in oa.wrap_documents(documents):
+        assert wrapped_document['signature']['proof']
+        assert oa.verify_signature(wrapped_document)
+
+
+@pytest.mark.parametrize('filename', VALID_WRAPPED_DOCUMENTS)
+def test_unwrap_document(filename):
+    wrapped_document = load_wrapped_document(filename)
+    document = oa.unwrap_document(wrapped_document)
+    # wrapping the document back using the original salts must give the same data
+    salts = iter(value[:oa.UUIDV4_LENGTH] for value in oa.flatten(wrapped_document['data']).values())
+    assert oa.salt_data(document, salt_factory=lambda: next(salts)) == wrapped_document['data']
+
+
+def test_unwrap_values():
+    document = {
+        'string': 'value:with:colons',
+        'integer': 3,
+        'float': 1.5,
+        'true': True,
+        'false': False,
+        'null': None,
+        'list': ['a', 2],
+        'empty': {}
+    }
+    assert oa.unwrap_document(oa.wrap_documents([document])[0]) == document
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+def test_worker_native_v2():
+    worker = Worker(Config.from_environ())
+    worker.open_attestation_session = mock.MagicMock()
+
+    wrapped_document = load_wrapped_document(VALID_WRAPPED_DOCUMENTS[0])
+    worker.verify_document_signature(wrapped_document)
+    assert worker.unwrap_document(wrapped_document, OPEN_ATTESTATION_VERSION_ID_V2_FRAMEWORK)['$template'] == {
+        'name': 'main',
+        'type': 'EMBEDDED_RENDERER',
+        'url': 'https://tutorial-renderer.openattestation.com'
+    }
+
+    with pytest.raises(DocumentError) as einfo:
+        worker.verify_document_signature(load_wrapped_document(INVALID_WRAPPED_DOCUMENTS[0]))
+    assert str(einfo.value) == 'Document signature is invalid'
+
+    # no API calls for v2 documents
+    worker.open_attestation_session.post.assert_not_called()
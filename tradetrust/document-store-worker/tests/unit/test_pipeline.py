@@ -0,0 +1,188 @@
+import json
+import time
+from unittest import mock
+from prometheus_client import REGISTRY
+from web3.exceptions import TransactionNotFound
+from src.config import Config
+from src.gas_price import get_minimal_replacement_gas_price
+from src.worker.pipeline import PipelineWorker
+from tests.data import DOCUMENT_V2_TEMPLATE
+from tests.unit.helpers import connect_resources, create_message
+
+
+def wrap_document(self, document, version):
+    return {'data': document, 'signature': {'merkleRoot': document['key']}}
+
+
+class Chain:
+    """
+    Minimal node stand-in: transactions are mined only when asked to
+    """
+
+    def __init__(self, nonce):
+        self.nonce = nonce
+        self.transactions = []
+        self.mined = set()
+
+    def send(self, raw_transaction):
+        tx_hash = len(self.transactions).to_bytes(32, 'big')
+        self.transactions.append(tx_hash)
+        return tx_hash
+
+    def mine(self, *tx_hashes):
+        self.mined.update(tx_hashes)
+
+    def receipt(self, tx_hash):
+        if tx_hash not in self.mined:
+            raise TransactionNotFound()
+        return mock.Mock(status=1)
+
+
+def create_worker(config, chain):
+    worker = PipelineWorker(config)
+    worker.web3.eth.getTransactionCount.return_value = chain.nonce
+    worker.web3.eth.sendRawTransaction.side_effect = chain.send
+    worker.web3.eth.getTransactionReceipt.side_effect = chain.receipt
+    # the receipt poller is driven by the test
+    worker.receipt_poller = mock.Mock()
+    return worker
+
+
+def get_transactions(worker):
+    return [call[0][0] for call in worker.document_store.functions.issue().buildTransaction.call_args_list]
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+@mock.patch('src.worker.Worker.wrap_document', wrap_document)
+@mock.patch('src.worker.Worker.put_document')
+@mock.patch('src.worker.Worker.load_unprocessed_document')
+def test_pipeline(load_unprocessed_document, put_document):
+    config = Config.from_environ()
+    config['Blockchain']['GasPrice'] = 20
+    config['Worker']['Pipeline']['MaxPendingTransactions'] = 3
+    config['Worker']['Polling']['MaxNumberOfMessages'] = 10
+
+    document = json.loads(DOCUMENT_V2_TEMPLATE.substitute(DocumentStoreAddress=config['DocumentStore']['Address']))
+    load_unprocessed_document.side_effect = lambda record: (record['key'], dict(document, key=record['key']))
+    messages = [create_message(f'document-{i}') for i in range(4)]
+
+    chain = Chain(nonce=5)
+    worker = create_worker(config, chain)
+    worker.unprocessed_queue.receive_messages.side_effect = [messages[:3], messages[3:]]
+
+    # transactions are sent back-to-back with consecutive nonces without waiting for receipts
+    worker.poll()
+    assert worker.unprocessed_queue.receive_messages.call_args[1]['MaxNumberOfMessages'] == 3
+    assert [tx['nonce'] for tx in get_transactions(worker)] == [5, 6, 7]
+    worker.web3.eth.getTransactionCount.assert_called_once()
+    worker.web3.eth.waitForTransactionReceipt.assert_not_called()
+
+    # pipeline is full
+    worker.poll()
+    assert worker.unprocessed_queue.receive_messages.call_count == 1
+
+    # messages are deleted only after their transactions are confirmed
+    chain.mine(chain.transactions[0], chain.transactions[2])
+    worker.check_receipts()
+    for message in messages:
+        message.delete.assert_not_called()
+    worker.poll()
+    assert [call[0][0] for call in put_document.call_args_list] == ['document-0', 'document-2']
+    messages[0].delete.assert_called_once()
+    messages[1].delete.assert_not_called()
+    messages[2].delete.assert_called_once()
+
+    # freed slots are filled using the local nonce
+    assert worker.unprocessed_queue.receive_messages.call_args[1]['MaxNumberOfMessages'] == 2
+    assert [tx['nonce'] for tx in get_transactions(worker)] == [5, 6, 7, 8]
+    worker.web3.eth.getTransactionCount.assert_called_once()
+    assert sorted(worker.pending_transactions) == [6, 8]
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+@mock.patch('src.worker.Worker.wrap_document', wrap_document)
+@mock.patch('src.worker.Worker.put_document')
+@mock.patch('src.worker.Worker.load_unprocessed_document')
+def test_pipeline_replacement_and_visibility(load_unprocessed_document, put_document):
+    config = Config.from_environ()
+    config['Blockchain']['GasPrice'] = 100
+    config['Blockchain']['ReceiptTimeout'] = 60
+    config['Worker']['Pipeline']['MaxPendingTransactions'] = 2
+    visibility_timeout = config['Worker']['Polling']['VisibilityTimeout']
+
+    document = json.loads(DOCUMENT_V2_TEMPLATE.substitute(DocumentStoreAddress=config['DocumentStore']['Address']))
+    load_unprocessed_document.side_effect = lambda record: (record['key'], dict(document, key=record['key']))
+    message = create_message('document')
+
+    chain = Chain(nonce=0)
+    worker = create_worker(config, chain)
+    worker.unprocessed_queue.receive_messages.side_effect = [[message], [], [], []]
+    worker.poll()
+
+    # visibility of in-flight message is extended
+    pending_transaction = worker.pending_transactions[0]
+    pending_transaction.visibility_extended_at = time.time() - visibility_timeout
+    worker.poll()
+    message.change_visibility.assert_called_once_with(VisibilityTimeout=visibility_timeout)
+
+    # timed out transaction is replaced with the same nonce and a higher gas price
+    pending_transaction.sent_at = time.time() - config['Blockchain']['ReceiptTimeout'] - 1
+    worker.check_receipts()
+    transactions = get_transactions(worker)
+    assert [tx['nonce'] for tx in transactions] == [0, 0]
+    assert transactions[1]['gasPrice'] >= transactions[0]['gasPrice'] * 110 // 100
+
+    # original transaction mined instead of the replacement is accepted too
+    chain.mine(chain.transactions[0])
+    worker.check_receipts()
+    worker.poll()
+    put_document.assert_called_once_with('document', pending_transaction.wrapped_document, copy_source=False)
+    message.delete.assert_called_once()
+    assert not worker.pending_transactions
+
+
+@mock.patch('src.worker.Worker.connect_resources', connect_resources)
+@mock.patch('src.worker.Worker.wrap_document', wrap_document)
+@mock.patch('src.worker.Worker.load_unprocessed_document')
+def test_pipeline_replacements_round(load_unprocessed_document):
+    config = Config.from_environ()
+    config['Blockchain']['GasPrice'] = 100
+    config['Blockchain']['ReceiptTimeout'] = 60
+    config['Worker']['Pipeline']['MaxPendingTransactions'] = 5
+    config['Worker']['Polling']['MaxNumberOfMessages'] = 10
+
+    document = json.loads(DOCUMENT_V2_TEMPLATE.substitute(DocumentStoreAddress=config['DocumentStore']['Address']))
+    load_unprocessed_document.side_effect = lambda record: (record['key'], dict(document, key=record['key']))
+
+    worker = create_worker(config, Chain(nonce=0))
+    worker.unprocessed_queue.receive_messages.return_value = [create_message(f'document-{i}') for i in range(5)]
+    worker.poll()
+
+    def get_replacements():
+        return REGISTRY.get_sample_value('document_store_worker_transaction_replacements_total') or 0
+
+    # the stuck transactions are replaced at the same price, the shared one is raised once
+    replacements = get_replacements()
+    for pending_transaction in worker.pending_transactions.values():
+        pending_transaction.sent_at = time.time() - config['Blockchain']['ReceiptTimeout'] - 1
+    worker.check_receipts()
+    expected_gas_price = get_minimal_replacement_gas_price(100)
+    assert [tx['gasPrice'] for tx in get_transactions(worker)[5:]] == [expected_gas_price] * 5
+    assert worker.gas_price == expected_gas_price
+    assert get_replacements() == replacements + 5
+
+    # nothing is sent: neither the price nor the replacements count change,
+    # the underpriced replacement waits for the receipt timeout again
+    pending_transaction = worker.pending_transactions[0]
+    worker.web3.eth.sendRawTransaction.side_effect = ValueError({'message': 'replacement transaction underpriced'})
+    pending_transaction.sent_at = time.time() - config['Blockchain']['ReceiptTimeout'] - 1
+    worker.check_receipts()
+    assert time.time() - pending_transaction.sent_at < config['Blockchain']['ReceiptTimeout']
+    assert worker.gas_price == expected_gas_price
+    assert get_replacements() == replacements + 5
+
+    worker.web3.eth.sendRawTransaction.side_effect = ConnectionError()
+    pending_transaction.sent_at = time.time() - config['Blockchain']['ReceiptTimeout'] - 1
+    worker.check_receipts()
+    assert worker.gas_price == expected_gas_price
+    assert get_replacements() == replacements + 5
@@ -4,117 +4,69 @@ from web3 import Web3
 
 cloudwatch = boto3.client('cloudwatch', endpoint_url=os.environ.get('AWS_ENDPOINT_URL'))
 
+_web3 = None
 
-def account_balance(event, context):
-    HTTP_BLOCKCHAIN_ENDPOINT = os.environ['HTTP_BLOCKCHAIN_ENDPOINT']
-    DIMENSION_VALUE = ACCOUNT_ADDRESS = os.environ['ACCOUNT_ADDRESS']
-    DIMENSION_NAME = 'Address Id'
-    METRIC_NAME = 'Balance'
-    METRIC_NAMESPACE = 'Ethereum/Wallet'
 
-    web3 = Web3(Web3.HTTPProvider(HTTP_BLOCKCHAIN_ENDPOINT))
+def get_web3():
+    # created by the first invocation and reused by the warm ones
+    global _web3
+    if _web3 is None:
+        _web3 = Web3(Web3.HTTPProvider(os.environ['HTTP_BLOCKCHAIN_ENDPOINT']))
+    return _web3
 
-    balance = web3.fromWei(web3.eth.getBalance(ACCOUNT_ADDRESS), 'ether')
 
-    cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
-        MetricData=[
-            {
-                'MetricName': METRIC_NAME,
-                'Dimensions': [
-                    {
-                        'Name': DIMENSION_NAME,
-                        'Value': DIMENSION_VALUE
-                    }
-                ],
-                'Value': balance
-            }
-        ]
-    )
-    return {'Balance': float(balance)}
+def get_balance(web3, address):
+    return float(web3.fromWei(web3.eth.getBalance(address), 'ether'))
 
 
-def account_pending_transactions(event, context):
-    HTTP_BLOCKCHAIN_ENDPOINT = os.environ['HTTP_BLOCKCHAIN_ENDPOINT']
-    DIMENSION_VALUE = ACCOUNT_ADDRESS = os.environ['ACCOUNT_ADDRESS']
-    DIMENSION_NAME = 'Address Id'
-    METRIC_NAME = 'PendingTransactions'
-    METRIC_NAMESPACE = 'Ethereum/Wallet'
+def get_pending_transactions(web3, address):
+    confirmed_transactions = web3.eth.getTransactionCount(address, block_identifier='latest')
+    all_transactions = web3.eth.getTransactionCount(address, block_identifier='pending')
+    # nonce gap, transactions sent but not mined yet
+    return all_transactions - confirmed_transactions
 
-    web3 = Web3(Web3.HTTPProvider(HTTP_BLOCKCHAIN_ENDPOINT))
-    confirmed_transactions = web3.eth.getTransactionCount(ACCOUNT_ADDRESS, block_identifier='latest')
-    all_transactions = web3.eth.getTransactionCount(ACCOUNT_ADDRESS, block_identifier='pending')
-    pending_transactions = all_transactions - confirmed_transactions
 
+def put_metric(namespace, name, dimension_name, dimension_value, value):
     cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
+        Namespace=namespace,
         MetricData=[
             {
-                'MetricName': METRIC_NAME,
+                'MetricName': name,
                 'Dimensions': [
                     {
-                        'Name': DIMENSION_NAME,
-                        'Value': DIMENSION_VALUE
+                        'Name': dimension_name,
+                        'Value': dimension_value
                     }
                 ],
-                'Value': pending_transactions
+                'Value': value
             }
         ]
     )
-    return {'PendingTransactions': pending_transactions}
 
 
-def ethereum_node_chain_id(event, context):
-    DIMENSION_VALUE = HTTP_BLOCKCHAIN_ENDPOINT = os.environ['HTTP_BLOCKCHAIN_ENDPOINT']
-    DIMENSION_NAME = 'Api Endpoint Hostname'
-    METRIC_NAME = 'ChainId'
-    METRIC_NAMESPACE = 'Ethereum/Node'
+def account_balance(event, context):
+    ACCOUNT_ADDRESS = os.environ['ACCOUNT_ADDRESS']
+    balance = get_balance(get_web3(), ACCOUNT_ADDRESS)
+    put_metric('Ethereum/Wallet', 'Balance', 'Address Id', ACCOUNT_ADDRESS, balance)
+    return {'Balance': balance}
 
-    web3 = Web3(Web3.HTTPProvider(HTTP_BLOCKCHAIN_ENDPOINT))
 
-    chain_id = web3.eth.chainId
+def account_pending_transactions(event, context):
+    ACCOUNT_ADDRESS = os.environ['ACCOUNT_ADDRESS']
+    pending_transactions = get_pending_transactions(get_web3(), ACCOUNT_ADDRESS)
+    put_metric('Ethereum/Wallet', 'PendingTransactions', 'Address Id', ACCOUNT_ADDRESS, pending_transactions)
+    return {'PendingTransactions': pending_transactions}
 
-    cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
-        MetricData=[
-            {
-                'MetricName': METRIC_NAME,
-                'Dimensions': [
-                    {
-                        'Name': DIMENSION_NAME,
-                        'Value': DIMENSION_VALUE
-                    }
-                ],
-                'Value': chain_id
-            }
-        ]
-    )
+
+def ethereum_node_chain_id(event, context):
+    chain_id = get_web3().eth.chainId
+    put_metric('Ethereum/Node', 'ChainId', 'Api Endpoint Hostname', os.environ['HTTP_BLOCKCHAIN_ENDPOINT'], chain_id)
     return {'ChainId': chain_id}
 
 
 def ethereum_node_network_id(event, context):
-    DIMENSION_VALUE = HTTP_BLOCKCHAIN_ENDPOINT = os.environ['HTTP_BLOCKCHAIN_ENDPOINT']
-    DIMENSION_NAME = 'Api Endpoint Hostname'
-    METRIC_NAME = 'NetworkId'
-    METRIC_NAMESPACE = 'Ethereum/Node'
-
-    web3 = Web3(Web3.HTTPProvider(HTTP_BLOCKCHAIN_ENDPOINT))
-
-    network_id = int(web3.net.version)
-
-    cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
-        MetricData=[
-            {
-                'MetricName': METRIC_NAME,
-                'Dimensions': [
-                    {
-                        'Name': DIMENSION_NAME,
-                        'Value': DIMENSION_VALUE
-                    }
-                ],
-                'Value': network_id
-            }
-        ]
+    network_id = int(get_web3().net.version)
+    put_metric(
+        'Ethereum/Node', 'NetworkId', 'Api Endpoint Hostname', os.environ['HTTP_BLOCKCHAIN_ENDPOINT'], network_id
     )
     return {'NetworkId': network_id}